@@ -0,0 +1,363 @@
+"""Benchmarks de carga del servicio con inventarios sintéticos.
+
+Para cada tamaño se genera (o reutiliza) un inventario sintético y se
+arranca el servicio en un proceso aparte apuntando a esos datos. Las
+peticiones van directo a la aplicación ASGI, sin red, y se reporta p50,
+p95 y p99 de la latencia y peticiones por segundo de cada endpoint y de
+cada intención de la IA, además del tiempo de arranque y la memoria (RSS).
+Los resultados se guardan en JSON para compararlos entre commits:
+
+    python -m benchmarks --tamanos 1000,100000,1000000
+    python -m benchmarks --tamanos 1000 --comparar benchmarks/resultados/base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO_BENCHMARKS = os.path.join(RAIZ, 'benchmarks')
+MARCA_RESULTADO = 'RESULTADO_BENCHMARK '
+# Umbral a partir del cual la comparación marca un escenario como regresión
+UMBRAL_REGRESION = 1.10
+
+
+@dataclass
+class Escenario:
+    nombre: str
+    metodo: str
+    # Recibe el número de la iteración y retorna (url, cuerpo JSON o None)
+    peticion: Callable[[int], Tuple[str, Optional[dict]]]
+    pesado: bool = False
+    cabeceras: Dict[str, str] = field(default_factory=dict)
+    # Se ejecuta antes de cada petición, fuera de la medición
+    antes: Optional[Callable[[], None]] = None
+
+
+def _rss_mb() -> Optional[float]:
+    """Memoria residente actual del proceso, en MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return _rss_pico_mb()
+
+
+def _rss_pico_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB y macOS en bytes
+    return pico / 2 ** 20 if sys.platform == 'darwin' else pico / 2 ** 10
+
+
+def _escenarios(df, rng) -> List[Escenario]:
+    from benchmarks.sinteticos import DETALLES, PRODUCTOS
+    from service.cache_consultas import cache_consultas
+
+    codigos = df['código'].to_numpy()
+    categorias = sorted(df['categoría'].dropna().unique().tolist())
+    terminos = [t.lower() for t in PRODUCTOS + DETALLES if len(t) > 2]
+
+    def codigo(_):
+        return int(codigos[rng.integers(0, len(codigos))])
+
+    def rango(_):
+        minimo = int(rng.integers(1, 50)) * 1000
+        return minimo, minimo + 5000
+
+    def sin_letra(termino, i):
+        posicion = i % len(termino)
+        return termino[:posicion] + termino[posicion + 1:]
+
+    ia = cache_consultas.limpiar
+
+    def pregunta(texto):
+        return lambda i: ('/ia/consultar', {'pregunta': texto(i) if callable(texto) else texto})
+
+    return [
+        Escenario('raiz', 'GET', lambda i: ('/', None)),
+        Escenario('inventario_listar', 'GET', lambda i: ('/inventario/', None), pesado=True),
+        Escenario('inventario_listar_gzip', 'GET', lambda i: ('/inventario/', None), pesado=True,
+                  cabeceras={'Accept-Encoding': 'gzip'}),
+        Escenario('inventario_pagina', 'GET', lambda i: (f'/inventario/pagina?limite=100&cursor={codigo(i)}:0', None)),
+        Escenario('inventario_pagina_campos', 'GET', lambda i: (
+            f'/inventario/pagina?limite=100&cursor={codigo(i)}:0&campos=código,descripción,precio_neto', None)),
+        Escenario('inventario_stream', 'GET', lambda i: ('/inventario/stream?formato=ndjson&lote=1000', None), pesado=True),
+        Escenario('inventario_export_csv', 'GET', lambda i: ('/inventario/export?formato=csv', None), pesado=True),
+        Escenario('inventario_export_ndjson', 'GET', lambda i: (
+            f'/inventario/export?formato=ndjson&campos=código,descripción,precio_neto&categoria={categorias[i % len(categorias)]}', None),
+            pesado=True),
+        Escenario('inventario_codigo', 'GET', lambda i: (f'/inventario/codigo/{codigo(i)}', None)),
+        Escenario('inventario_codigos', 'POST', lambda i: ('/inventario/codigos', {'codigos': [codigo(i) for _ in range(100)]})),
+        Escenario('inventario_nombre', 'GET', lambda i: (f'/inventario/nombre/{terminos[i % len(terminos)]}', None), pesado=True),
+        Escenario('inventario_categoria', 'GET', lambda i: (f'/inventario/categoria/{categorias[i % len(categorias)]}', None), pesado=True),
+        Escenario('inventario_precio', 'GET', lambda i: ('/inventario/precio?min={}&max={}&limite=100'.format(*rango(i)), None)),
+        Escenario('inventario_estadisticas', 'GET', lambda i: ('/inventario/estadisticas', None)),
+        Escenario('inventario_buscar', 'GET', lambda i: (
+            '/inventario/buscar?categoria={}&precio_min={}&precio_max={}&stock_min=1&ordenar_por=precio&orden=desc&limite=50'.format(
+                categorias[i % len(categorias)], *rango(i)), None)),
+        Escenario('inventario_buscar_texto', 'POST', lambda i: ('/inventario/buscar', {
+            'texto': terminos[i % len(terminos)], 'categoria': categorias[i % len(categorias)],
+            'campos': ['código', 'descripción', 'precio_neto'], 'limite': 50})),
+        Escenario('inventario_buscar_relevancia', 'GET', lambda i: (
+            # Dos palabras, la primera con una letra de menos
+            '/inventario/buscar?modo=relevancia&limite=20&texto={} {}'.format(
+                sin_letra(terminos[i % len(terminos)], i), terminos[(i * 7 + 3) % len(terminos)]), None)),
+        Escenario('imagen_listar', 'GET', lambda i: ('/imagen/', None), pesado=True),
+        Escenario('imagen_pagina', 'GET', lambda i: (f'/imagen/pagina?limite=100&cursor={codigo(i)}:0', None)),
+        Escenario('imagen_codigo', 'GET', lambda i: (f'/imagen/codigo/{codigo(i)}', None)),
+        Escenario('imagen_codigos', 'POST', lambda i: ('/imagen/codigos', {'codigos': [codigo(i) for _ in range(100)]})),
+        Escenario('productos_pagina', 'GET', lambda i: (f'/productos/?limite=100&cursor={codigo(i)}:0', None)),
+        Escenario('productos_codigo', 'GET', lambda i: (f'/productos/{codigo(i)}', None)),
+        # Intenciones de la IA: la caché se vacía antes de cada petición para medir el cálculo
+        Escenario('ia_contar', 'POST', pregunta('¿Cuántos productos hay en el inventario?'), antes=ia),
+        Escenario('ia_contar_categoria', 'POST', pregunta(lambda i: f'¿Cuántos productos de {categorias[i % len(categorias)]} hay?'), antes=ia),
+        Escenario('ia_buscar_categoria', 'POST', pregunta(lambda i: f'Dame productos de {categorias[i % len(categorias)]}'), pesado=True, antes=ia),
+        Escenario('ia_buscar_nombre', 'POST', pregunta(lambda i: f'Busca {terminos[i % len(terminos)]}'), pesado=True, antes=ia),
+        Escenario('ia_precio', 'POST', pregunta('¿Cuál es el producto más caro?'), antes=ia),
+        Escenario('ia_precio_top', 'POST', pregunta('Muestra los 10 productos más baratos'), antes=ia),
+        Escenario('ia_categorias', 'POST', pregunta('¿Qué categorías tengo disponibles?'), antes=ia),
+        Escenario('ia_estadisticas', 'POST', pregunta('¿Cuál es el precio promedio?'), antes=ia),
+        Escenario('ia_filtrar', 'POST', pregunta(lambda i: 'Muestra productos entre {} y {}'.format(*rango(i))), antes=ia),
+        Escenario('ia_cache', 'POST', pregunta('¿Cuál es el producto más caro?')),
+        Escenario('ia_ejemplos', 'GET', lambda i: ('/ia/ejemplos', None)),
+        Escenario('metricas', 'GET', lambda i: ('/metrics', None)),
+    ]
+
+
+def _resumen(latencias: List[float], duracion_total: float, estados: Dict[int, int], primera: float) -> Dict:
+    import numpy as np
+
+    ms = np.array(latencias) * 1000
+    return {
+        'peticiones': len(latencias),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'media_ms': round(float(ms.mean()), 4),
+        'max_ms': round(float(ms.max()), 4),
+        'primera_ms': round(primera * 1000, 4),
+        'req_s': round(len(latencias) / duracion_total, 2) if duracion_total > 0 else None,
+        'estados': {str(e): c for e, c in sorted(estados.items())},
+    }
+
+
+async def _medir(cliente, escenario: Escenario, repeticiones: int, concurrencia: int) -> Dict:
+    async def una(i: int) -> Tuple[float, int]:
+        if escenario.antes is not None:
+            escenario.antes()
+        url, cuerpo = escenario.peticion(i)
+        inicio = time.perf_counter()
+        respuesta = await cliente.request(escenario.metodo, url, json=cuerpo, headers=escenario.cabeceras)
+        await respuesta.aread()
+        return time.perf_counter() - inicio, respuesta.status_code
+
+    # La primera petición puede construir estructuras perezosas (uniones, respuestas en caché); se reporta aparte
+    primera, _ = await una(0)
+
+    latencias: List[float] = []
+    estados: Dict[int, int] = {}
+    siguiente = iter(range(1, repeticiones + 1))
+
+    async def trabajador():
+        for i in siguiente:
+            latencia, estado = await una(i)
+            latencias.append(latencia)
+            estados[estado] = estados.get(estado, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    return _resumen(latencias, time.perf_counter() - inicio, estados, primera)
+
+
+async def _ejecutar_escenarios(app, args) -> Dict[str, Dict]:
+    import httpx
+    import numpy as np
+
+    from service.inventario_service import InventarioService
+
+    rng = np.random.default_rng(args.semilla)
+    escenarios = _escenarios(InventarioService().df, rng)
+    if args.escenarios:
+        elegidos = set(args.escenarios.split(','))
+        escenarios = [e for e in escenarios if e.nombre in elegidos]
+
+    resultados = {}
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url='http://benchmark') as cliente:
+        for escenario in escenarios:
+            repeticiones = args.repeticiones_pesadas if escenario.pesado else args.repeticiones
+            resultados[escenario.nombre] = await _medir(cliente, escenario, repeticiones, args.concurrencia)
+            r = resultados[escenario.nombre]
+            print(f"  {escenario.nombre:<26} p50 {r['p50_ms']:>10.3f} ms  p99 {r['p99_ms']:>10.3f} ms  {r['req_s'] or 0:>10.1f} req/s",
+                  file=sys.stderr)
+    return resultados
+
+
+def _hijo(args):
+    """Arranca el servicio sobre los datos sintéticos y, salvo en modo frío, corre los escenarios"""
+    inicio = time.perf_counter()
+    from main import app
+    from service.snapshot_service import registro
+
+    # Importar la aplicación ya no carga datos: es lo que tarda en poder escuchar
+    importacion = time.perf_counter() - inicio
+    registro.iniciar_calentamiento().join()
+    for snapshot in (registro.obtener(clave) for clave in registro.claves()):
+        if snapshot.df is None:
+            raise RuntimeError(snapshot.error)
+    resultado = {
+        'importacion_segundos': round(importacion, 4),
+        'arranque_segundos': round(time.perf_counter() - inicio, 4),
+        'rss_arranque_mb': _rss_mb(),
+    }
+
+    if not args.frio:
+        resultado['escenarios'] = asyncio.run(_ejecutar_escenarios(app, args))
+        resultado['rss_final_mb'] = _rss_mb()
+    resultado['rss_pico_mb'] = _rss_pico_mb()
+    print(MARCA_RESULTADO + json.dumps(resultado))
+
+
+def _lanzar_hijo(args, filas: int, directorio: str, frio: bool) -> Dict:
+    comando = [
+        sys.executable, '-m', 'benchmarks', '--hijo', '--filas', str(filas),
+        '--repeticiones', str(args.repeticiones),
+        '--repeticiones-pesadas', str(args.repeticiones_pesadas),
+        '--concurrencia', str(args.concurrencia),
+        '--semilla', str(args.semilla),
+    ]
+    if args.escenarios:
+        comando += ['--escenarios', args.escenarios]
+    if frio:
+        comando.append('--frio')
+    entorno = {**os.environ, 'VITALIX_DATOS': directorio, 'INVENTARIO_RECARGA_SEGUNDOS': '0',
+               'PYTHONPATH': RAIZ + os.pathsep + os.environ.get('PYTHONPATH', '')}
+    proceso = subprocess.run(comando, cwd=RAIZ, env=entorno, stdout=subprocess.PIPE, text=True)
+    if proceso.returncode != 0:
+        raise RuntimeError(f"El benchmark de {filas} filas terminó con código {proceso.returncode}")
+    for linea in reversed(proceso.stdout.splitlines()):
+        if linea.startswith(MARCA_RESULTADO):
+            return json.loads(linea[len(MARCA_RESULTADO):])
+    raise RuntimeError(f"El benchmark de {filas} filas no reportó resultados")
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _comparar(base: Dict, nuevo: Dict):
+    """Imprime p50 y p99 de cada escenario frente a una corrida anterior y marca las regresiones"""
+    print(f"\nComparación con {base.get('commit')} ({base.get('fecha')}):")
+    for tamano, actual in nuevo['resultados'].items():
+        anterior = base.get('resultados', {}).get(tamano)
+        if not anterior:
+            continue
+        print(f"\n{tamano} filas  (arranque {anterior.get('arranque_segundos')} s -> {actual.get('arranque_segundos')} s)")
+        for nombre, r in actual.get('escenarios', {}).items():
+            a = anterior.get('escenarios', {}).get(nombre)
+            if not a:
+                continue
+            partes = []
+            regresion = False
+            for metrica in ('p50_ms', 'p99_ms'):
+                proporcion = r[metrica] / a[metrica] if a[metrica] else float('inf')
+                regresion |= proporcion > UMBRAL_REGRESION
+                partes.append(f"{metrica} {a[metrica]:.3f} -> {r[metrica]:.3f} (x{proporcion:.2f})")
+            print(f"  {'!' if regresion else ' '} {nombre:<26} " + '  '.join(partes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de carga con inventarios sintéticos")
+    parser.add_argument('--tamanos', default='1000,100000,1000000', help="filas de cada inventario, separadas por coma")
+    parser.add_argument('--repeticiones', type=int, default=200, help="peticiones por escenario")
+    parser.add_argument('--repeticiones-pesadas', type=int, default=5,
+                        help="peticiones por escenario en los que devuelven buena parte del inventario")
+    parser.add_argument('--concurrencia', type=int, default=1, help="peticiones simultáneas por escenario")
+    parser.add_argument('--escenarios', help="solo estos escenarios, separados por coma")
+    parser.add_argument('--semilla', type=int, default=7)
+    parser.add_argument('--parseo-hasta', type=int, default=100000,
+                        help="mide también el arranque parseando el Excel hasta este número de filas")
+    parser.add_argument('--datos', default=os.path.join(DIRECTORIO_BENCHMARKS, 'datos'),
+                        help="carpeta donde se guardan los inventarios sintéticos")
+    parser.add_argument('--salida', help="archivo JSON de resultados (por defecto, en benchmarks/resultados)")
+    parser.add_argument('--comparar', help="JSON de una corrida anterior contra el cual comparar")
+    parser.add_argument('--hijo', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--frio', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--filas', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.hijo:
+        _hijo(args)
+        return
+
+    from benchmarks.sinteticos import preparar
+    from service.cache_columnar import ruta_puntero
+
+    reporte = {
+        'fecha': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'parametros': {
+            'repeticiones': args.repeticiones,
+            'repeticiones_pesadas': args.repeticiones_pesadas,
+            'concurrencia': args.concurrencia,
+            'semilla': args.semilla,
+        },
+        'resultados': {},
+    }
+
+    for filas in (int(t) for t in args.tamanos.split(',')):
+        directorio = os.path.join(args.datos, str(filas))
+        rutas = preparar(directorio, filas, args.semilla)
+        print(f"{filas} filas:", file=sys.stderr)
+        resultado = {}
+
+        if filas <= args.parseo_hasta:
+            # Arranque en frío: sin segmento publicado, parsea los Excel y publica uno nuevo
+            for ruta in rutas.values():
+                if os.path.exists(ruta_puntero(ruta)):
+                    os.remove(ruta_puntero(ruta))
+            frio = _lanzar_hijo(args, filas, directorio, frio=True)
+            resultado['arranque_excel_segundos'] = frio['arranque_segundos']
+            resultado['rss_arranque_excel_mb'] = frio['rss_arranque_mb']
+            print(f"  arranque desde Excel {frio['arranque_segundos']:.3f} s", file=sys.stderr)
+
+        resultado.update(_lanzar_hijo(args, filas, directorio, frio=False))
+        print(f"  arranque desde segmento {resultado['arranque_segundos']:.3f} s, "
+              f"RSS {resultado['rss_arranque_mb'] or 0:.0f} MB -> {resultado.get('rss_final_mb') or 0:.0f} MB",
+              file=sys.stderr)
+        reporte['resultados'][str(filas)] = resultado
+
+    salida = args.salida
+    if salida is None:
+        fecha = datetime.now().strftime('%Y%m%d-%H%M%S')
+        salida = os.path.join(DIRECTORIO_BENCHMARKS, 'resultados', f"{fecha}-{reporte['commit'] or 'sin-commit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump(reporte, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {salida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as f:
+            _comparar(json.load(f), reporte)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Inventarios sintéticos para los benchmarks.
+
+Genera, con una semilla fija, un Excel con las mismas columnas que
+`inventario_vitalix_plus.xlsx` y otro con la forma de `imagen.xlsx`, y
+publica su segmento columnar ya normalizado para que el servicio pueda
+arrancar sin parsear el Excel. Los datos de cada tamaño se reutilizan
+mientras no cambie la semilla.
+"""
+import json
+import os
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from service.cache_columnar import guardar_cache, huella_codigo, leer_cache
+from service.imagen_service import _indices_compartidos as _indices_imagenes, _normalizar_imagenes
+from service.inventario_service import _indices_compartidos as _indices_inventario, _normalizar_inventario
+
+ARCHIVO_INVENTARIO = 'inventario_vitalix_plus.xlsx'
+ARCHIVO_IMAGENES = 'imagen.xlsx'
+
+CATEGORIAS = (
+    'Otros', 'Cuidado Capilar', 'Insumos Médicos', 'Medicamento', 'Cuidado Piel',
+    'Higiene', 'Cosmético', 'Maquillaje', 'Perfumería', 'Salud Sexual',
+    'Vitaminas', 'Proteínas', 'Suplementos',
+)
+# Proporciones parecidas a las del Excel real: casi todo cae en "Otros"
+PESOS_CATEGORIAS = (0.60, 0.10, 0.04, 0.04, 0.04, 0.03, 0.03, 0.03, 0.02, 0.01, 0.03, 0.02, 0.01)
+
+PRODUCTOS = (
+    'ACEITE', 'SHAMPOO', 'CREMA', 'ACONDICIONADOR', 'JABON', 'GEL', 'VITAMINA', 'PROTEINA',
+    'TALCO', 'ALCOHOL', 'GASA', 'JERINGA', 'LOCION', 'SERUM', 'TINTE', 'DESODORANTE',
+    'ACETAMINOFEN', 'IBUPROFENO', 'COLAGENO', 'OMEGA', 'MAGNESIO', 'CALCIO', 'BASE', 'LABIAL',
+)
+DETALLES = (
+    'ARGAN', 'ALMENDRAS', 'COCO', 'SAVITAL', 'LEHIT', 'KERATINA', 'SABILA', 'ROMERO',
+    'HIDRATANTE', 'REPARADOR', 'ANTICASPA', 'FRUTAL', 'NEUTRO', 'INFANTIL', 'C', 'D3', 'E',
+)
+PRESENTACIONES = ('X 12 GR.', 'X 22 ML', '100 ML', '500 ML', 'SOBRES', 'X 30 TAB', 'FCO X 50ML', 'X 1000 MG')
+
+
+def _descripciones(rng: np.random.Generator, filas: int) -> np.ndarray:
+    productos = np.array(PRODUCTOS, dtype=object)[rng.integers(0, len(PRODUCTOS), filas)]
+    detalles = np.array(DETALLES, dtype=object)[rng.integers(0, len(DETALLES), filas)]
+    presentaciones = np.array(PRESENTACIONES, dtype=object)[rng.integers(0, len(PRESENTACIONES), filas)]
+    return productos + ' ' + detalles + ' ' + presentaciones
+
+
+def generar_inventario(filas: int, semilla: int = 7) -> pd.DataFrame:
+    """Hoja del inventario con los encabezados del Excel original"""
+    rng = np.random.default_rng(semilla)
+
+    # Códigos de 5 y 6 dígitos; alrededor del 1 % se repite, como en el Excel real
+    codigos = rng.permutation(np.arange(10000, 10000 + filas * 2))[:filas]
+    repetidos = rng.random(filas) < 0.01
+    codigos[repetidos] = codigos[rng.integers(0, filas, int(repetidos.sum()))]
+
+    stock = rng.integers(0, 200, filas)
+    stock[rng.random(filas) < 0.1] = 0
+    costo = np.round(rng.lognormal(mean=9.0, sigma=1.0, size=filas), -1)
+    margen = rng.uniform(1.2, 2.5, filas)
+    precio_neto = np.round(costo * margen, -2)
+    precio_neto[rng.random(filas) < 0.02] = 0
+    iva = np.where(rng.random(filas) < 0.6, 19, 0)
+
+    return pd.DataFrame({
+        'Código': codigos,
+        'Descripción': _descripciones(rng, filas),
+        'S. Ent': stock,
+        'S. Fracc': rng.integers(0, 3, filas),
+        '1%': rng.integers(0, 100, filas),
+        '2%': rng.integers(0, 100, filas),
+        '3%': rng.integers(0, 100, filas),
+        'Costo': costo,
+        'Total C. Compra': costo * stock,
+        '% Iva C': iva,
+        'Utilidad': np.round((precio_neto - costo) * stock, 2),
+        'Precio Neto': precio_neto,
+        'Total Precio': precio_neto * stock,
+        'Categoría': np.array(CATEGORIAS, dtype=object)[rng.choice(len(CATEGORIAS), filas, p=PESOS_CATEGORIAS)],
+    })
+
+
+def generar_imagenes(inventario: pd.DataFrame, semilla: int = 7) -> pd.DataFrame:
+    """Hoja de imágenes: el 60 % de los productos tiene entre una y tres imágenes"""
+    rng = np.random.default_rng(semilla + 1)
+    codigos = inventario['Código'].to_numpy()
+    con_imagen = codigos[rng.random(len(codigos)) < 0.6]
+    cantidades = rng.integers(1, 4, len(con_imagen))
+    codigos_imagen = np.repeat(con_imagen, cantidades)
+    ids = np.arange(1, len(codigos_imagen) + 1)
+    urls = np.char.add(np.char.add('https://cdn.ejemplo.com/productos/', ids.astype(str)), '.jpg').astype(object)
+    return pd.DataFrame({'id_imagen': ids, 'Código': codigos_imagen, 'URL': urls})
+
+
+def preparar(directorio: str, filas: int, semilla: int = 7) -> Dict[str, str]:
+    """Deja en el directorio los dos Excel y sus segmentos columnares; retorna las rutas de los Excel"""
+    os.makedirs(directorio, exist_ok=True)
+    rutas = {
+        'inventario': os.path.join(directorio, ARCHIVO_INVENTARIO),
+        'imagenes': os.path.join(directorio, ARCHIVO_IMAGENES),
+    }
+    marca = os.path.join(directorio, 'generado.json')
+    descripcion = {'filas': filas, 'semilla': semilla}
+
+    vigente = False
+    if os.path.exists(marca):
+        with open(marca, encoding='utf-8') as f:
+            vigente = json.load(f) == descripcion and all(os.path.exists(r) for r in rutas.values())
+
+    huellas = {
+        'inventario': huella_codigo(_normalizar_inventario, _indices_inventario),
+        'imagenes': huella_codigo(_normalizar_imagenes, _indices_imagenes),
+    }
+    if vigente and all(leer_cache(r, huellas[nombre]) is not None for nombre, r in rutas.items()):
+        return rutas
+
+    inventario = generar_inventario(filas, semilla)
+    imagenes = generar_imagenes(inventario, semilla)
+    if not vigente:
+        print(f"Generando Excel sintéticos de {filas} filas en {directorio}...")
+        inventario.to_excel(rutas['inventario'], index=False)
+        imagenes.to_excel(rutas['imagenes'], index=False)
+        with open(marca, 'w', encoding='utf-8') as f:
+            json.dump(descripcion, f)
+
+    # El segmento se arma desde el DataFrame generado, pasando por la misma normalización
+    # que el cargador, para no tener que parsear Excel de un millón de filas
+    guardar_cache(rutas['inventario'], _normalizar_inventario(inventario), _indices_inventario, huellas['inventario'])
+    guardar_cache(rutas['imagenes'], _normalizar_imagenes(imagenes), _indices_imagenes, huellas['imagenes'])
+    return rutas
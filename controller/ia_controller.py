@@ -1,5 +1,9 @@
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, validator
+from controller.respuestas import respuesta_cacheada, respuesta_json
+from service.cache_consultas import cache_consultas
+from service.cache_respuestas import cache_respuestas
 from service.ia_service import IAService
 
 router = APIRouter(prefix="/ia", tags=["IA Asistente"])
@@ -9,6 +13,7 @@ ia_service = IAService()
 
 class ConsultaRequest(BaseModel):
     pregunta: str
+    campos: Optional[List[str]] = None
 
     @validator('pregunta')
     def validar_pregunta(cls, v):
@@ -21,7 +26,8 @@ class ConsultaRequest(BaseModel):
     class Config:
         json_schema_extra = {
             "example": {
-                "pregunta": "¿Cuántos productos hay en el inventario?"
+                "pregunta": "¿Cuántos productos hay en el inventario?",
+                "campos": ["código", "descripción", "precio_neto"]
             }
         }
 
@@ -38,10 +44,12 @@ def consultar_ia(request: ConsultaRequest):
     - ¿Qué categorías tengo?
     - Muestra productos entre 10000 y 50000
     - ¿Cuál es el precio promedio?
+
+    Con `campos`, los productos de la respuesta traen solo esas columnas.
     """
     try:
-        resultado = ia_service.procesar_consulta(request.pregunta)
-        return resultado
+        resultado = ia_service.procesar_consulta(request.pregunta, request.campos)
+        return respuesta_json(resultado)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except RuntimeError as e:
@@ -50,9 +58,19 @@ def consultar_ia(request: ConsultaRequest):
         raise HTTPException(status_code=500, detail=f"Error al procesar la consulta: {str(e)}")
 
 
+@router.get("/cache")
+def estadisticas_cache():
+    """Contadores de la caché de respuestas de la IA (aciertos, fallos, desalojos...)"""
+    return cache_consultas.estadisticas()
+
+
 @router.get("/ejemplos")
-def obtener_ejemplos():
+def obtener_ejemplos(request: Request):
     """Retorna ejemplos de preguntas que la IA puede responder"""
+    return respuesta_cacheada(request, cache_respuestas.obtener(("ia", "ejemplos"), _ejemplos))
+
+
+def _ejemplos():
     return {
         "ejemplos": [
             "¿Cuántos productos hay en el inventario?",
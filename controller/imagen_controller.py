@@ -1,28 +1,109 @@
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, validator
+from controller.respuestas import lista_parametro, respuesta_cacheada, respuesta_json
+from service.cache_respuestas import cache_respuestas
+from service.exportacion import TIPOS_CONTENIDO, cabeceras_descarga
 from service.imagen_service import ImagenService
+from service.snapshot_service import registro
 
 router = APIRouter(prefix="/imagen", tags=["imagen"])
 
+
+class CodigosRequest(BaseModel):
+    codigos: List[int]
+    campos: Optional[List[str]] = None
+
+    @validator('codigos')
+    def validar_codigos(cls, v):
+        if not v:
+            raise ValueError('Debe enviar al menos un código')
+        if len(v) > 1000:
+            raise ValueError('No se pueden consultar más de 1000 códigos a la vez')
+        return v
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "codigos": [54040, 55655, 55429]
+            }
+        }
+
+
 servicio = ImagenService()
 
 @router.get("/")
-def listar():
-    """Lista todas las imágenes"""
+def listar(request: Request, campos: Optional[str] = None):
+    """Lista todas las imágenes. `campos` limita las columnas, separadas por comas"""
+    try:
+        # La clave y el cuerpo salen del mismo snapshot aunque se publique otro entre medio
+        with registro.vista_consistente():
+            version = servicio.snapshot.version
+            proyeccion = servicio.validar_campos(lista_parametro(campos))
+            clave = ("imagen", "listar", proyeccion, version)
+            return respuesta_cacheada(request, cache_respuestas.obtener(clave, lambda: servicio.listar_todo(proyeccion)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/pagina")
+def listar_pagina(cursor: Optional[str] = None, limite: int = Query(100, ge=1, le=1000), campos: Optional[str] = None):
+    """Lista imágenes por páginas, en orden de código"""
+    try:
+        return respuesta_json(servicio.listar_pagina(cursor, limite, lista_parametro(campos)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/stream")
+def listar_stream(formato: str = "ndjson", lote: int = Query(1000, ge=1, le=10000), campos: Optional[str] = None):
+    """Descarga imágenes en streaming (NDJSON o arreglo JSON), lote a lote"""
+    try:
+        contenido = servicio.listar_stream(formato, lote, lista_parametro(campos))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    media_type = "application/x-ndjson" if formato == "ndjson" else "application/json"
+    return StreamingResponse(contenido, media_type=media_type)
+
+@router.get("/export")
+def exportar(
+    formato: str = "csv",
+    campos: Optional[str] = None,
+    categoria: Optional[str] = None,
+    lote: int = Query(10000, ge=1, le=100000),
+):
+    """Exporta las imágenes en streaming como CSV, NDJSON, Arrow o Parquet. `categoria` filtra por la categoría del producto"""
     try:
-        return servicio.listar_todo()
+        contenido = servicio.exportar(formato, lista_parametro(campos), lista_parametro(categoria), lote)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    return StreamingResponse(contenido, media_type=TIPOS_CONTENIDO[formato], headers=cabeceras_descarga("imagenes", formato))
 
 @router.get("/{item_id}")
-def buscar_por_id(item_id: int):
+def buscar_por_id(item_id: int, campos: Optional[str] = None):
     """Busca una imagen por código"""
     try:
-        resultado = servicio.buscar_por_id(item_id)
+        resultado = servicio.buscar_por_id(item_id, lista_parametro(campos))
         if not resultado:
             raise HTTPException(status_code=404, detail=f"No se encontró ninguna imagen con el código {item_id}")
-        return resultado
+        return respuesta_json(resultado)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except KeyError as e:
@@ -33,3 +114,18 @@ def buscar_por_id(item_id: int):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@router.post("/codigos")
+def buscar_por_ids(request: CodigosRequest):
+    """Busca varias imágenes por código en una sola petición. Los códigos no encontrados se reportan en 'faltantes'"""
+    try:
+        return respuesta_json(servicio.buscar_por_ids(request.codigos, request.campos))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -1,29 +1,244 @@
 
-from fastapi import APIRouter, HTTPException
+from typing import Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, validator
+from controller.respuestas import lista_parametro, respuesta_cacheada, respuesta_json
+from service.cache_respuestas import cache_respuestas
+from service.exportacion import TIPOS_CONTENIDO, cabeceras_descarga
+from service.actualizaciones import Actualizacion
+from service.consultas import Consulta
 from service.inventario_service import InventarioService
+from service.snapshot_service import registro
 
 router = APIRouter(prefix="/inventario", tags=["Inventario"])
 
+
+class CodigosRequest(BaseModel):
+    codigos: List[int]
+    campos: Optional[List[str]] = None
+
+    @validator('codigos')
+    def validar_codigos(cls, v):
+        if not v:
+            raise ValueError('Debe enviar al menos un código')
+        if len(v) > 1000:
+            raise ValueError('No se pueden consultar más de 1000 códigos a la vez')
+        return v
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "codigos": [54040, 55655, 55429]
+            }
+        }
+
+
+class ActualizacionRequest(BaseModel):
+    valores: Dict[str, float] = {}
+    ajustes: Dict[str, float] = {}
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "valores": {"precio_neto": 2700},
+                "ajustes": {"s._ent": -2}
+            }
+        }
+
+
+class ActualizacionCodigo(ActualizacionRequest):
+    codigo: int
+
+
+class ActualizacionesRequest(BaseModel):
+    actualizaciones: List[ActualizacionCodigo]
+
+    @validator('actualizaciones')
+    def validar_actualizaciones(cls, v):
+        if not v:
+            raise ValueError('Debe enviar al menos una actualización')
+        if len(v) > 1000:
+            raise ValueError('No se pueden actualizar más de 1000 códigos a la vez')
+        return v
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "actualizaciones": [
+                    {"codigo": 54040, "ajustes": {"s._ent": -1}},
+                    {"codigo": 55655, "valores": {"s._ent": 24, "precio_neto": 18500}}
+                ]
+            }
+        }
+
+
+class BusquedaRequest(BaseModel):
+    categoria: Optional[str] = None
+    texto: Optional[str] = None
+    precio_min: Optional[float] = None
+    precio_max: Optional[float] = None
+    stock_min: Optional[float] = None
+    stock_max: Optional[float] = None
+    ordenar_por: Optional[str] = None
+    orden: str = "asc"
+    campos: Optional[List[str]] = None
+    limite: Optional[int] = None
+    modo: str = "literal"
+
+    @validator('limite')
+    def validar_limite(cls, v):
+        if v is not None and not 1 <= v <= 1000:
+            raise ValueError('El límite debe estar entre 1 y 1000')
+        return v
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "categoria": "suplementos",
+                "precio_min": 10000,
+                "precio_max": 50000,
+                "stock_min": 1,
+                "ordenar_por": "precio",
+                "orden": "desc",
+                "campos": ["código", "descripción", "precio_neto"],
+                "limite": 20
+            }
+        }
+
+
 servicio = InventarioService()
 
 @router.get("/")
-def listar():
-    """Lista todos los productos del inventario"""
+def listar(request: Request, campos: Optional[str] = None):
+    """Lista todos los productos del inventario. `campos` limita las columnas, separadas por comas"""
+    try:
+        # La clave y el cuerpo salen del mismo snapshot aunque se publique otro entre medio
+        with registro.vista_consistente():
+            version = servicio.snapshot.version
+            proyeccion = servicio.validar_campos(lista_parametro(campos))
+            clave = ("inventario", "listar", proyeccion, version)
+            return respuesta_cacheada(request, cache_respuestas.obtener(clave, lambda: servicio.listar_todo(proyeccion)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/cambios")
+def cambios(request: Request, desde: Optional[str] = None, campos: Optional[str] = None):
+    """Filas agregadas, modificadas y eliminadas desde la versión `desde`, con la versión vigente para la próxima consulta.
+    Si la versión es muy antigua o no se indica, responde `resincronizar: true` y hay que descargar el inventario completo"""
     try:
-        return servicio.listar_todo()
+        resultado = servicio.cambios_desde(desde, lista_parametro(campos))
+        clave = ("inventario", "cambios", desde, resultado.campos, resultado.version)
+        return respuesta_cacheada(request, cache_respuestas.obtener(clave, resultado.como_dict))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/pagina")
+def listar_pagina(cursor: Optional[str] = None, limite: int = Query(100, ge=1, le=1000), campos: Optional[str] = None):
+    """Lista productos del inventario por páginas, en orden de código"""
+    try:
+        return respuesta_json(servicio.listar_pagina(cursor, limite, lista_parametro(campos)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/stream")
+def listar_stream(formato: str = "ndjson", lote: int = Query(1000, ge=1, le=10000), campos: Optional[str] = None):
+    """Descarga productos del inventario en streaming (NDJSON o arreglo JSON), lote a lote"""
+    try:
+        contenido = servicio.listar_stream(formato, lote, lista_parametro(campos))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    media_type = "application/x-ndjson" if formato == "ndjson" else "application/json"
+    return StreamingResponse(contenido, media_type=media_type)
+
+@router.get("/export")
+def exportar(
+    formato: str = "csv",
+    campos: Optional[str] = None,
+    categoria: Optional[str] = None,
+    lote: int = Query(10000, ge=1, le=100000),
+):
+    """Exporta el inventario en streaming como CSV, NDJSON, Arrow o Parquet. `campos` y `categoria` aceptan varios valores separados por comas"""
+    try:
+        contenido = servicio.exportar(formato, lista_parametro(campos), lista_parametro(categoria), lote)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+    return StreamingResponse(contenido, media_type=TIPOS_CONTENIDO[formato], headers=cabeceras_descarga("inventario", formato))
+
+@router.get("/precio")
+def buscar_por_precio(
+    minimo: Optional[float] = Query(None, alias="min", ge=0),
+    maximo: Optional[float] = Query(None, alias="max", ge=0),
+    orden: str = "asc",
+    limite: Optional[int] = Query(None, ge=1, le=1000),
+    campos: Optional[str] = None,
+):
+    """Busca productos por rango de precio, ordenados por precio (los precios en cero se excluyen)"""
+    try:
+        resultado = servicio.buscar_por_precio(minimo, maximo, orden, limite, lista_parametro(campos))
+        if not resultado:
+            raise HTTPException(status_code=404, detail="No se encontraron productos en el rango de precios indicado")
+        return respuesta_json(resultado)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get("/codigo/{item_id}")
-def buscar_por_id(item_id: int):
+def buscar_por_id(item_id: int, campos: Optional[str] = None):
     """Busca un producto por su código"""
     try:
-        resultado = servicio.buscar_por_id(item_id)
+        resultado = servicio.buscar_por_id(item_id, lista_parametro(campos))
+        if not resultado:
+            raise HTTPException(status_code=404, detail=f"No se encontró ningún producto con el código {item_id}")
+        return respuesta_json(resultado)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.patch("/codigo/{item_id}")
+def actualizar_por_id(item_id: int, request: ActualizacionRequest, campos: Optional[str] = None):
+    """Fija (`valores`) o suma (`ajustes`) stock y precios de un producto. Responde cuando el cambio ya está guardado"""
+    try:
+        resultado = servicio.actualizar(item_id, request.valores, request.ajustes, lista_parametro(campos))
         if not resultado:
             raise HTTPException(status_code=404, detail=f"No se encontró ningún producto con el código {item_id}")
-        return resultado
+        return respuesta_json(resultado)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except KeyError as e:
@@ -36,13 +251,13 @@ def buscar_por_id(item_id: int):
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
 @router.get("/nombre/{nombre}")
-def buscar_por_nombre(nombre: str):
+def buscar_por_nombre(nombre: str, campos: Optional[str] = None):
     """Busca productos por nombre (coincidencia parcial)"""
     try:
-        resultado = servicio.buscar_por_nombre(nombre)
+        resultado = servicio.buscar_por_nombre(nombre, lista_parametro(campos))
         if not resultado:
             raise HTTPException(status_code=404, detail=f"No se encontraron productos que coincidan con '{nombre}'")
-        return resultado
+        return respuesta_json(resultado)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except KeyError as e:
@@ -57,13 +272,13 @@ def buscar_por_nombre(nombre: str):
 
 # Nuevo endpoint para buscar por categoría
 @router.get("/categoria/{categoria}")
-def buscar_por_categoria(categoria: str):
+def buscar_por_categoria(categoria: str, campos: Optional[str] = None):
     """Busca productos por categoría"""
     try:
-        resultado = servicio.buscar_por_categoria(categoria)
+        resultado = servicio.buscar_por_categoria(categoria, lista_parametro(campos))
         if not resultado:
             raise HTTPException(status_code=404, detail=f"No se encontraron productos en la categoría '{categoria}'")
-        return resultado
+        return respuesta_json(resultado)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except KeyError as e:
@@ -73,4 +288,110 @@ def buscar_por_categoria(categoria: str):
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@router.post("/codigos")
+def buscar_por_ids(request: CodigosRequest):
+    """Busca varios productos por código en una sola petición. Los códigos no encontrados se reportan en 'faltantes'"""
+    try:
+        return respuesta_json(servicio.buscar_por_ids(request.codigos, request.campos))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@router.patch("/codigos")
+def actualizar_por_ids(request: ActualizacionesRequest, campos: Optional[str] = None):
+    """Actualiza varios productos de forma atómica: si un cambio no es válido no se aplica ninguno.
+    Los códigos que no existen se reportan en 'faltantes'"""
+    try:
+        actualizaciones = [Actualizacion(a.codigo, a.valores, a.ajustes) for a in request.actualizaciones]
+        return respuesta_json(servicio.actualizar_varios(actualizaciones, lista_parametro(campos)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@router.get("/estadisticas")
+def estadisticas():
+    """Estadísticas de precios del inventario (costo, precio neto, precio total y valor del stock), en total y por categoría"""
+    try:
+        return servicio.obtener_agregados().como_dict()
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+def _buscar(consulta: Consulta):
+    try:
+        return respuesta_json(servicio.buscar(consulta).como_dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+
+@router.get("/buscar")
+def buscar(
+    categoria: Optional[str] = None,
+    texto: Optional[str] = None,
+    precio_min: Optional[float] = Query(None, ge=0),
+    precio_max: Optional[float] = Query(None, ge=0),
+    stock_min: Optional[float] = None,
+    stock_max: Optional[float] = None,
+    ordenar_por: Optional[str] = None,
+    orden: str = "asc",
+    campos: Optional[str] = None,
+    limite: Optional[int] = Query(None, ge=1, le=1000),
+    modo: str = "literal",
+):
+    """Busca productos combinando filtros (categoría, texto, rangos de precio y stock), con orden, campos y límite.
+    Con modo=relevancia el texto tolera errores de tipeo y se devuelven los más relevantes con su puntaje"""
+    proyeccion = lista_parametro(campos)
+    return _buscar(Consulta(
+        categoria=categoria,
+        texto=texto,
+        precio_min=precio_min,
+        precio_max=precio_max,
+        stock_min=stock_min,
+        stock_max=stock_max,
+        ordenar_por=ordenar_por,
+        orden=orden,
+        campos=tuple(proyeccion) if proyeccion is not None else None,
+        limite=limite,
+        modo=modo,
+    ))
+
+
+@router.post("/buscar")
+def buscar_post(request: BusquedaRequest):
+    """Igual que GET /inventario/buscar, con los filtros en el cuerpo"""
+    return _buscar(Consulta(
+        categoria=request.categoria,
+        texto=request.texto,
+        precio_min=request.precio_min,
+        precio_max=request.precio_max,
+        stock_min=request.stock_min,
+        stock_max=request.stock_max,
+        ordenar_por=request.ordenar_por,
+        orden=request.orden,
+        campos=tuple(request.campos) if request.campos is not None else None,
+        limite=request.limite,
+        modo=request.modo,
+    ))
@@ -0,0 +1,86 @@
+import time
+from typing import Optional
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from starlette.routing import Match, Router
+
+from service.metricas import (
+    duracion_peticiones,
+    iniciar_fases,
+    metricas,
+    peticiones_en_curso,
+    peticiones_total,
+    server_timing,
+    tamano_respuestas,
+)
+
+router = APIRouter(tags=["Métricas"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def exponer_metricas():
+    """Métricas del servicio en formato de Prometheus"""
+    return PlainTextResponse(metricas.exposicion(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _buscar_ruta(rutas, scope) -> Optional[str]:
+    for ruta in rutas:
+        # Las versiones recientes de FastAPI envuelven cada include_router; sus rutas ya traen el prefijo
+        incluido = getattr(ruta, "original_router", None)
+        if incluido is not None:
+            encontrada = _buscar_ruta(incluido.routes, scope)
+            if encontrada:
+                return encontrada
+            continue
+        coincidencia, _ = ruta.matches(scope)
+        if coincidencia == Match.FULL:
+            return getattr(ruta, "path", None)
+    return None
+
+
+class MiddlewareMetricas:
+    """Mide cada petición HTTP por ruta: latencia hasta el último byte, peticiones en curso,
+    tamaño de la respuesta y estado. Agrega la cabecera Server-Timing con las fases medidas.
+
+    Las rutas se identifican por su plantilla (`/inventario/codigo/{item_id}`), no por la URL,
+    para que la cantidad de series no crezca con los parámetros.
+    """
+
+    def __init__(self, app, router: Router):
+        self.app = app
+        self.router = router
+
+    def _ruta(self, scope) -> str:
+        return _buscar_ruta(self.router.routes, scope) or "sin_ruta"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope["method"]
+        ruta = self._ruta(scope)
+        fases = iniciar_fases()
+        inicio = time.perf_counter()
+        estado = 500
+        tamano = 0
+
+        async def enviar(mensaje):
+            nonlocal estado, tamano
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                cabecera = server_timing(fases, time.perf_counter() - inicio).encode("latin-1")
+                mensaje = {**mensaje, "headers": list(mensaje.get("headers", [])) + [(b"server-timing", cabecera)]}
+            elif mensaje["type"] == "http.response.body":
+                tamano += len(mensaje.get("body", b""))
+            await send(mensaje)
+
+        peticiones_en_curso.sumar(1, metodo=metodo, ruta=ruta)
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            peticiones_en_curso.sumar(-1, metodo=metodo, ruta=ruta)
+            duracion_peticiones.observar(time.perf_counter() - inicio, metodo=metodo, ruta=ruta)
+            tamano_respuestas.observar(tamano, metodo=metodo, ruta=ruta)
+            peticiones_total.incrementar(metodo=metodo, ruta=ruta, estado=estado)
@@ -0,0 +1,37 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
+from controller.respuestas import respuesta_json
+from service.producto_service import ProductoService
+
+router = APIRouter(prefix="/productos", tags=["Productos"])
+
+servicio = ProductoService()
+
+@router.get("/")
+def listar_pagina(cursor: Optional[str] = None, limite: int = Query(100, ge=1, le=1000)):
+    """Lista los productos con sus imágenes, por páginas en orden de código"""
+    try:
+        return respuesta_json(servicio.listar_pagina(cursor, limite))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
+
+@router.get("/{item_id}")
+def buscar_por_id(item_id: int):
+    """Busca un producto por su código, con sus imágenes"""
+    try:
+        resultado = servicio.buscar_por_id(item_id)
+        if not resultado:
+            raise HTTPException(status_code=404, detail=f"No se encontró ningún producto con el código {item_id}")
+        return respuesta_json(resultado)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
@@ -0,0 +1,60 @@
+from typing import List, Optional
+
+from fastapi import Request, Response
+
+from service.almacen_registros import codificar_json
+from service.cache_respuestas import EntradaRespuesta
+
+
+def _codificaciones_aceptadas(request: Request):
+    aceptadas = set()
+    for parte in request.headers.get("accept-encoding", "").split(","):
+        nombre, _, parametros = parte.strip().partition(";")
+        parametros = parametros.replace(" ", "")
+        if parametros.startswith("q="):
+            try:
+                if float(parametros[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if nombre:
+            aceptadas.add(nombre.lower())
+    return aceptadas
+
+
+def respuesta_cacheada(request: Request, entrada: EntradaRespuesta) -> Response:
+    """Construye la respuesta a partir de una entrada de la caché.
+
+    Elige la variante comprimida según Accept-Encoding y responde 304 sin
+    cuerpo si el cliente ya tiene esa variante (If-None-Match).
+    """
+    aceptadas = _codificaciones_aceptadas(request)
+    if entrada.br is not None and "br" in aceptadas:
+        codificacion = "br"
+    elif "gzip" in aceptadas:
+        codificacion = "gzip"
+    else:
+        codificacion = None
+    contenido, etag = entrada.variante(codificacion)
+
+    headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+    if codificacion is not None:
+        headers["Content-Encoding"] = codificacion
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        etiquetas = {e.strip() for e in if_none_match.split(",")}
+        if "*" in etiquetas or etag in etiquetas:
+            return Response(status_code=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+
+    return Response(content=contenido, media_type="application/json", headers=headers)
+
+
+def respuesta_json(datos) -> Response:
+    """Respuesta JSON codificada directamente, sin pasar por jsonable_encoder"""
+    return Response(content=codificar_json(datos), media_type="application/json")
+
+
+def lista_parametro(valor: Optional[str]) -> Optional[List[str]]:
+    """Lista separada por comas de un parámetro de la URL (campos, categorías)"""
+    return [v.strip() for v in valor.split(",") if v.strip()] if valor else None
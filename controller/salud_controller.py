@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from service.snapshot_service import registro
+
+router = APIRouter(prefix="/health", tags=["Salud"])
+
+
+@router.get("/live")
+def vivo():
+    """El proceso está arriba y atendiendo peticiones, aunque los datos todavía se estén cargando"""
+    return {"estado": "vivo"}
+
+
+@router.get("/ready")
+def listo():
+    """Responde 200 solo cuando todas las fuentes están cargadas e indexadas; si no, 503 con el progreso"""
+    listo = registro.listo
+    contenido = {
+        "listo": listo,
+        "calentando": registro.calentando,
+        "version": registro.version,
+        "fuentes": registro.progreso(),
+    }
+    return JSONResponse(contenido, status_code=200 if listo else 503)
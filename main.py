@@ -1,10 +1,32 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from controller.inventario_controller import router as inventario_router
 from controller.imagen_controller import router as imagen_router
 from controller.ia_controller import router as ia_router
+from controller.producto_controller import router as producto_router
+from controller.metricas_controller import MiddlewareMetricas, router as metricas_router
+from controller.salud_controller import router as salud_router
+from service.inventario_service import escritor_inventario
+from service.snapshot_service import registro
 
-app = FastAPI()
+# Segundos entre revisiones de los Excel para recargarlos en caliente (0 desactiva la recarga)
+INTERVALO_RECARGA = float(os.getenv("INVENTARIO_RECARGA_SEGUNDOS", "5"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Los Excel, índices y registros se preparan en segundo plano; /health/ready indica cuándo terminan
+    registro.iniciar_calentamiento()
+    vigilante = registro.iniciar_vigilancia(INTERVALO_RECARGA) if INTERVALO_RECARGA > 0 else None
+    yield
+    if vigilante is not None:
+        vigilante.detener()
+    escritor_inventario.detener()
+
+
+app = FastAPI(lifespan=lifespan)
 origins = [
     "http://localhost:5173",
     "http://localhost:3000",
@@ -20,10 +42,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Métricas de latencia por ruta y cabecera Server-Timing
+app.add_middleware(MiddlewareMetricas, router=app.router)
+
 # Registrar rutas
 app.include_router(inventario_router)
 app.include_router(imagen_router)
 app.include_router(ia_router)
+app.include_router(producto_router)
+app.include_router(metricas_router)
+app.include_router(salud_router)
 
 @app.get("/")
 def root():
@@ -0,0 +1,555 @@
+"""Actualizaciones de stock y precios sobre el inventario en memoria.
+
+Los cambios no reescriben el Excel. Un único hilo escritor los junta en
+lotes, los valida contra el snapshot vigente, los agrega a la bitácora
+con un solo fsync por lote y publica una versión nueva del snapshot que
+reutiliza los índices que el lote no toca. Las lecturas nunca esperan:
+siguen con la versión anterior hasta que la nueva está lista.
+
+Al cargar el Excel se reaplica la bitácora. Con varios workers, cada uno
+escribe sus lotes con el bloqueo de la bitácora después de ponerse al día
+con lo que agregaron los demás, y `seguir` (llamado por el vigilante de
+archivos) publica los cambios de los otros workers. Cada cierta cantidad de
+cambios, un hilo de compactación guarda el estado vigente como segmento
+columnar (y, si se pide, regenera el Excel) y pliega la bitácora.
+"""
+import math
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from service.bitacora import Bitacora, Cambio, Posicion, leer_desde, plegar, ruta_bitacora
+from service.cache_columnar import reemplazar_cache, ruta_puntero
+from service.cambios import Secuencia
+from service.indices import IndiceCodigo, IndiceRango, indice_codigo
+from service.snapshot_service import RegistroSnapshots, Snapshot, sello_archivo
+
+# Campos que se pueden cambiar y si deben ser enteros
+CAMPOS_EDITABLES = {'s._ent': True, 's._fracc': True, 'precio_neto': False, 'costo': False}
+# Columnas del Excel que se calculan con los campos editables y se recalculan junto con ellos
+CAMPOS_CALCULADOS = ('total_c._compra', 'total_precio', 'utilidad')
+
+# Estructuras derivadas que no dependen de ningún campo editable: pasan tal cual a la versión nueva
+DERIVADOS_FIJOS = ('indice_codigo', 'indice_descripcion', 'indice_relevancia', 'particion_categorias', 'orden_codigo',
+                   'clasificador_ia')
+# Estadísticas por columna (ver service.agregados) que dependen de campos editables
+ESTADISTICAS_POR_CAMPO = {'valor_stock': {'s._ent', 'costo'}}
+
+MAX_LOTE = 5000
+
+
+@dataclass(frozen=True)
+class Actualizacion:
+    """Cambios a un código: `valores` fija el valor de cada campo y `ajustes` le suma (o resta) una cantidad"""
+    codigo: int
+    valores: Dict[str, float] = field(default_factory=dict)
+    ajustes: Dict[str, float] = field(default_factory=dict)
+
+    def validar(self):
+        if not isinstance(self.codigo, int) or self.codigo <= 0:
+            raise ValueError("El código del producto debe ser un número entero positivo.")
+        if not self.valores and not self.ajustes:
+            raise ValueError(f"La actualización del código {self.codigo} no trae valores ni ajustes.")
+
+        repetidos = set(self.valores) & set(self.ajustes)
+        if repetidos:
+            raise ValueError(f"No se puede fijar y ajustar a la vez el campo '{sorted(repetidos)[0]}'.")
+
+        for campo, numero in list(self.valores.items()) + list(self.ajustes.items()):
+            if campo not in CAMPOS_EDITABLES:
+                raise ValueError(f"El campo '{campo}' no se puede actualizar. Campos editables: {', '.join(CAMPOS_EDITABLES)}")
+            if isinstance(numero, bool) or not isinstance(numero, (int, float)) or not math.isfinite(numero):
+                raise ValueError(f"El valor de '{campo}' debe ser un número.")
+            if CAMPOS_EDITABLES[campo] and not float(numero).is_integer():
+                raise ValueError(f"El valor de '{campo}' debe ser un número entero.")
+        for campo, numero in self.valores.items():
+            if numero < 0:
+                raise ValueError(f"El valor de '{campo}' no puede ser negativo.")
+
+
+@dataclass(frozen=True)
+class ResultadoActualizacion:
+    snapshot: Snapshot
+    posiciones: List[int]
+    faltantes: List[int]
+
+
+class _Pedido:
+    __slots__ = ('actualizaciones', 'listo', 'resultado', 'error')
+
+    def __init__(self, actualizaciones: List[Actualizacion]):
+        self.actualizaciones = actualizaciones
+        self.listo = threading.Event()
+        self.resultado: Optional[ResultadoActualizacion] = None
+        self.error: Optional[Exception] = None
+
+
+def _convertir(campo: str, valor: Any) -> Any:
+    return int(valor) if CAMPOS_EDITABLES.get(campo) else float(valor)
+
+
+def _asignar(columnas: Dict[str, np.ndarray], df: pd.DataFrame, campo: str, posicion: int, valor: Any):
+    """Escribe el valor en la copia de trabajo de la columna, creándola la primera vez"""
+    arreglo = columnas.get(campo)
+    if arreglo is None:
+        arreglo = columnas[campo] = df[campo].to_numpy(copy=True)
+    if arreglo.dtype.kind in 'iub' and not float(valor).is_integer():
+        # Una columna de enteros que recibe un precio con decimales pasa a ser de punto flotante
+        arreglo = columnas[campo] = arreglo.astype(float)
+    arreglo[posicion] = valor
+
+
+def _fracciones_por_unidad(ent: float, fracc: float, costo: float, total_compra: float) -> Optional[float]:
+    """Fracciones que trae cada unidad, deducidas de los totales de la fila (el Excel no las guarda).
+    None si la fila no las cuenta en sus totales."""
+    if fracc > 0 and costo > 0:
+        resto = total_compra / costo - ent
+        if resto > 0:
+            return fracc / resto
+    return None
+
+
+def _totales(ent: float, fracc: float, costo: float, precio: float, iva: float,
+             fracciones: Optional[float]) -> Dict[str, float]:
+    """Columnas calculadas de una fila, con las mismas fórmulas del Excel"""
+    cantidad = ent + fracc / fracciones if fracciones else ent
+    total_compra = round(costo * cantidad, 2)
+    total_precio = round(precio * cantidad, 2)
+    return {
+        'total_c._compra': total_compra,
+        'total_precio': total_precio,
+        'utilidad': round(total_precio - total_compra * (1 + iva / 100), 2),
+    }
+
+
+def _igual(actual: Any, valor: Any) -> bool:
+    try:
+        return bool(actual == valor)
+    except TypeError:
+        # pd.NA no se puede comparar
+        return False
+
+
+def _con_columnas(df: pd.DataFrame, columnas: Dict[str, np.ndarray]) -> pd.DataFrame:
+    nuevo = df.copy(deep=False)
+    for campo, arreglo in columnas.items():
+        nuevo[campo] = arreglo
+    return nuevo
+
+
+def _resolver_bitacora(df: pd.DataFrame, indice: IndiceCodigo, cambios: List[Cambio]
+                       ) -> Tuple[Dict[str, np.ndarray], Dict[int, Dict[str, Any]], int]:
+    """Columnas copiadas con los valores de la bitácora, los campos que cambiaron en cada posición
+    y la cantidad de cambios de códigos que ya no existen"""
+    columnas: Dict[str, np.ndarray] = {}
+    por_posicion: Dict[int, Dict[str, Any]] = {}
+    omitidos = 0
+    for cambio in cambios:
+        posiciones = indice.buscar(cambio.codigo)
+        if cambio.fila >= len(posiciones):
+            omitidos += 1
+            continue
+        posicion = posiciones[cambio.fila]
+        for campo, valor in cambio.valores.items():
+            if campo not in df.columns:
+                continue
+            actual = columnas[campo][posicion] if campo in columnas else df[campo].iat[posicion]
+            # Un valor que ya está (por ejemplo, en el segmento guardado al compactar) no copia la
+            # columna, para que sigan valiendo los índices publicados en el segmento
+            if not _igual(actual, valor):
+                _asignar(columnas, df, campo, posicion, valor)
+                por_posicion.setdefault(posicion, {})[campo] = valor
+    return columnas, por_posicion, omitidos
+
+
+def aplicar_cambios(df: pd.DataFrame, cambios: List[Cambio]) -> pd.DataFrame:
+    """DataFrame con los valores de la bitácora aplicados; los códigos que ya no existen se omiten.
+    Si ningún valor cambia se retorna el mismo DataFrame."""
+    if not cambios:
+        return df
+
+    columnas, _, omitidos = _resolver_bitacora(df, IndiceCodigo(df), cambios)
+    if omitidos:
+        print(f"Aviso: {omitidos} cambios de la bitácora corresponden a códigos que ya no están en el Excel")
+    return _con_columnas(df, columnas) if columnas else df
+
+
+class EscritorInventario:
+    """Aplica actualizaciones en lotes: bitácora primero, luego una versión nueva del snapshot.
+
+    El hilo escritor y la bitácora se abren con la primera actualización.
+    Cada petición espera a que su lote esté en disco y publicado, así que
+    al responder el cambio ya es visible y durable.
+
+    Se conecta al registro con `al_leer` (`reaplicar`), `al_publicar`
+    (`publicado`) y `al_sondear` (`seguir`), para saber hasta dónde de la
+    bitácora tiene aplicado el snapshot vigente. Cada snapshot que publica
+    o carga lleva esa posición como su `Secuencia` (ver service.cambios).
+    """
+
+    def __init__(self, registro: RegistroSnapshots, clave: str, archivo: str,
+                 exportar: Optional[Callable[[str, pd.DataFrame], None]] = None,
+                 umbral_compactacion: int = 10000, regenerar_excel: bool = False):
+        self.registro = registro
+        self.clave = clave
+        self.archivo = os.path.abspath(archivo)
+        self.ruta = ruta_bitacora(self.archivo)
+        self.exportar = exportar
+        self.umbral_compactacion = umbral_compactacion
+        self.regenerar_excel = regenerar_excel and exportar is not None
+
+        self._cola: "queue.Queue[Optional[_Pedido]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._hilo: Optional[threading.Thread] = None
+        self._bitacora: Optional[Bitacora] = None
+        self._compactador: Optional[CompactadorBitacora] = None
+        # Hasta dónde de la bitácora tiene aplicado el snapshot vigente, y lo leído por la carga en curso
+        self._posicion: Optional[Posicion] = None
+        self._cargado: Optional[Tuple[pd.DataFrame, Posicion]] = None
+        # Cambios que tenía el archivo después de la última compactación que se vio
+        self._base_compactacion = 0
+
+    def reaplicar(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Ajuste de carga: aplica la bitácora sobre el Excel (o el segmento) recién leído.
+        Debe ser el último ajuste de la fuente, para reconocer su DataFrame en `publicado`."""
+        cambios, posicion = leer_desde(self.ruta)
+        ajustado = aplicar_cambios(df, plegar(cambios))
+        self._cargado = (ajustado, posicion)
+        return ajustado
+
+    def publicado(self, anterior: Optional[Snapshot], nuevo: Snapshot):
+        """Observador de publicación: una carga deja al día la posición en la bitácora.
+
+        Si la recarga falla y se conserva el snapshot anterior, su posición
+        tampoco cambia y `seguir` aplica luego lo que falte.
+        """
+        cargado = self._cargado
+        if cargado is not None and nuevo.df is cargado[0]:
+            self._cargado = None
+            nuevo.derivado('secuencia', lambda df: Secuencia(cargado[1].lsn))
+            self._mover(cargado[1])
+
+    def seguir(self) -> Optional[int]:
+        """Publica los cambios que otros workers agregaron a la bitácora desde la última lectura.
+        Retorna el último número de secuencia leído, o None si todavía no se cargó la fuente."""
+        posicion = self._posicion
+        if posicion is not None and posicion.atrasada(self.ruta):
+            with self.registro.exclusivo():
+                self._al_dia()
+        return self._posicion.lsn if self._posicion is not None else None
+
+    def _al_dia(self) -> Snapshot:
+        """Snapshot vigente con todo lo que tiene la bitácora; se llama con el registro en exclusivo"""
+        actual = self.registro.obtener(self.clave)
+        if actual.df is None:
+            return actual
+        cambios, posicion = leer_desde(self.ruta, self._posicion)
+        if posicion == self._posicion:
+            return actual
+        if (self._posicion is not None and posicion.inodo != self._posicion.inodo
+                and self.clave in self.registro.cambiados()):
+            # Otro proceso compactó regenerando el Excel: la bitácora nueva ya no tiene los cambios que
+            # pasaron al Excel, y puede que este proceso no los haya leído todos. Se carga el Excel nuevo.
+            self.registro.recargar(self.clave)
+            return self.registro.obtener(self.clave)
+
+        columnas, por_posicion, _ = _resolver_bitacora(actual.df, indice_codigo(actual), cambios)
+        if por_posicion:
+            nuevo_df = _con_columnas(actual.df, columnas)
+            derivados = self._heredados(actual, nuevo_df, por_posicion)
+            derivados['secuencia'] = Secuencia(posicion.lsn, por_posicion)
+            actual = self.registro.publicar(self.clave, nuevo_df, derivados)
+        self._mover(posicion)
+        return actual
+
+    def _mover(self, posicion: Posicion):
+        anterior = self._posicion
+        if anterior is None or anterior.inodo != posicion.inodo:
+            # Se empezó a leer un archivo recién compactado (o la bitácora al arrancar)
+            self._base_compactacion = posicion.cantidad if anterior is not None else 0
+        self._posicion = posicion
+        if (self._compactador is not None
+                and posicion.cantidad - self._base_compactacion >= self.umbral_compactacion):
+            self._base_compactacion = posicion.cantidad
+            self._compactador.avisar()
+
+    def aplicar(self, actualizaciones: List[Actualizacion]) -> ResultadoActualizacion:
+        """Aplica las actualizaciones de forma atómica: si alguna no es válida, no se aplica ninguna"""
+        for actualizacion in actualizaciones:
+            actualizacion.validar()
+        self._iniciar()
+
+        pedido = _Pedido(actualizaciones)
+        self._cola.put(pedido)
+        pedido.listo.wait()
+        if pedido.error is not None:
+            raise pedido.error
+        return pedido.resultado
+
+    def _iniciar(self):
+        with self._lock:
+            if self._hilo is not None:
+                return
+            self._bitacora = Bitacora(self.ruta)
+            self._hilo = threading.Thread(target=self._escribir, name='escritor-inventario', daemon=True)
+            self._hilo.start()
+            if self.umbral_compactacion > 0:
+                self._compactador = CompactadorBitacora(self)
+                self._compactador.start()
+                if self._posicion is not None and self._posicion.cantidad >= self.umbral_compactacion:
+                    self._compactador.avisar()
+
+    def detener(self):
+        """Termina los lotes pendientes y cierra la bitácora"""
+        with self._lock:
+            hilo, self._hilo = self._hilo, None
+            compactador, self._compactador = self._compactador, None
+        if hilo is None:
+            return
+        self._cola.put(None)
+        hilo.join()
+        if compactador is not None:
+            compactador.detener()
+        self._bitacora.cerrar()
+
+    def _escribir(self):
+        terminar = False
+        while not terminar:
+            pedido = self._cola.get()
+            if pedido is None:
+                break
+            # Lo que se acumuló mientras se escribía el lote anterior va junto en un solo fsync
+            lote = [pedido]
+            while len(lote) < MAX_LOTE:
+                try:
+                    siguiente = self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if siguiente is None:
+                    terminar = True
+                    break
+                lote.append(siguiente)
+            self._procesar(lote)
+
+    def _procesar(self, lote: List[_Pedido]):
+        try:
+            with self.registro.exclusivo(), self._bitacora.bloqueada():
+                # Los lotes de otros workers van antes: los valores y los ajustes se calculan sobre ellos
+                actual = self._al_dia()
+                if actual.df is None:
+                    raise RuntimeError(f"No se puede actualizar el inventario. {actual.error or 'Datos no disponibles'}")
+                self._aplicar_lote(actual, lote)
+        except Exception as e:
+            for pedido in lote:
+                if pedido.error is None and pedido.resultado is None:
+                    pedido.error = e if isinstance(e, (ValueError, RuntimeError)) else RuntimeError(
+                        f"No se pudo guardar la actualización: {str(e)}")
+        finally:
+            for pedido in lote:
+                pedido.listo.set()
+
+    def _aplicar_lote(self, actual: Snapshot, lote: List[_Pedido]):
+        df = actual.df
+        indice = indice_codigo(actual)
+        columnas: Dict[str, np.ndarray] = {}
+        cambios: Dict[int, Dict[str, Any]] = {}
+        aceptados = []
+
+        for pedido in lote:
+            try:
+                nuevos, posiciones, faltantes = self._resolver(pedido.actualizaciones, df, indice, columnas)
+            except ValueError as e:
+                pedido.error = e
+                continue
+            for (posicion, campo), valor in nuevos.items():
+                _asignar(columnas, df, campo, posicion, valor)
+                cambios.setdefault(posicion, {})[campo] = valor
+            aceptados.append((pedido, posiciones, faltantes))
+
+        snapshot = actual
+        if cambios:
+            codigos = df['código'].to_numpy()
+            registros_bitacora = []
+            for posicion in sorted(cambios):
+                codigo = codigos[posicion].item()
+                fila = indice.buscar(codigo).index(posicion)
+                registros_bitacora.append((codigo, fila, cambios[posicion]))
+            _, posicion = self._bitacora.agregar(self._posicion, registros_bitacora)
+
+            nuevo_df = _con_columnas(df, columnas)
+            derivados = self._heredados(actual, nuevo_df, cambios)
+            derivados['secuencia'] = Secuencia(posicion.lsn, cambios)
+            snapshot = self.registro.publicar(self.clave, nuevo_df, derivados)
+            self._mover(posicion)
+
+        for pedido, posiciones, faltantes in aceptados:
+            pedido.resultado = ResultadoActualizacion(snapshot, posiciones, faltantes)
+
+    def _resolver(self, actualizaciones: List[Actualizacion], df: pd.DataFrame, indice: IndiceCodigo,
+                  columnas: Dict[str, np.ndarray]) -> Tuple[Dict[Tuple[int, str], Any], List[int], List[int]]:
+        """Valores finales de cada (posición, campo) de un pedido, sin aplicarlos todavía.
+        Incluye las columnas calculadas de las filas a las que se les cambió alguno de sus datos."""
+        nuevos: Dict[Tuple[int, str], Any] = {}
+        posiciones: List[int] = []
+        faltantes: List[int] = []
+
+        def valor_vigente(posicion: int, campo: str):
+            if campo in columnas:
+                return columnas[campo][posicion]
+            return df[campo].iat[posicion]
+
+        def valor_actual(posicion: int, campo: str):
+            if (posicion, campo) in nuevos:
+                return nuevos[(posicion, campo)]
+            return valor_vigente(posicion, campo)
+
+        for actualizacion in actualizaciones:
+            for campo in list(actualizacion.valores) + list(actualizacion.ajustes):
+                if campo not in df.columns:
+                    raise ValueError(f"El inventario no tiene la columna '{campo}'.")
+
+            encontradas = indice.buscar(actualizacion.codigo)
+            if not encontradas:
+                faltantes.append(actualizacion.codigo)
+                continue
+
+            # Si el código aparece en varias filas del Excel, el cambio se aplica a todas
+            for posicion in encontradas:
+                for campo, valor in actualizacion.valores.items():
+                    nuevos[(posicion, campo)] = _convertir(campo, valor)
+                for campo, ajuste in actualizacion.ajustes.items():
+                    base = pd.to_numeric(valor_actual(posicion, campo), errors='coerce')
+                    if pd.isna(base):
+                        raise ValueError(f"El código {actualizacion.codigo} no tiene un valor en '{campo}' al que sumar el ajuste.")
+                    valor = _convertir(campo, base + ajuste)
+                    if valor < 0:
+                        raise ValueError(f"El campo '{campo}' del código {actualizacion.codigo} quedaría en {valor}; no puede ser negativo.")
+                    nuevos[(posicion, campo)] = valor
+                if posicion not in posiciones:
+                    posiciones.append(posicion)
+
+        if all(campo in df.columns for campo in CAMPOS_CALCULADOS + ('%_iva_c',)):
+            for posicion in posiciones:
+                antes = [pd.to_numeric(valor_vigente(posicion, campo), errors='coerce')
+                         for campo in ('s._ent', 's._fracc', 'costo', 'total_c._compra')]
+                datos = [pd.to_numeric(valor_actual(posicion, campo), errors='coerce')
+                         for campo in ('s._ent', 's._fracc', 'costo', 'precio_neto', '%_iva_c')]
+                if any(pd.isna(v) for v in antes + datos):
+                    # Sin los datos de la fila no hay cómo recalcular; los totales quedan como en el Excel
+                    continue
+                fracciones = _fracciones_por_unidad(*(float(v) for v in antes))
+                for campo, valor in _totales(*(float(v) for v in datos), fracciones).items():
+                    nuevos[(posicion, campo)] = valor
+
+        return nuevos, posiciones, faltantes
+
+    @staticmethod
+    def _heredados(actual: Snapshot, df: pd.DataFrame, cambios: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+        """Estructuras derivadas del snapshot vigente que sirven para la versión nueva, algunas actualizadas en sitio.
+
+        Las que no aparecen aquí (por ejemplo, los agregados) las reconstruyen
+        los calentadores antes de publicar.
+        """
+        posiciones_por_campo: Dict[str, List[int]] = {}
+        for posicion, valores in cambios.items():
+            for campo in valores:
+                posiciones_por_campo.setdefault(campo, []).append(posicion)
+
+        heredados = {}
+        for nombre, estructura in actual.derivados_calculados().items():
+            if nombre in DERIVADOS_FIJOS:
+                heredados[nombre] = estructura
+            elif nombre == 'registros':
+                heredados[nombre] = estructura.con_filas(df, cambios, posiciones_por_campo)
+            elif isinstance(estructura, IndiceRango):
+                cambiadas = posiciones_por_campo.get(estructura.columna)
+                heredados[nombre] = estructura.con_cambios(df, cambiadas) if cambiadas else estructura
+            elif nombre.startswith('numericos:'):
+                if nombre.split(':', 1)[1] not in posiciones_por_campo:
+                    heredados[nombre] = estructura
+            elif nombre.startswith('estadisticas:'):
+                columna = nombre.split(':', 1)[1]
+                if not ESTADISTICAS_POR_CAMPO.get(columna, {columna}) & set(posiciones_por_campo):
+                    heredados[nombre] = estructura
+        return heredados
+
+    def compactar(self):
+        """Guarda el estado vigente como segmento columnar (y, si se pidió, como Excel) y pliega la bitácora.
+
+        Sin regenerar el Excel, la bitácora se queda con un cambio por fila
+        modificada: si alguien edita el Excel a mano, esos cambios se siguen
+        aplicando encima. Con el Excel regenerado se descartan.
+        """
+        with self.registro.exclusivo():
+            snapshot = self.registro.obtener(self.clave)
+            if snapshot.df is None or self._bitacora is None or self._posicion is None:
+                return
+            hasta = self._posicion.lsn
+            inodo = self._posicion.inodo
+        sello = sello_archivo(self.archivo)
+        fuente = self.registro.fuentes()[self.clave]
+
+        inicio = time.perf_counter()
+        if self.regenerar_excel:
+            self.exportar(self.archivo, snapshot.df)
+            reemplazar_cache(self.archivo, snapshot.df, fuente.indices, fuente.huella)
+        elif sello is not None:
+            reemplazar_cache(self.archivo, snapshot.df, fuente.indices, fuente.huella)
+            if sello_archivo(self.archivo) != sello:
+                # El Excel cambió mientras se escribía: el segmento podría no corresponderle
+                try:
+                    os.remove(ruta_puntero(self.archivo))
+                except OSError:
+                    pass
+
+        with self.registro.exclusivo():
+            with self._bitacora.bloqueada():
+                self._al_dia()
+                if self._posicion.inodo != inodo:
+                    print("La bitácora ya la compactó otro proceso")
+                    return
+                cambios = self._bitacora.leer()
+                posteriores = [c for c in cambios if c.lsn > hasta]
+                plegados = [] if self.regenerar_excel else plegar(c for c in cambios if c.lsn <= hasta)
+                self._mover(self._bitacora.reescribir(plegados + posteriores))
+            if self.regenerar_excel:
+                # La numeración de la bitácora vuelve a empezar con el Excel nuevo: se carga antes de
+                # publicar más cambios, igual que harán los demás procesos
+                self.registro.recargar(self.clave)
+        print(f"Bitácora compactada hasta el cambio {hasta}: quedan {len(plegados) + len(posteriores)} "
+              f"de {len(cambios)} ({time.perf_counter() - inicio:.2f} s)")
+
+
+class CompactadorBitacora(threading.Thread):
+    """Hilo que compacta la bitácora cuando el escritor se lo pide, fuera del camino de las escrituras"""
+
+    def __init__(self, escritor: EscritorInventario):
+        super().__init__(name='compactador-bitacora', daemon=True)
+        self.escritor = escritor
+        self._pendiente = threading.Event()
+        self._detenido = threading.Event()
+
+    def avisar(self):
+        self._pendiente.set()
+
+    def run(self):
+        while True:
+            self._pendiente.wait()
+            if self._detenido.is_set():
+                return
+            self._pendiente.clear()
+            try:
+                self.escritor.compactar()
+            except Exception as e:
+                print(f"Error: no se pudo compactar la bitácora: {str(e)}")
+
+    def detener(self):
+        self._detenido.set()
+        self._pendiente.set()
+        self.join()
@@ -0,0 +1,177 @@
+"""Agregados de precios del inventario, calculados una vez por snapshot.
+
+Los valores en cero o negativos se excluyen de las estadísticas, igual que
+hacían las consultas de la IA, porque en el Excel indican precios sin cargar.
+
+Las estadísticas de cada columna se guardan aparte en el snapshot
+(`estadisticas:<columna>`), de modo que una versión nueva que solo cambió
+el stock reutiliza las de los precios.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from service.indices import IndiceRango, particion_categorias
+from service.snapshot_service import Snapshot
+
+COLUMNAS_PRECIO = ('precio_neto', 'total_precio', 'costo')
+CUANTILES = (0.25, 0.75, 0.9)
+
+
+def resolver_columna_precio(columnas: Iterable[str]) -> Optional[str]:
+    """Columna que se usa como precio de venta: 'precio_neto' si existe, luego las demás conocidas"""
+    columnas = list(columnas)
+    for columna in COLUMNAS_PRECIO:
+        if columna in columnas:
+            return columna
+    for columna in columnas:
+        if 'precio' in columna.lower() or 'valor' in columna.lower():
+            return columna
+    return None
+
+
+@dataclass(frozen=True)
+class EstadisticasColumna:
+    cantidad: int
+    minimo: Optional[float]
+    maximo: Optional[float]
+    promedio: Optional[float]
+    mediana: Optional[float]
+    cuantiles: Dict[str, float]
+
+    @classmethod
+    def desde_valores(cls, valores: np.ndarray) -> 'EstadisticasColumna':
+        valores = valores[np.isfinite(valores) & (valores > 0)]
+        if len(valores) == 0:
+            return cls(0, None, None, None, None, {})
+        return cls(
+            cantidad=int(len(valores)),
+            minimo=float(valores.min()),
+            maximo=float(valores.max()),
+            promedio=float(valores.mean()),
+            mediana=float(np.median(valores)),
+            cuantiles={f"p{int(q * 100)}": float(v) for q, v in zip(CUANTILES, np.quantile(valores, CUANTILES))},
+        )
+
+    def como_dict(self) -> Dict:
+        return {
+            "cantidad": self.cantidad,
+            "minimo": self.minimo,
+            "maximo": self.maximo,
+            "promedio": self.promedio,
+            "mediana": self.mediana,
+            "cuantiles": self.cuantiles,
+        }
+
+
+@dataclass(frozen=True)
+class AgregadosInventario:
+    total_productos: int
+    columna_precio: Optional[str]
+    columnas: Dict[str, EstadisticasColumna]
+    productos_por_categoria: Dict[str, int]
+    por_categoria: Dict[str, Dict[str, EstadisticasColumna]]
+
+    @property
+    def precio(self) -> Optional[EstadisticasColumna]:
+        """Estadísticas de la columna de precio resuelta"""
+        return self.columnas.get(self.columna_precio)
+
+    def como_dict(self) -> Dict:
+        return {
+            "total_productos": self.total_productos,
+            "columna_precio": self.columna_precio,
+            "columnas": {nombre: e.como_dict() for nombre, e in self.columnas.items()},
+            "productos_por_categoria": self.productos_por_categoria,
+            "por_categoria": {
+                categoria: {nombre: e.como_dict() for nombre, e in columnas.items()}
+                for categoria, columnas in self.por_categoria.items()
+            },
+        }
+
+
+def _numerica(df: pd.DataFrame, columna: str) -> np.ndarray:
+    return pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=float)
+
+
+def _columnas_estadisticas(df: pd.DataFrame, columna_precio: Optional[str]) -> Tuple[str, ...]:
+    columnas = []
+    for columna in COLUMNAS_PRECIO + ((columna_precio,) if columna_precio else ()):
+        if columna in df.columns and columna not in columnas:
+            columnas.append(columna)
+    if 's._ent' in df.columns and 'costo' in columnas:
+        columnas.append('valor_stock')
+    return tuple(columnas)
+
+
+def _valores(df: pd.DataFrame, columna: str) -> np.ndarray:
+    if columna == 'valor_stock':
+        # Valor del stock a costo: unidades enteras por costo unitario
+        return _numerica(df, 's._ent') * _numerica(df, 'costo')
+    return _numerica(df, columna)
+
+
+def estadisticas_columna(snapshot: Snapshot, columna: str) -> Tuple[EstadisticasColumna, Dict[str, EstadisticasColumna]]:
+    """Estadísticas de la columna en todo el inventario y por categoría"""
+    def calcular(df):
+        valores = _valores(df, columna)
+        por_categoria = {}
+        if 'categoría' in df.columns:
+            particion = particion_categorias(snapshot)
+            for categoria in particion.categorias():
+                por_categoria[categoria] = EstadisticasColumna.desde_valores(valores[particion.arreglo(categoria)])
+        return EstadisticasColumna.desde_valores(valores), por_categoria
+
+    return snapshot.derivado(f'estadisticas:{columna}', calcular)
+
+
+def calcular_agregados(snapshot: Snapshot) -> AgregadosInventario:
+    df = snapshot.df
+    columna_precio = resolver_columna_precio(df.columns)
+    estadisticas = {c: estadisticas_columna(snapshot, c) for c in _columnas_estadisticas(df, columna_precio)}
+
+    productos_por_categoria = {}
+    por_categoria = {}
+    if 'categoría' in df.columns:
+        conteos = particion_categorias(snapshot).conteos()
+        productos_por_categoria = dict(sorted(conteos.items(), key=lambda c: -c[1]))
+        for categoria in productos_por_categoria:
+            por_categoria[categoria] = {nombre: e[1][categoria] for nombre, e in estadisticas.items()}
+
+    return AgregadosInventario(
+        total_productos=len(df),
+        columna_precio=columna_precio,
+        columnas={nombre: e[0] for nombre, e in estadisticas.items()},
+        productos_por_categoria=productos_por_categoria,
+        por_categoria=por_categoria,
+    )
+
+
+def agregados(snapshot: Snapshot) -> AgregadosInventario:
+    return snapshot.derivado('agregados', lambda df: calcular_agregados(snapshot))
+
+
+class IndicePrecios(IndiceRango):
+    """Posiciones de fila ordenadas por precio, sin los precios en cero.
+
+    Los rangos se resuelven con búsqueda binaria sobre los precios ordenados,
+    en O(log n + k), y el top de más caros o más baratos sale de los extremos.
+    """
+
+    def __init__(self, df: pd.DataFrame, columna: str, arreglos: Optional[Dict[str, np.ndarray]] = None):
+        super().__init__(df, columna, solo_positivos=True, arreglos=arreglos)
+
+    @property
+    def precios(self) -> np.ndarray:
+        return self.valores_ordenados
+
+
+def indice_precios(snapshot: Snapshot) -> Optional[IndicePrecios]:
+    """Índice de la columna de precio resuelta, o None si el inventario no tiene precios"""
+    def construir(df):
+        columna = resolver_columna_precio(df.columns)
+        return IndicePrecios(df, columna, snapshot.arreglos) if columna else None
+
+    return snapshot.derivado('indice_precios', construir)
@@ -0,0 +1,280 @@
+"""Registros compactos de un snapshot y codificación JSON directa.
+
+En lugar de guardar un diccionario por fila, cada snapshot guarda sus
+columnas como arreglos de NumPy y cada fila ya codificada como JSON, una
+sola vez al cargar. Las respuestas se arman uniendo esos bytes, sin pasar
+por `to_dict` ni por `jsonable_encoder`; los diccionarios solo se crean
+cuando algún código los pide fila por fila (por ejemplo, la IA).
+
+Una selección con `campos` se codifica columna por columna, solo con las
+columnas pedidas y solo en las filas elegidas: las demás columnas nunca se
+convierten ni se codifican.
+"""
+import json
+import math
+from json.encoder import encode_basestring
+from collections.abc import Sequence
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi.encoders import jsonable_encoder
+
+from service.metricas import fase
+
+
+def _json_valor(valor: Any) -> str:
+    return json.dumps(valor, ensure_ascii=False, allow_nan=False)
+
+
+def _nativo(valor: Any) -> Any:
+    """Convierte escalares de NumPy/pandas a tipos de Python; los nulos y NaN quedan como None"""
+    if isinstance(valor, np.generic):
+        valor = valor.item()
+    if valor is None or valor is pd.NA or valor is pd.NaT:
+        return None
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+
+def _fragmentos(serie: pd.Series) -> List[str]:
+    """Valores de la columna ya codificados como JSON, uno por fila"""
+    if pd.api.types.is_bool_dtype(serie.dtype) and serie.dtype != object:
+        return ['true' if v else 'false' for v in serie.tolist()]
+    if pd.api.types.is_integer_dtype(serie.dtype) and isinstance(serie.dtype, np.dtype):
+        return [str(v) for v in serie.tolist()]
+    if pd.api.types.is_float_dtype(serie.dtype) and isinstance(serie.dtype, np.dtype):
+        return [repr(v) if math.isfinite(v) else 'null' for v in serie.tolist()]
+
+    return _fragmentos_valores(serie.tolist())
+
+
+def _fragmentos_arreglo(arreglo: np.ndarray, tipo) -> List[str]:
+    """Como `_fragmentos`, directamente sobre el arreglo de una columna del almacén.
+    `tipo` es el de la columna original, que el arreglo puede haber perdido
+    (los enteros con nulos de pandas, por ejemplo, quedan como flotantes)"""
+    clase = arreglo.dtype.kind
+    if clase == 'O':
+        return _fragmentos_valores(arreglo.tolist())
+    if not isinstance(tipo, np.dtype) or clase not in 'biuf':
+        return _fragmentos(pd.Series(arreglo, copy=False).astype(tipo))
+    if clase == 'b':
+        return ['true' if v else 'false' for v in arreglo.tolist()]
+    if clase in 'iu':
+        return [str(v) for v in arreglo.tolist()]
+    return [repr(v) if math.isfinite(v) else 'null' for v in arreglo.tolist()]
+
+
+def _fragmentos_valores(valores: List[Any]) -> List[str]:
+    fragmentos = []
+    for valor in valores:
+        if type(valor) is str:
+            # El mismo codificador en C que usa json.dumps para las cadenas
+            fragmentos.append(encode_basestring(valor))
+            continue
+        valor = _nativo(valor)
+        if valor is None or isinstance(valor, (str, int, float, bool)):
+            fragmentos.append(_json_valor(valor))
+        else:
+            fragmentos.append(_json_valor(jsonable_encoder(valor)))
+    return fragmentos
+
+
+def _unir_filas(columnas: Iterable[str], por_columna: List[List[str]]) -> List[bytes]:
+    """Une los fragmentos de cada columna en el JSON de cada fila; las claves y llaves
+    se pegan columna por columna, así cada fila es un solo `join`"""
+    if not por_columna:
+        return []
+    prefijos = [_json_valor(str(c)) + ':' for c in columnas]
+    prefijos[0] = '{' + prefijos[0]
+    partes = [[p + v for v in valores] for p, valores in zip(prefijos, por_columna)]
+    partes[-1] = [v + '}' for v in partes[-1]]
+    return [','.join(fila).encode('utf-8') for fila in zip(*partes)]
+
+
+def json_filas(df: pd.DataFrame) -> List[bytes]:
+    """JSON de cada fila del DataFrame, armado columna por columna sin crear diccionarios"""
+    return _unir_filas(df.columns, [_fragmentos(df[c]) for c in df.columns])
+
+
+def validar_campos(campos: Optional[Iterable[str]], disponibles: Iterable[str]) -> Optional[Tuple[str, ...]]:
+    """Campos pedidos sin repetir y en su orden, o None si no se pidió proyección.
+    Error si la lista está vacía o si algún campo no es una columna disponible"""
+    if campos is None:
+        return None
+    campos = tuple(dict.fromkeys(campos))
+    disponibles = [str(c) for c in disponibles]
+    if not campos:
+        raise ValueError("Debe indicar al menos un campo.")
+    desconocidos = [c for c in campos if c not in disponibles]
+    if desconocidos:
+        raise ValueError(f"Campos no disponibles: {', '.join(desconocidos)}. Use algunos de: {', '.join(disponibles)}")
+    return campos
+
+
+class AlmacenRegistros:
+    """Filas de un DataFrame en forma columnar, con el JSON de cada fila precalculado"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.columnas = tuple(str(c) for c in df.columns)
+        self._tipos = tuple(df[c].dtype for c in df.columns)
+        self._arreglos = [df[c].to_numpy() for c in df.columns]
+        self._json: List[bytes] = json_filas(df)
+
+    def con_filas(self, df: pd.DataFrame, posiciones: Iterable[int], columnas: Iterable[str]) -> 'AlmacenRegistros':
+        """Almacén de un DataFrame que solo difiere de este en las filas y columnas dadas;
+        el JSON de las demás filas y los arreglos de las demás columnas se reutilizan"""
+        posiciones = sorted(set(int(p) for p in posiciones))
+        columnas = set(columnas)
+        nuevo = AlmacenRegistros.__new__(AlmacenRegistros)
+        nuevo.columnas = self.columnas
+        nuevo._tipos = tuple(df[c].dtype for c in self.columnas)
+        nuevo._arreglos = [
+            df[c].to_numpy() if c in columnas else arreglo
+            for c, arreglo in zip(self.columnas, self._arreglos)
+        ]
+        nuevo._json = list(self._json)
+        for posicion, fila in zip(posiciones, json_filas(df.iloc[posiciones])):
+            nuevo._json[posicion] = fila
+        return nuevo
+
+    def __len__(self) -> int:
+        return len(self._json)
+
+    def fila(self, posicion: int, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """Diccionario de la fila, con tipos de Python; con `campos`, solo esas columnas y en ese orden"""
+        if campos is None:
+            return {c: _nativo(a[posicion]) for c, a in zip(self.columnas, self._arreglos)}
+        return {c: _nativo(self._arreglos[self.columnas.index(c)][posicion]) for c in campos}
+
+    def arreglo(self, campo: str) -> np.ndarray:
+        """Valores de una columna, en el orden de las filas"""
+        return self._arreglos[self.columnas.index(campo)]
+
+    def json_fila(self, posicion: int) -> bytes:
+        return self._json[posicion]
+
+    def json_proyectado(self, posiciones, campos: Tuple[str, ...]) -> List[bytes]:
+        """JSON de las filas dadas con solo esos campos, codificando únicamente esas columnas en esas filas"""
+        if isinstance(posiciones, range) and posiciones.step == 1:
+            elegir = slice(posiciones.start, posiciones.stop)
+        else:
+            elegir = np.asarray(posiciones, dtype=np.int64)
+        indices = [self.columnas.index(c) for c in campos]
+        por_columna = [_fragmentos_arreglo(self._arreglos[i][elegir], self._tipos[i]) for i in indices]
+        return _unir_filas(campos, por_columna)
+
+    def seleccion(self, posiciones: Iterable[int], campos: Optional[Iterable[str]] = None) -> 'SeleccionRegistros':
+        with fase('materializacion'):
+            return SeleccionRegistros(self, posiciones, campos)
+
+    def todos(self) -> 'SeleccionRegistros':
+        return SeleccionRegistros(self, range(len(self)))
+
+
+class SeleccionRegistros(Sequence):
+    """Lista de filas de un almacén que se codifica a JSON sin crear diccionarios.
+
+    Se comporta como una lista de diccionarios de solo lectura: `len`, índices,
+    rebanadas e iteración crean cada diccionario al pedirlo. Con `campos`, cada
+    fila trae solo esas columnas.
+    """
+
+    __slots__ = ('_almacen', '_posiciones', 'campos')
+
+    def __init__(self, almacen: AlmacenRegistros, posiciones: Iterable[int], campos: Optional[Iterable[str]] = None):
+        self._almacen = almacen
+        if isinstance(posiciones, np.ndarray):
+            posiciones = posiciones.tolist()
+        self._posiciones = posiciones if isinstance(posiciones, range) else [int(p) for p in posiciones]
+        self.campos = validar_campos(campos, almacen.columnas)
+
+    def __len__(self) -> int:
+        return len(self._posiciones)
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return SeleccionRegistros(self._almacen, self._posiciones[indice], self.campos)
+        return self._almacen.fila(self._posiciones[indice], self.campos)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        fila = self._almacen.fila
+        for posicion in self._posiciones:
+            yield fila(posicion, self.campos)
+
+    def __repr__(self) -> str:
+        return f"SeleccionRegistros({len(self)} filas)"
+
+    def proyectar(self, campos: Optional[Iterable[str]]) -> 'SeleccionRegistros':
+        """Las mismas filas con solo esos campos (todos si es None), sin materializar ninguna"""
+        return SeleccionRegistros(self._almacen, self._posiciones, campos)
+
+    def json(self) -> bytes:
+        return b'[' + b','.join(list(self.json_filas())) + b']'
+
+    def json_filas(self) -> Iterator[bytes]:
+        """JSON de cada fila, en orden"""
+        if self.campos is not None:
+            yield from self._almacen.json_proyectado(self._posiciones, self.campos)
+            return
+        filas = self._almacen._json
+        for posicion in self._posiciones:
+            yield filas[posicion]
+
+
+def codificar_json(datos: Any) -> bytes:
+    """Codifica la respuesta a JSON compacto en UTF-8.
+
+    Las selecciones de registros se escriben con su JSON precalculado; el
+    resto produce lo mismo que `jsonable_encoder` seguido de `json.dumps`.
+    """
+    with fase('codificacion'):
+        partes: List[bytes] = []
+        _codificar(datos, partes)
+        return b''.join(partes)
+
+
+class _ContieneSeleccion(Exception):
+    pass
+
+
+def _por_defecto(valor: Any) -> Any:
+    if isinstance(valor, SeleccionRegistros):
+        # La selección se escribe con su JSON precalculado: el contenedor se recorre a mano
+        raise _ContieneSeleccion()
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return jsonable_encoder(valor)
+
+
+_codificador = json.JSONEncoder(ensure_ascii=False, allow_nan=False, separators=(',', ':'), default=_por_defecto)
+
+
+def _codificar(datos: Any, partes: List[bytes]):
+    if isinstance(datos, SeleccionRegistros):
+        partes.append(datos.json())
+        return
+
+    # Lo que no contiene selecciones se codifica de una vez con el codificador en C de json
+    try:
+        partes.append(_codificador.encode(datos).encode('utf-8'))
+        return
+    except _ContieneSeleccion:
+        pass
+
+    if isinstance(datos, dict):
+        partes.append(b'{')
+        for i, (clave, valor) in enumerate(datos.items()):
+            if i:
+                partes.append(b',')
+            partes.append(_json_valor(str(clave)).encode('utf-8') + b':')
+            _codificar(valor, partes)
+        partes.append(b'}')
+    else:
+        partes.append(b'[')
+        for i, valor in enumerate(datos):
+            if i:
+                partes.append(b',')
+            _codificar(valor, partes)
+        partes.append(b']')
@@ -0,0 +1,221 @@
+"""Bitácora de cambios (write-ahead log) del inventario.
+
+Cada cambio es una línea con la suma CRC32 del JSON y el JSON mismo:
+número de secuencia, código, fila (la ocurrencia del código en el Excel,
+0 para la primera) y los valores que quedaron. Como guarda valores
+finales y no incrementos, reaplicar la bitácora sobre datos que ya los
+tienen no cambia nada. Un lote de cambios se escribe y se sincroniza a
+disco (fsync) de una vez antes de publicarlo.
+
+Varios procesos (los workers del servidor) comparten la bitácora. Cada
+uno escribe sus lotes con el bloqueo del archivo `.wal.lock`, después de
+leer lo que agregaron los demás, y sigue leyendo desde donde quedó
+(`leer_desde`) para publicar los cambios de los otros.
+"""
+import json
+import os
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+@dataclass(frozen=True)
+class Cambio:
+    lsn: int
+    codigo: Any
+    fila: int
+    valores: Dict[str, Any]
+
+    def linea(self) -> bytes:
+        cuerpo = json.dumps(
+            {'lsn': self.lsn, 'código': self.codigo, 'fila': self.fila, 'valores': self.valores},
+            ensure_ascii=False, separators=(',', ':'),
+        ).encode('utf-8')
+        return b'%08x ' % zlib.crc32(cuerpo) + cuerpo + b'\n'
+
+
+def ruta_bitacora(archivo: str) -> str:
+    """Bitácora que acompaña al Excel: `inventario_vitalix_plus.xlsx` -> `inventario_vitalix_plus.wal`"""
+    return os.path.splitext(archivo)[0] + '.wal'
+
+
+def _sincronizar_directorio(ruta: str):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    descriptor = os.open(os.path.dirname(os.path.abspath(ruta)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _leer_lineas(contenido: bytes) -> Tuple[List[Cambio], int]:
+    cambios = []
+    validos = 0
+    for linea in contenido.splitlines(keepends=True):
+        if not linea.endswith(b'\n') or len(linea) < 10 or linea[8:9] != b' ':
+            break
+        cuerpo = linea[9:-1]
+        try:
+            if int(linea[:8], 16) != zlib.crc32(cuerpo):
+                break
+            datos = json.loads(cuerpo)
+            cambios.append(Cambio(int(datos['lsn']), datos['código'], int(datos['fila']), dict(datos['valores'])))
+        except (ValueError, KeyError, TypeError):
+            break
+        validos += len(linea)
+    return cambios, validos
+
+
+def leer_bitacora(ruta: str) -> Tuple[List[Cambio], int]:
+    """Cambios válidos, en el orden en que se escribieron, y los bytes que ocupan.
+
+    La lectura se corta en la primera línea incompleta o con la suma de
+    verificación equivocada: es la escritura que quedó a medias si el
+    proceso se cayó antes del fsync.
+    """
+    try:
+        with open(ruta, 'rb') as f:
+            contenido = f.read()
+    except FileNotFoundError:
+        return [], 0
+
+    cambios, validos = _leer_lineas(contenido)
+    if validos < len(contenido):
+        print(f"Aviso: se ignoran {len(contenido) - validos} bytes incompletos al final de {ruta}")
+    return cambios, validos
+
+
+@dataclass(frozen=True)
+class Posicion:
+    """Hasta dónde se leyó la bitácora: el archivo (por su inodo), los bytes válidos leídos,
+    el último número de secuencia visto y la cantidad de cambios que tiene el archivo"""
+    inodo: Optional[int] = None
+    bytes: int = 0
+    lsn: int = 0
+    cantidad: int = 0
+
+    def atrasada(self, ruta: str) -> bool:
+        """True si el archivo cambió desde esta posición (otro proceso agregó o compactó)"""
+        try:
+            estado = os.stat(ruta)
+        except FileNotFoundError:
+            return self.inodo is not None
+        return (estado.st_ino, estado.st_size) != (self.inodo, self.bytes)
+
+
+def leer_desde(ruta: str, posicion: Optional[Posicion] = None) -> Tuple[List[Cambio], Posicion]:
+    """Cambios agregados desde `posicion` (todos si es None) y la posición nueva.
+
+    Si el archivo se reemplazó (una compactación) o es más corto que lo ya
+    leído, se lee completo otra vez: reaplicar valores finales no cambia
+    nada, y el último número de secuencia pasa a ser el del archivo nuevo.
+    Una línea a medio escribir por otro proceso se deja para la siguiente
+    lectura.
+    """
+    anterior = posicion or Posicion()
+    try:
+        with open(ruta, 'rb') as f:
+            estado = os.fstat(f.fileno())
+            mismo = estado.st_ino == anterior.inodo and estado.st_size >= anterior.bytes
+            inicio = anterior.bytes if mismo else 0
+            f.seek(inicio)
+            contenido = f.read()
+    except FileNotFoundError:
+        return [], Posicion()
+
+    cambios, validos = _leer_lineas(contenido)
+    return cambios, Posicion(
+        estado.st_ino,
+        inicio + validos,
+        max([anterior.lsn if mismo else 0] + [c.lsn for c in cambios]),
+        (anterior.cantidad if mismo else 0) + len(cambios),
+    )
+
+
+def plegar(cambios: Iterable[Cambio]) -> List[Cambio]:
+    """Un solo cambio por (código, fila) con los últimos valores de cada campo, en orden de secuencia"""
+    plegados: Dict[Tuple[Any, int], Cambio] = {}
+    for cambio in cambios:
+        anterior = plegados.get((cambio.codigo, cambio.fila))
+        valores = {**anterior.valores, **cambio.valores} if anterior is not None else dict(cambio.valores)
+        plegados[(cambio.codigo, cambio.fila)] = Cambio(cambio.lsn, cambio.codigo, cambio.fila, valores)
+    return sorted(plegados.values(), key=lambda c: c.lsn)
+
+
+class Bitacora:
+    """Bitácora compartida por todos los procesos que atienden el mismo Excel.
+
+    Cada proceso lee lo que escribieron los demás con `leer_desde`. Para
+    escribir, toma el bloqueo exclusivo del archivo `.wal.lock` solo mientras
+    dura un lote, así que los procesos se turnan en lugar de excluirse.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._bloqueo = open(f"{ruta}.lock", 'a+b')
+
+    @contextmanager
+    def bloqueada(self):
+        """Bloque en el que ningún otro proceso agrega ni reescribe la bitácora"""
+        if fcntl is not None:
+            fcntl.flock(self._bloqueo, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._bloqueo, fcntl.LOCK_UN)
+
+    def agregar(self, posicion: Posicion,
+                cambios: Iterable[Tuple[Any, int, Dict[str, Any]]]) -> Tuple[List[Cambio], Posicion]:
+        """Escribe (código, fila, valores) con números de secuencia nuevos y espera a que lleguen al disco.
+
+        Se llama dentro de `bloqueada` con la posición de una lectura hecha en el
+        mismo bloque, así los números de secuencia siguen a los de los demás procesos.
+        """
+        escritos = []
+        for codigo, fila, valores in cambios:
+            escritos.append(Cambio(posicion.lsn + len(escritos) + 1, codigo, fila, valores))
+        if not escritos:
+            return [], posicion
+
+        with open(self.ruta, 'ab') as archivo:
+            estado = os.fstat(archivo.fileno())
+            if posicion.inodo is not None and estado.st_ino != posicion.inodo:
+                raise RuntimeError(f"La bitácora {self.ruta} cambió mientras se escribía el lote")
+            if estado.st_size > posicion.bytes:
+                # Se descarta la cola de una escritura interrumpida para seguir agregando detrás de lo válido
+                archivo.truncate(posicion.bytes)
+            archivo.write(b''.join(c.linea() for c in escritos))
+            archivo.flush()
+            os.fsync(archivo.fileno())
+            tamano = archivo.tell()
+        if posicion.inodo is None:
+            _sincronizar_directorio(self.ruta)
+        return escritos, Posicion(estado.st_ino, tamano, escritos[-1].lsn, posicion.cantidad + len(escritos))
+
+    def leer(self) -> List[Cambio]:
+        return leer_bitacora(self.ruta)[0]
+
+    def reescribir(self, cambios: List[Cambio]) -> Posicion:
+        """Reemplaza el contenido de forma atómica, por ejemplo con la bitácora ya compactada.
+        Se llama dentro de `bloqueada`."""
+        temporal = f"{self.ruta}.tmp"
+        contenido = b''.join(c.linea() for c in cambios)
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+            inodo = os.fstat(f.fileno()).st_ino
+        os.replace(temporal, self.ruta)
+        _sincronizar_directorio(self.ruta)
+        return Posicion(inodo, len(contenido), max([0] + [c.lsn for c in cambios]), len(cambios))
+
+    def cerrar(self):
+        self._bloqueo.close()
@@ -0,0 +1,370 @@
+"""Segmento columnar compartido junto a cada archivo Excel.
+
+El DataFrame ya normalizado y validado se publica en un archivo binario
+con un formato columnar fijo, que cada worker abre con `mmap` en lugar de
+parsear el XML con openpyxl. Las columnas numéricas se usan directamente
+sobre la memoria mapeada, así que todos los workers comparten las mismas
+páginas del caché del sistema operativo. Las columnas de texto se guardan
+en UTF-8 con sus desplazamientos y se decodifican al adjuntar.
+
+Junto con las columnas se publican los arreglos de los índices que cada
+fuente declara (orden por código, posiciones por categoría, orden por
+precio y por stock), que también se usan sin copiar desde la memoria
+mapeada. Cada arreglo se nombra `<columna>/<parte>`: si un ajuste de
+carga o una actualización cambia esa columna, el arreglo deja de valer
+para esa versión y el índice se construye como siempre. Lo que depende
+del texto (el JSON de cada fila y los índices de búsqueda por nombre) se
+sigue construyendo en cada worker.
+
+El segmento se identifica por el tamaño, la fecha de modificación y el
+hash SHA-256 del Excel original, y por la huella del código que lo produjo
+(el cargador con su normalización y el cálculo de los índices): un
+despliegue que cambia ese código no adjunta segmentos del anterior. Cada versión se escribe en un archivo
+nuevo y se publica cambiando un puntero (`<excel>.snap.actual`) de forma
+atómica; los workers que ya tenían mapeado el anterior siguen leyéndolo.
+
+Para generarlo durante el despliegue:
+
+    python -m service.cache_columnar [--forzar]
+"""
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import mmap
+import os
+import struct
+import sys
+import types
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FORMATO_CACHE = 3
+_MAGIA = b'VXSNAP03'
+_ALINEACION = 64
+
+
+# Función que calcula, a partir del DataFrame normalizado, los arreglos de índice que se publican
+ConstructorArreglos = Callable[[pd.DataFrame], Dict[str, np.ndarray]]
+
+
+@dataclass
+class DatosCargados:
+    df: pd.DataFrame
+    arreglos: Dict[str, np.ndarray] = field(default_factory=dict)
+    desde_cache: bool = False
+    # SHA-256 del Excel del que salieron los datos
+    sha256: Optional[str] = None
+
+
+def _base(archivo: str) -> str:
+    base, _ = os.path.splitext(archivo)
+    return base
+
+
+def ruta_puntero(archivo: str) -> str:
+    """Archivo que indica cuál es el segmento vigente del Excel"""
+    return f"{_base(archivo)}.snap.actual"
+
+
+def ruta_cache(archivo: str) -> Optional[str]:
+    """Ruta del segmento vigente del Excel, o None si no se ha publicado ninguno"""
+    try:
+        with open(ruta_puntero(archivo), encoding='utf-8') as f:
+            nombre = f.read().strip()
+    except OSError:
+        return None
+    return os.path.join(os.path.dirname(archivo), nombre) if nombre else None
+
+
+def _hash_archivo(archivo: str) -> str:
+    sha = hashlib.sha256()
+    with open(archivo, 'rb') as f:
+        for bloque in iter(lambda: f.read(1 << 20), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def huella_codigo(*funciones: Optional[Callable]) -> str:
+    """Hash de las fuentes de los módulos que definen las funciones y de los módulos del mismo
+    paquete que usan: cambia si cambia el código que normaliza los datos o calcula los índices"""
+    modulos = set()
+    for funcion in funciones:
+        modulo = sys.modules.get(getattr(funcion, '__module__', None) or '')
+        if modulo is None:
+            continue
+        paquete = modulo.__name__.split('.')[0]
+        modulos.add(modulo.__name__)
+        for valor in vars(modulo).values():
+            nombre = valor.__name__ if isinstance(valor, types.ModuleType) else getattr(valor, '__module__', None)
+            if isinstance(nombre, str) and nombre.split('.')[0] == paquete:
+                modulos.add(nombre)
+
+    h = hashlib.sha256()
+    for nombre in sorted(modulos):
+        archivo = getattr(sys.modules.get(nombre), '__file__', None)
+        if archivo and os.path.exists(archivo):
+            h.update(nombre.encode('utf-8'))
+            with open(archivo, 'rb') as f:
+                h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def _es_texto(serie: pd.Series) -> bool:
+    if pd.api.types.is_string_dtype(serie.dtype) and serie.dtype != object:
+        return True
+    return serie.dtype == object and all(isinstance(v, str) for v in serie.dropna())
+
+
+def _alinear(desplazamiento: int) -> int:
+    return (desplazamiento + _ALINEACION - 1) // _ALINEACION * _ALINEACION
+
+
+@contextmanager
+def _bloqueo(archivo: str):
+    """Bloqueo entre procesos para que un solo worker construya el segmento mientras los demás esperan"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{_base(archivo)}.snap.lock", 'a+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _arreglo(mapa: mmap.mmap, inicio_datos: int, descriptor: Dict) -> np.ndarray:
+    return np.frombuffer(mapa, dtype=np.dtype(descriptor['dtype']), count=descriptor['cantidad'],
+                         offset=inicio_datos + descriptor['desplazamiento'])
+
+
+def leer_cache(archivo: str, huella: Optional[str] = None) -> Optional[DatosCargados]:
+    """Adjunta el segmento vigente si sigue siendo válido para el Excel y para el código
+    con la huella dada (ver `huella_codigo`), o retorna None"""
+    segmento = ruta_cache(archivo)
+    if segmento is None or not os.path.exists(segmento):
+        return None
+
+    try:
+        with open(segmento, 'rb') as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if mapa[:len(_MAGIA)] != _MAGIA:
+            return None
+        (largo,) = struct.unpack_from('<Q', mapa, len(_MAGIA))
+        inicio = len(_MAGIA) + 8
+        meta = json.loads(bytes(mapa[inicio:inicio + largo]).decode('utf-8'))
+        if meta.get('formato') != FORMATO_CACHE or meta.get('huella') != huella:
+            return None
+
+        estado = os.stat(archivo)
+        if meta['tamano'] != estado.st_size:
+            return None
+        if meta['mtime_ns'] != estado.st_mtime_ns and meta['sha256'] != _hash_archivo(archivo):
+            return None
+
+        inicio_datos = _alinear(inicio + largo)
+        columnas = {}
+        for columna in meta['columnas']:
+            if 'texto' in columna:
+                datos = bytes(_arreglo(mapa, inicio_datos, columna['texto']))
+                limites = _arreglo(mapa, inicio_datos, columna['limites']).tolist()
+                nulos = _arreglo(mapa, inicio_datos, columna['nulos']).tolist()
+                valores = [
+                    None if nulo else datos[limites[i]:limites[i + 1]].decode('utf-8')
+                    for i, nulo in enumerate(nulos)
+                ]
+                columnas[columna['nombre']] = pd.Series(valores, dtype=columna['tipo'])
+            else:
+                # Sin copia: la columna lee directamente de la memoria mapeada (solo lectura)
+                columnas[columna['nombre']] = _arreglo(mapa, inicio_datos, columna['valores'])
+
+        arreglos = {nombre: _arreglo(mapa, inicio_datos, d) for nombre, d in meta['arreglos'].items()}
+        return DatosCargados(pd.DataFrame(columnas, copy=False), arreglos, True, meta['sha256'])
+
+    except Exception as e:
+        print(f"Aviso: se ignora el segmento {segmento}: {str(e)}")
+        return None
+
+
+def columna_de_arreglo(nombre: str) -> str:
+    """Columna de la que depende un arreglo publicado: lo que va antes de la última '/' de su nombre"""
+    return nombre.rpartition('/')[0]
+
+
+def _misma_columna(anterior: pd.DataFrame, nuevo: pd.DataFrame, columna: str) -> bool:
+    if columna not in anterior.columns or columna not in nuevo.columns:
+        return False
+    a, b = np.asarray(anterior[columna].array), np.asarray(nuevo[columna].array)
+    return (
+        a.dtype == b.dtype and a.shape == b.shape and a.strides == b.strides
+        and a.__array_interface__['data'][0] == b.__array_interface__['data'][0]
+    )
+
+
+def arreglos_vigentes(arreglos: Dict[str, np.ndarray], anterior: pd.DataFrame,
+                      nuevo: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Los arreglos de `anterior` que siguen valiendo para `nuevo`: aquellos cuya columna
+    es la misma memoria en ambos (no se reemplazó al reaplicar la bitácora ni al actualizar)"""
+    columnas = {columna_de_arreglo(n) for n in arreglos}
+    iguales = {c for c in columnas if _misma_columna(anterior, nuevo, c)}
+    return {n: a for n, a in arreglos.items() if columna_de_arreglo(n) in iguales}
+
+
+def _calcular_arreglos(df: pd.DataFrame, indices: Optional[ConstructorArreglos]) -> Dict[str, np.ndarray]:
+    return indices(df) if indices is not None else {}
+
+
+def guardar_cache(archivo: str, df: pd.DataFrame, indices: Optional[ConstructorArreglos] = None,
+                  huella: Optional[str] = None) -> bool:
+    """Escribe un segmento nuevo, con los arreglos de `indices` y la huella del código que lo produjo, y lo publica.
+    Retorna False si el DataFrame no se puede guardar"""
+    bloques = []
+    columnas = []
+
+    def agregar(arreglo: np.ndarray) -> Dict:
+        arreglo = np.ascontiguousarray(arreglo)
+        bloques.append(arreglo)
+        return {'dtype': arreglo.dtype.str, 'cantidad': int(arreglo.size), 'bloque': len(bloques) - 1}
+
+    for nombre in df.columns:
+        serie = df[nombre]
+        descriptor = {'nombre': str(nombre), 'tipo': str(serie.dtype)}
+        if _es_texto(serie):
+            codificados = [v.encode('utf-8') if isinstance(v, str) else b'' for v in serie.tolist()]
+            limites = np.zeros(len(codificados) + 1, dtype=np.int64)
+            np.cumsum([len(c) for c in codificados], out=limites[1:])
+            descriptor['texto'] = agregar(np.frombuffer(b''.join(codificados), dtype=np.uint8))
+            descriptor['limites'] = agregar(limites)
+            descriptor['nulos'] = agregar(serie.isna().to_numpy().astype(np.uint8))
+        elif serie.dtype == object or not isinstance(serie.dtype, np.dtype):
+            # Columnas con tipos mezclados o de extensión no tienen un formato binario fijo
+            return False
+        else:
+            descriptor['valores'] = agregar(serie.to_numpy())
+        columnas.append(descriptor)
+
+    # Los arreglos de objetos de Python no tienen representación binaria: se recalculan al adjuntar
+    arreglos = {
+        nombre: agregar(arreglo) for nombre, arreglo in _calcular_arreglos(df, indices).items()
+        if arreglo.dtype != object
+    }
+
+    estado = os.stat(archivo)
+    sha = _hash_archivo(archivo)
+    meta = {
+        'formato': FORMATO_CACHE,
+        'tamano': estado.st_size,
+        'mtime_ns': estado.st_mtime_ns,
+        'sha256': sha,
+        'huella': huella,
+        'columnas': columnas,
+        'arreglos': arreglos,
+    }
+
+    # Los desplazamientos son relativos al inicio de la sección de datos, que empieza
+    # alineada justo después del encabezado
+    descriptores = [d for c in columnas for d in c.values() if isinstance(d, dict)] + list(arreglos.values())
+    bloques_ordenados = [bloques[d['bloque']] for d in descriptores]
+    posicion = 0
+    for d in descriptores:
+        d['desplazamiento'] = posicion
+        posicion = _alinear(posicion + bloques[d.pop('bloque')].nbytes)
+    encabezado = json.dumps(meta).encode('utf-8')
+    inicio_datos = _alinear(len(_MAGIA) + 8 + len(encabezado))
+
+    directorio = os.path.dirname(archivo)
+    nombre = f"{os.path.basename(_base(archivo))}.{sha[:16]}.{os.getpid()}.snap"
+    segmento = os.path.join(directorio, nombre)
+    temporal = f"{segmento}.tmp"
+    with open(temporal, 'wb') as f:
+        f.write(_MAGIA)
+        f.write(struct.pack('<Q', len(encabezado)))
+        f.write(encabezado)
+        for d, bloque in zip(descriptores, bloques_ordenados):
+            f.write(b'\0' * (inicio_datos + d['desplazamiento'] - f.tell()))
+            f.write(bloque.tobytes())
+    os.replace(temporal, segmento)
+
+    # Publicar: cambiar el puntero es atómico; luego se borran los segmentos viejos
+    puntero_temporal = f"{ruta_puntero(archivo)}.{os.getpid()}.tmp"
+    with open(puntero_temporal, 'w', encoding='utf-8') as f:
+        f.write(nombre)
+    os.replace(puntero_temporal, ruta_puntero(archivo))
+
+    for viejo in glob.glob(os.path.join(glob.escape(directorio), f"{glob.escape(os.path.basename(_base(archivo)))}.*.snap")):
+        if os.path.basename(viejo) != nombre:
+            try:
+                os.remove(viejo)
+            except OSError:
+                # En Windows no se puede borrar un archivo que otro proceso tiene mapeado
+                pass
+    return True
+
+
+def reemplazar_cache(archivo: str, df: pd.DataFrame, indices: Optional[ConstructorArreglos] = None,
+                     huella: Optional[str] = None) -> bool:
+    """Publica un segmento con el DataFrame dado aunque el vigente siga siendo válido, sin competir con otra carga"""
+    with _bloqueo(archivo):
+        return guardar_cache(archivo, df, indices, huella)
+
+
+def cargar_con_cache(archivo: str, cargador: Callable[[str], pd.DataFrame], forzar: bool = False,
+                     indices: Optional[ConstructorArreglos] = None, huella: Optional[str] = None) -> DatosCargados:
+    """Adjunta el segmento vigente o, si no es válido, carga el Excel con el cargador y publica uno nuevo.
+
+    Solo un proceso a la vez construye el segmento; los demás esperan y lo adjuntan.
+    """
+    if not forzar:
+        datos = leer_cache(archivo, huella)
+        if datos is not None:
+            return datos
+
+    with _bloqueo(archivo):
+        if not forzar:
+            # Otro worker pudo haberlo publicado mientras se esperaba el bloqueo
+            datos = leer_cache(archivo, huella)
+            if datos is not None:
+                return datos
+
+        df = cargador(archivo)
+        try:
+            if guardar_cache(archivo, df, indices, huella):
+                datos = leer_cache(archivo, huella)
+                if datos is not None:
+                    return DatosCargados(datos.df, datos.arreglos, False, datos.sha256)
+        except OSError as e:
+            print(f"Aviso: no se pudo escribir el segmento de {archivo}: {str(e)}")
+        return DatosCargados(df, _calcular_arreglos(df, indices), False, _hash_archivo(archivo))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera los segmentos columnares de los archivos Excel del servicio")
+    parser.add_argument('--forzar', action='store_true', help="regenera el segmento aunque siga siendo válido")
+    args = parser.parse_args()
+
+    # Importar los servicios registra sus fuentes en el registro de snapshots
+    importlib.import_module('service.inventario_service')
+    importlib.import_module('service.imagen_service')
+    from service.snapshot_service import registro
+
+    for clave, fuente in registro.fuentes().items():
+        datos = cargar_con_cache(fuente.archivo, fuente.cargador, forzar=args.forzar, indices=fuente.indices,
+                                 huella=fuente.huella)
+        estado = "vigente" if datos.desde_cache else "generado"
+        print(f"{clave}: segmento {estado} en {ruta_cache(fuente.archivo)}")
+
+
+if __name__ == '__main__':
+    main()
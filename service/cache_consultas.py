@@ -0,0 +1,120 @@
+"""Caché de respuestas de la IA.
+
+Las entradas se identifican por la versión del snapshot del inventario y la
+pregunta normalizada (junto con los campos pedidos, si la respuesta se proyecta). Cuando llega una versión nueva se descartan todas las
+anteriores. Si varias peticiones hacen la misma pregunta a la vez, solo la
+primera calcula la respuesta y las demás esperan su resultado.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Calculo:
+    """Respuesta que se está calculando, compartida por las peticiones que la esperan"""
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.resultado = None
+        self.error = None
+
+
+class CacheConsultas:
+    """Caché LRU con expiración por tiempo y agrupación de peticiones idénticas en curso"""
+
+    def __init__(self, max_entradas: int = 512, ttl: float = 300.0):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._en_curso: Dict[Hashable, _Calculo] = {}
+        self._version = None
+        self._lock = threading.Lock()
+        self._contadores = {
+            "aciertos": 0,
+            "fallos": 0,
+            "agrupadas": 0,
+            "expiradas": 0,
+            "desalojadas": 0,
+            "invalidadas": 0,
+        }
+
+    def obtener(self, version: int, pregunta: Hashable, calcular: Callable[[], Any]) -> Any:
+        """Retorna la respuesta guardada para (versión, pregunta) o la calcula una sola vez"""
+        with self._lock:
+            if self._version is not None and version < self._version:
+                # Petición que leyó un snapshot ya reemplazado: se responde sin tocar la caché
+                obsoleta = True
+            else:
+                obsoleta = False
+                if version != self._version:
+                    self._contadores["invalidadas"] += len(self._entradas)
+                    self._entradas.clear()
+                    self._version = version
+
+        if obsoleta:
+            return calcular()
+
+        with self._lock:
+
+            entrada = self._entradas.get(pregunta)
+            if entrada is not None:
+                expira, resultado = entrada
+                if expira > time.monotonic():
+                    self._entradas.move_to_end(pregunta)
+                    self._contadores["aciertos"] += 1
+                    return resultado
+                del self._entradas[pregunta]
+                self._contadores["expiradas"] += 1
+
+            calculo = self._en_curso.get(pregunta)
+            propio = calculo is None
+            if propio:
+                calculo = _Calculo()
+                self._en_curso[pregunta] = calculo
+                self._contadores["fallos"] += 1
+            else:
+                self._contadores["agrupadas"] += 1
+
+        if not propio:
+            calculo.evento.wait()
+            if calculo.error is not None:
+                raise calculo.error
+            return calculo.resultado
+
+        try:
+            calculo.resultado = calcular()
+        except Exception as e:
+            # Los errores no se guardan: la siguiente petición vuelve a intentarlo
+            calculo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._en_curso[pregunta]
+                if calculo.error is None and version == self._version:
+                    self._entradas[pregunta] = (time.monotonic() + self.ttl, calculo.resultado)
+                    self._entradas.move_to_end(pregunta)
+                    while len(self._entradas) > self.max_entradas:
+                        self._entradas.popitem(last=False)
+                        self._contadores["desalojadas"] += 1
+            calculo.evento.set()
+
+        return calculo.resultado
+
+    def limpiar(self):
+        """Descarta las respuestas guardadas; los cálculos en curso terminan normalmente"""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._contadores,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl_segundos": self.ttl,
+                "version": self._version,
+            }
+
+
+cache_consultas = CacheConsultas()
@@ -0,0 +1,86 @@
+"""Caché de respuestas ya serializadas a JSON y comprimidas.
+
+Las entradas se identifican por la versión del snapshot y la ruta con sus
+parámetros, así que una recarga del Excel las deja obsoletas sin tener que
+invalidarlas a mano. Brotli es opcional: solo se usa si el paquete
+`brotli` está instalado.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Optional, Tuple
+
+from service.almacen_registros import codificar_json
+from service.metricas import fase
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+@dataclass(frozen=True)
+class EntradaRespuesta:
+    cuerpo: bytes
+    gzip: bytes
+    br: Optional[bytes]
+    etag: str
+
+    def variante(self, codificacion: Optional[str]) -> Tuple[bytes, str]:
+        """Cuerpo y ETag de la variante con esa codificación ("gzip", "br" o None).
+
+        Cada variante lleva su propio ETag fuerte: son bytes distintos y un
+        caché intermedio no debe confundirlos.
+        """
+        if codificacion is None:
+            return self.cuerpo, self.etag
+        contenido = self.gzip if codificacion == "gzip" else self.br
+        return contenido, self.etag[:-1] + "-" + codificacion + '"'
+
+
+def serializar(datos: Any) -> EntradaRespuesta:
+    """Codifica los datos a JSON compacto y precalcula sus variantes comprimidas"""
+    cuerpo = codificar_json(datos)
+    etag = '"' + hashlib.blake2b(cuerpo, digest_size=16).hexdigest() + '"'
+    with fase('compresion'):
+        return EntradaRespuesta(
+            cuerpo=cuerpo,
+            gzip=gzip.compress(cuerpo, compresslevel=6),
+            br=brotli.compress(cuerpo) if brotli is not None else None,
+            etag=etag,
+        )
+
+
+class CacheRespuestas:
+    """Caché LRU acotada de respuestas serializadas"""
+
+    def __init__(self, max_entradas: int = 256):
+        self.max_entradas = max_entradas
+        self._entradas: "OrderedDict[Hashable, EntradaRespuesta]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: Hashable, generar: Callable[[], Any]) -> EntradaRespuesta:
+        """Retorna la entrada de la clave o la genera. La clave debe incluir la versión del snapshot."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                return entrada
+
+        entrada = serializar(generar())
+
+        with self._lock:
+            self._entradas[clave] = entrada
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+        return entrada
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+cache_respuestas = CacheRespuestas()
@@ -0,0 +1,351 @@
+"""Historial de cambios fila a fila entre versiones de un snapshot.
+
+Cada versión que se publica se compara con la anterior por código: filas
+agregadas, códigos eliminados y campos modificados. Las diferencias se
+guardan en un historial acotado para que los clientes pidan solo lo que
+cambió desde la versión que ya tienen en lugar de descargar todo de nuevo.
+
+Las versiones se entregan como `<época>:<secuencia>` y son las mismas en
+todos los workers y después de un reinicio: la época es el comienzo del
+SHA-256 del Excel cargado y la secuencia, el último cambio de la bitácora
+aplicado (ver service.bitacora). Un worker que no publicó la versión exacta
+que trae el cliente (porque leyó de una vez varios cambios de otro worker)
+parte de la anterior que sí publicó: las diferencias que vienen de la
+bitácora incluyen todas las filas escritas, aunque hayan vuelto a su valor,
+así que también llevan a la versión actual desde las intermedias.
+"""
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from service.indices import indice_codigo, registros
+from service.metricas import duracion_cargas
+from service.snapshot_service import Snapshot
+
+
+@dataclass(frozen=True)
+class Diferencia:
+    """Cambios entre dos versiones, por código.
+
+    - `agregados`: filas completas de cada código nuevo o cuyas filas se reemplazan
+      (por ejemplo, un código repetido en el Excel); quien las recibe descarta las
+      filas que tenía con ese código y pone estas.
+    - `modificados`: campos con su valor nuevo, para códigos de una sola fila.
+    - `eliminados`: códigos que ya no están.
+    """
+    agregados: Dict[Any, List[Dict[str, Any]]] = field(default_factory=dict)
+    modificados: Dict[Any, Dict[str, Any]] = field(default_factory=dict)
+    eliminados: Tuple[Any, ...] = ()
+
+    def __len__(self) -> int:
+        return len(self.agregados) + len(self.modificados) + len(self.eliminados)
+
+    def como_dict(self, campos: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        """Con `campos`, las filas agregadas traen solo esos campos y de las
+        modificadas solo se informan los cambios en ellos"""
+        agregados = [fila for filas in self.agregados.values() for fila in filas]
+        modificados = self.modificados.items()
+        if campos is not None:
+            agregados = [{c: fila[c] for c in campos} for fila in agregados]
+            modificados = [(codigo, {c: v for c, v in cambios.items() if c in campos}) for codigo, cambios in modificados]
+        return {
+            "agregados": agregados,
+            "modificados": [{"código": codigo, "campos": cambios} for codigo, cambios in modificados if cambios],
+            "eliminados": list(self.eliminados),
+        }
+
+
+@dataclass(frozen=True)
+class Secuencia:
+    """Posición de un snapshot en la bitácora, que se guarda como su estructura derivada 'secuencia'.
+
+    `numero` es el último cambio aplicado. Si la versión se publicó desde la
+    bitácora, `filas` son los campos escritos en cada posición.
+    """
+    numero: int
+    filas: Optional[Dict[int, Iterable[str]]] = None
+
+
+# Versión de un snapshot: época (comienzo del SHA-256 del Excel) y número de secuencia
+Etiqueta = Tuple[str, int]
+
+
+def etiqueta(snapshot: Snapshot) -> Etiqueta:
+    secuencia = snapshot.derivados_calculados().get('secuencia') or Secuencia(0)
+    return (snapshot.origen or '')[:16], secuencia.numero
+
+
+def _mismo_arreglo(a: np.ndarray, b: np.ndarray) -> bool:
+    """True si los dos arreglos son la misma memoria (una columna que la versión nueva heredó sin copiar)"""
+    return (
+        a.dtype == b.dtype and a.shape == b.shape and a.strides == b.strides
+        and a.__array_interface__['data'][0] == b.__array_interface__['data'][0]
+    )
+
+
+def _arreglo(df: pd.DataFrame, columna: str) -> np.ndarray:
+    """Datos de la columna sin convertir; `to_numpy` en una columna de texto revisa los nulos y copia todo"""
+    return np.asarray(df[columna].array)
+
+
+def _distintos(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Máscara de posiciones con valor distinto; dos nulos se consideran iguales"""
+    if a.dtype.kind in 'iufb' and b.dtype.kind in 'iufb':
+        distintos = a != b
+        if a.dtype.kind == 'f' and b.dtype.kind == 'f':
+            distintos &= ~(np.isnan(a) & np.isnan(b))
+        return distintos
+    distintos = np.asarray(a != b, dtype=bool)
+    return distintos & ~(pd.isna(a) & pd.isna(b))
+
+
+def _ocurrencias(codigos: np.ndarray) -> pd.DataFrame:
+    """Código y número de aparición de cada fila (0 para la primera), con su posición"""
+    serie = pd.Series(codigos)
+    return pd.DataFrame({
+        'código': serie,
+        'ocurrencia': serie.groupby(serie, dropna=False).cumcount(),
+        'posicion': np.arange(len(serie)),
+    })
+
+
+def diferencia(anterior: Snapshot, nuevo: Snapshot,
+               escritas: Optional[Dict[int, Iterable[str]]] = None) -> Optional[Diferencia]:
+    """Cambios de `anterior` a `nuevo`, o None si no se pueden comparar (por ejemplo, cambiaron las columnas).
+
+    Las filas se emparejan por código y, si un código se repite, por orden de
+    aparición. Si los códigos están en el mismo orden se comparan las columnas
+    directamente, y las que la versión nueva heredó sin copiar ni se miran.
+    Los campos de `escritas` (por posición) se incluyen aunque no hayan cambiado.
+    """
+    df_anterior, df_nuevo = anterior.df, nuevo.df
+    columnas = [str(c) for c in df_nuevo.columns]
+    if columnas != [str(c) for c in df_anterior.columns] or 'código' not in columnas:
+        return None
+
+    codigos_anteriores = _arreglo(df_anterior, 'código')
+    codigos_nuevos = _arreglo(df_nuevo, 'código')
+    alineados = (
+        _mismo_arreglo(codigos_anteriores, codigos_nuevos)
+        or (len(codigos_anteriores) == len(codigos_nuevos) and np.array_equal(codigos_anteriores, codigos_nuevos))
+    )
+
+    if alineados:
+        posiciones_anteriores = posiciones_nuevas = None
+        reemplazados: List[Any] = []
+        quitados: List[Any] = []
+    else:
+        cruce = _ocurrencias(codigos_anteriores).merge(
+            _ocurrencias(codigos_nuevos), on=['código', 'ocurrencia'], how='outer',
+            suffixes=('_anterior', '_nueva'), indicator=True,
+        )
+        ambas = cruce[cruce['_merge'] == 'both']
+        posiciones_anteriores = ambas['posicion_anterior'].to_numpy(dtype=np.int64)
+        posiciones_nuevas = ambas['posicion_nueva'].to_numpy(dtype=np.int64)
+        reemplazados = cruce.loc[cruce['_merge'] == 'right_only', 'código'].tolist()
+        quitados = cruce.loc[cruce['_merge'] == 'left_only', 'código'].tolist()
+
+    # Posiciones (en la versión nueva) que cambiaron y en qué columnas
+    campos_por_posicion: Dict[int, List[str]] = {}
+    for columna in columnas:
+        if columna == 'código':
+            continue
+        valores_anteriores = _arreglo(df_anterior, columna)
+        valores_nuevos = _arreglo(df_nuevo, columna)
+        if alineados:
+            if _mismo_arreglo(valores_anteriores, valores_nuevos):
+                continue
+            cambiadas = np.flatnonzero(_distintos(valores_anteriores, valores_nuevos))
+        else:
+            distintos = _distintos(valores_anteriores[posiciones_anteriores], valores_nuevos[posiciones_nuevas])
+            cambiadas = posiciones_nuevas[distintos]
+        for posicion in cambiadas.tolist():
+            campos_por_posicion.setdefault(posicion, []).append(columna)
+    if alineados and escritas:
+        for posicion, campos in escritas.items():
+            cambiados = campos_por_posicion.setdefault(posicion, [])
+            cambiados.extend(c for c in campos if c not in cambiados and c in columnas)
+
+    indice_anterior, indice_nuevo = indice_codigo(anterior), indice_codigo(nuevo)
+    almacen = registros(nuevo)
+    agregados: Dict[Any, List[Dict[str, Any]]] = {}
+    modificados: Dict[Any, Dict[str, Any]] = {}
+    eliminados: Dict[Any, None] = {}
+
+    for codigo in reemplazados + quitados:
+        posiciones = indice_nuevo.buscar(codigo)
+        if posiciones:
+            agregados[codigo] = [almacen.fila(p) for p in posiciones]
+        else:
+            eliminados[codigo] = None
+
+    for posicion, campos in campos_por_posicion.items():
+        codigo = almacen.fila(posicion, ('código',))['código']
+        if codigo in agregados:
+            continue
+        posiciones = indice_nuevo.buscar(codigo)
+        if len(posiciones) == 1 and len(indice_anterior.buscar(codigo)) == 1:
+            modificados[codigo] = almacen.fila(posicion, tuple(campos))
+        else:
+            agregados[codigo] = [almacen.fila(p) for p in posiciones]
+
+    return Diferencia(agregados, modificados, tuple(eliminados))
+
+
+def componer(diferencias: List[Diferencia]) -> Diferencia:
+    """Una sola diferencia equivalente a aplicar las dadas en orden"""
+    agregados: Dict[Any, List[Dict[str, Any]]] = {}
+    modificados: Dict[Any, Dict[str, Any]] = {}
+    eliminados: Dict[Any, None] = {}
+    for d in diferencias:
+        for codigo in d.eliminados:
+            agregados.pop(codigo, None)
+            modificados.pop(codigo, None)
+            eliminados[codigo] = None
+        for codigo, filas in d.agregados.items():
+            eliminados.pop(codigo, None)
+            modificados.pop(codigo, None)
+            agregados[codigo] = filas
+        for codigo, campos in d.modificados.items():
+            if codigo in agregados:
+                # Solo se modifican campos de códigos de una sola fila
+                agregados[codigo] = [{**agregados[codigo][0], **campos}]
+            else:
+                modificados[codigo] = {**modificados.get(codigo, {}), **campos}
+    return Diferencia(agregados, modificados, tuple(eliminados))
+
+
+@dataclass(frozen=True)
+class ResultadoCambios:
+    """Versión vigente y las diferencias que llevan hasta ella, o None si hay que resincronizar.
+    Las diferencias se componen recién al serializar, así una respuesta en caché no las recalcula."""
+    version: str
+    diferencias: Optional[Tuple[Diferencia, ...]]
+    motivo: Optional[str] = None
+    # Proyección de las filas al serializar (None: todos los campos)
+    campos: Optional[Tuple[str, ...]] = None
+
+    @property
+    def resincronizar(self) -> bool:
+        return self.diferencias is None
+
+    def como_dict(self) -> Dict[str, Any]:
+        if self.diferencias is None:
+            return {"version": self.version, "resincronizar": True, "motivo": self.motivo}
+        return {"version": self.version, "resincronizar": False,
+                **componer(list(self.diferencias)).como_dict(self.campos)}
+
+
+class HistorialCambios:
+    """Diferencias entre versiones consecutivas de una fuente, acotadas en versiones y en cambios guardados.
+
+    Se registra con `RegistroSnapshots.al_publicar`, después del observador
+    que deja la `Secuencia` en cada snapshot cargado. Si una versión no se
+    puede comparar con la anterior, o cambia más filas de las que caben, el
+    historial vuelve a empezar en ella. `sincronizar` se llama antes de cada
+    consulta para publicar lo que otros workers ya escribieron en la
+    bitácora, y retorna el último número de secuencia leído.
+    """
+
+    def __init__(self, max_versiones: int = 256, max_cambios: int = 100000,
+                 sincronizar: Optional[Callable[[], Optional[int]]] = None):
+        self.max_versiones = max_versiones
+        self.max_cambios = max_cambios
+        self.sincronizar = sincronizar
+        # Versión desde la que el historial está completo, última versión registrada y su snapshot
+        self._inicio: Optional[Etiqueta] = None
+        self._ultima: Optional[Etiqueta] = None
+        self._snapshot: Optional[int] = None
+        # Versión a la que lleva cada diferencia y si viene de la bitácora (sirve desde las intermedias)
+        self._diferencias: Deque[Tuple[Etiqueta, Diferencia, bool]] = deque()
+        self._cambios = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, anterior: Optional[Snapshot], nuevo: Snapshot):
+        """Compara la versión que se va a publicar con la vigente y guarda la diferencia"""
+        if nuevo.df is None:
+            with self._lock:
+                self._reiniciar(None, None)
+            return
+
+        version = etiqueta(nuevo)
+        escritas = getattr(nuevo.derivados_calculados().get('secuencia'), 'filas', None)
+        d = None
+        if anterior is not None and anterior.df is not None and anterior.version == self._snapshot:
+            inicio = time.perf_counter()
+            try:
+                d = diferencia(anterior, nuevo, escritas)
+            except Exception:
+                # Sin la diferencia, quien tenga una versión anterior debe resincronizar
+                with self._lock:
+                    self._reiniciar(version, nuevo.version)
+                raise
+            duracion_cargas.observar(time.perf_counter() - inicio, fuente=nuevo.clave, etapa='diferencia')
+
+        with self._lock:
+            if d is None or len(d) > self.max_cambios:
+                self._reiniciar(version, nuevo.version)
+                return
+            self._diferencias.append((version, d, escritas is not None))
+            self._cambios += len(d)
+            self._ultima, self._snapshot = version, nuevo.version
+            while len(self._diferencias) > self.max_versiones or self._cambios > self.max_cambios:
+                descartada_hasta, descartada, _ = self._diferencias.popleft()
+                self._cambios -= len(descartada)
+                self._inicio = descartada_hasta
+
+    def _reiniciar(self, version: Optional[Etiqueta], snapshot: Optional[int]):
+        self._diferencias.clear()
+        self._cambios = 0
+        self._inicio = self._ultima = version
+        self._snapshot = snapshot
+
+    @staticmethod
+    def token(version: Etiqueta) -> str:
+        return f"{version[0]}:{version[1]}"
+
+    def desde(self, token: Optional[str]) -> ResultadoCambios:
+        """Cambios desde la versión del token hasta la vigente, o la indicación de resincronizar"""
+        leida = self.sincronizar() if self.sincronizar is not None else None
+        with self._lock:
+            ultima, inicio = self._ultima, self._inicio
+            diferencias = list(self._diferencias)
+        if ultima is None:
+            raise RuntimeError("Todavía no hay una versión publicada de los datos.")
+        actual = self.token(ultima)
+
+        if not token:
+            return ResultadoCambios(actual, None, "No se indicó la versión de partida.")
+        epoca, _, numero = token.partition(':')
+        try:
+            numero = int(numero)
+        except ValueError:
+            raise ValueError(f"La versión '{token}' no es válida. Use la que retornó la última consulta de cambios.")
+
+        versiones = [inicio] + [v for v, _, _ in diferencias]
+        for k in range(len(versiones) - 1, -1, -1):
+            if versiones[k][0] != epoca or versiones[k][1] > numero:
+                continue
+            if versiones[k][1] == numero:
+                return ResultadoCambios(actual, tuple(d for _, d, _ in diferencias[k:]))
+            if k < len(diferencias):
+                # El cliente está entre esta versión y la siguiente
+                (siguiente_epoca, _), _, desde_bitacora = diferencias[k]
+                if siguiente_epoca == epoca and desde_bitacora:
+                    return ResultadoCambios(actual, tuple(d for _, d, _ in diferencias[k:]))
+            elif leida is not None and numero <= leida:
+                # Otro worker publicó cambios de la bitácora que aquí no cambiaron ningún valor
+                return ResultadoCambios(token, ())
+            break
+
+        if epoca == ultima[0] and numero > ultima[1]:
+            return ResultadoCambios(actual, None, f"La versión {numero} no existe.")
+        if not any(v[0] == epoca for v in versiones):
+            return ResultadoCambios(actual, None, "La versión es de otro Excel (se reemplazó o se regeneró al "
+                                                  "compactar la bitácora) o ya no está en el historial de cambios.")
+        return ResultadoCambios(actual, None, f"La versión {numero} ya no está en el historial de cambios.")
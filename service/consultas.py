@@ -0,0 +1,336 @@
+"""Motor de consultas combinadas sobre el inventario.
+
+Una consulta junta cualquier combinación de filtros (categoría, texto,
+rango de precio y de stock) con un orden, una proyección de campos y un
+límite. El texto se busca literal (la descripción contiene el texto) o por
+relevancia (palabras con tolerancia a errores, de la más a la menos
+relevante). El planificador estima cuántas filas deja pasar cada filtro con su
+índice, materializa primero el más selectivo y aplica los demás sobre esos
+candidatos, ya sea intersecando posiciones o comprobando fila por fila,
+lo que resulte más barato. Nunca se construyen máscaras sobre todo el
+DataFrame.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from service.agregados import indice_precios
+from service.almacen_registros import SeleccionRegistros
+from service.indices import IndiceRango, indice_descripcion, particion_categorias, registros
+from service.metricas import fase
+from service.normalizacion import normalizar_texto
+from service.relevancia import indice_relevancia, mejores
+from service.snapshot_service import Snapshot
+
+COLUMNA_STOCK = 's._ent'
+ORDENES = ('asc', 'desc')
+MODOS_TEXTO = ('literal', 'relevancia')
+# Resultados de una búsqueda por relevancia cuando no se indica límite
+LIMITE_RELEVANCIA = 20
+# Claves de orden con nombre propio; además se puede ordenar por cualquier columna del Excel
+ALIAS_ORDEN = {'precio': None, 'stock': COLUMNA_STOCK}
+
+
+@dataclass(frozen=True)
+class Consulta:
+    categoria: Optional[str] = None
+    texto: Optional[str] = None
+    precio_min: Optional[float] = None
+    precio_max: Optional[float] = None
+    stock_min: Optional[float] = None
+    stock_max: Optional[float] = None
+    ordenar_por: Optional[str] = None
+    orden: str = 'asc'
+    campos: Optional[Tuple[str, ...]] = None
+    limite: Optional[int] = None
+    modo: str = 'literal'
+
+    def validar(self):
+        if self.categoria is not None and len(self.categoria.strip()) < 2:
+            raise ValueError("El nombre de la categoría debe tener al menos 2 caracteres.")
+        if self.texto is not None and len(self.texto.strip()) < 2:
+            raise ValueError("El término de búsqueda debe tener al menos 2 caracteres.")
+        if self.precio_min is not None and self.precio_max is not None and self.precio_min > self.precio_max:
+            raise ValueError("El precio mínimo no puede ser mayor que el máximo.")
+        if self.stock_min is not None and self.stock_max is not None and self.stock_min > self.stock_max:
+            raise ValueError("El stock mínimo no puede ser mayor que el máximo.")
+        if self.orden not in ORDENES:
+            raise ValueError("El orden debe ser 'asc' o 'desc'.")
+        if self.limite is not None and self.limite <= 0:
+            raise ValueError("El límite debe ser un número entero positivo.")
+        if self.modo not in MODOS_TEXTO:
+            raise ValueError(f"El modo de búsqueda debe ser uno de: {', '.join(MODOS_TEXTO)}")
+        if self.modo == 'relevancia' and self.texto is None:
+            raise ValueError("La búsqueda por relevancia necesita un término de búsqueda.")
+
+    @property
+    def filtra_precio(self) -> bool:
+        return self.precio_min is not None or self.precio_max is not None
+
+    @property
+    def filtra_stock(self) -> bool:
+        return self.stock_min is not None or self.stock_max is not None
+
+
+@dataclass(frozen=True)
+class PasoPlan:
+    filtro: str
+    estimado: int
+    estrategia: str
+
+
+@dataclass
+class ResultadoConsulta:
+    total: int
+    productos: SeleccionRegistros
+    plan: List[PasoPlan] = field(default_factory=list)
+    # Puntaje de cada producto, en el mismo orden, si se buscó por relevancia
+    puntajes: Optional[List[float]] = None
+
+    def como_dict(self) -> Dict:
+        resultado = {
+            "total": self.total,
+            "cantidad": len(self.productos),
+            "plan": [{"filtro": p.filtro, "estimado": p.estimado, "estrategia": p.estrategia} for p in self.plan],
+            "productos": self.productos,
+        }
+        if self.puntajes is not None:
+            resultado["puntajes"] = self.puntajes
+        return resultado
+
+
+def indice_stock(snapshot: Snapshot) -> Optional[IndiceRango]:
+    """Índice de rango sobre las unidades en stock, o None si el Excel no tiene esa columna"""
+    return snapshot.derivado(
+        'indice_stock',
+        lambda df: IndiceRango(df, COLUMNA_STOCK, arreglos=snapshot.arreglos) if COLUMNA_STOCK in df.columns else None,
+    )
+
+
+def valores_numericos(snapshot: Snapshot, columna: str) -> np.ndarray:
+    """Valores de la columna como float (NaN si no son numéricos), calculados una sola vez por snapshot.
+
+    Para el precio y el stock se reutilizan los de sus índices de rango.
+    """
+    for indice in (indice_precios(snapshot), indice_stock(snapshot)):
+        if indice is not None and indice.columna == columna:
+            return indice.valores
+    return snapshot.derivado(
+        f'numericos:{columna}',
+        lambda df: pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=float),
+    )
+
+
+class _Filtro:
+    """Un filtro de la consulta con el índice que lo resuelve"""
+
+    nombre = ''
+
+    def estimar(self) -> int:
+        raise NotImplementedError
+
+    def posiciones(self) -> np.ndarray:
+        """Todas las filas que pasan el filtro, en orden de fila"""
+        raise NotImplementedError
+
+    def aplicar(self, candidatos: np.ndarray) -> Tuple[np.ndarray, str]:
+        """Los candidatos que pasan el filtro y la estrategia usada"""
+        raise NotImplementedError
+
+
+class _FiltroCategoria(_Filtro):
+    nombre = 'categoria'
+
+    def __init__(self, snapshot: Snapshot, categoria: str):
+        self._posiciones = particion_categorias(snapshot).posiciones(categoria)
+
+    def estimar(self) -> int:
+        return len(self._posiciones)
+
+    def posiciones(self) -> np.ndarray:
+        return self._posiciones
+
+    def aplicar(self, candidatos):
+        return np.intersect1d(candidatos, self.posiciones(), assume_unique=True), 'interseccion'
+
+
+class _FiltroTexto(_Filtro):
+    nombre = 'texto'
+
+    def __init__(self, snapshot: Snapshot, texto: str):
+        self._indice = indice_descripcion(snapshot)
+        self._texto = texto
+
+    def estimar(self) -> int:
+        return self._indice.estimar(self._texto)
+
+    def posiciones(self) -> np.ndarray:
+        return np.array(self._indice.buscar(self._texto), dtype=np.int64)
+
+    def aplicar(self, candidatos):
+        # Comprobar el texto de cada candidato nunca es más caro que recorrer las listas de trigramas
+        return self._indice.filtrar(self._texto, candidatos), 'verificacion'
+
+
+class _FiltroRelevancia(_Filtro):
+    nombre = 'texto'
+
+    def __init__(self, snapshot: Snapshot, texto: str):
+        self.puntajes = indice_relevancia(snapshot).puntajes(texto)
+        self._posiciones = np.flatnonzero(self.puntajes > 0)
+
+    def estimar(self) -> int:
+        return len(self._posiciones)
+
+    def posiciones(self) -> np.ndarray:
+        return self._posiciones
+
+    def aplicar(self, candidatos):
+        return candidatos[self.puntajes[candidatos] > 0], 'verificacion'
+
+
+class _FiltroRango(_Filtro):
+    def __init__(self, nombre: str, indice: IndiceRango, minimo: Optional[float], maximo: Optional[float]):
+        self.nombre = nombre
+        self._indice = indice
+        self._minimo = minimo
+        self._maximo = maximo
+
+    def estimar(self) -> int:
+        return self._indice.contar(self._minimo, self._maximo)
+
+    def posiciones(self) -> np.ndarray:
+        return np.sort(self._indice.buscar(self._minimo, self._maximo))
+
+    def aplicar(self, candidatos):
+        return self._indice.filtrar(candidatos, self._minimo, self._maximo), 'verificacion'
+
+
+def _filtros(snapshot: Snapshot, consulta: Consulta) -> List[_Filtro]:
+    df = snapshot.df
+    filtros: List[_Filtro] = []
+    if consulta.categoria is not None:
+        if 'categoría' not in df.columns:
+            raise KeyError("La columna 'categoría' no existe en el archivo Excel.")
+        filtros.append(_FiltroCategoria(snapshot, consulta.categoria))
+    if consulta.texto is not None:
+        if 'descripción' not in df.columns:
+            raise KeyError("La columna 'descripción' no existe en el archivo Excel.")
+        if consulta.modo == 'relevancia':
+            filtros.append(_FiltroRelevancia(snapshot, consulta.texto))
+        else:
+            filtros.append(_FiltroTexto(snapshot, consulta.texto))
+    if consulta.filtra_precio:
+        indice = indice_precios(snapshot)
+        if indice is None:
+            raise KeyError("No existe una columna de precio en el archivo Excel.")
+        filtros.append(_FiltroRango('precio', indice, consulta.precio_min, consulta.precio_max))
+    if consulta.filtra_stock:
+        indice = indice_stock(snapshot)
+        if indice is None:
+            raise KeyError(f"La columna '{COLUMNA_STOCK}' no existe en el archivo Excel.")
+        filtros.append(_FiltroRango('stock', indice, consulta.stock_min, consulta.stock_max))
+    return filtros
+
+
+def _resolver_orden(snapshot: Snapshot, ordenar_por: str) -> str:
+    if ordenar_por == 'precio':
+        indice = indice_precios(snapshot)
+        if indice is None:
+            raise KeyError("No existe una columna de precio en el archivo Excel.")
+        return indice.columna
+    columna = ALIAS_ORDEN.get(ordenar_por, ordenar_por)
+    if columna not in snapshot.df.columns:
+        opciones = list(ALIAS_ORDEN) + [str(c) for c in snapshot.df.columns]
+        raise ValueError(f"No se puede ordenar por '{ordenar_por}'. Use uno de: {', '.join(opciones)}")
+    return columna
+
+
+def _ordenar(snapshot: Snapshot, candidatos: np.ndarray, columna: str, orden: str,
+             limite: Optional[int]) -> np.ndarray:
+    """Ordena los candidatos por la columna; en empate se conserva el orden de fila.
+
+    Las filas sin valor (y, en la columna de precio, las de precio en cero)
+    quedan al final en ambos sentidos. Con límite solo se ordena el top-k.
+    """
+    serie = snapshot.df[columna]
+    if pd.api.types.is_numeric_dtype(serie.dtype):
+        indice = indice_precios(snapshot)
+        solo_positivos = indice is not None and indice.columna == columna
+        valores = valores_numericos(snapshot, columna)[candidatos]
+        validas = np.isfinite(valores) & (valores > 0) if solo_positivos else np.isfinite(valores)
+        con_valor, sin_valor = candidatos[validas], candidatos[~validas]
+        claves = valores[validas] if orden == 'asc' else -valores[validas]
+
+        if limite is not None and limite < len(con_valor):
+            # Top-k: se separan los k menores en O(n) y solo esos se ordenan.
+            # Los empatados con el k-ésimo se incluyen para desempatar por posición.
+            corte = np.partition(claves, limite - 1)[limite - 1]
+            elegidas = np.flatnonzero(claves <= corte)
+            con_valor, claves = con_valor[elegidas], claves[elegidas]
+
+        ordenadas = con_valor[np.lexsort((con_valor, claves))]
+        return np.concatenate([ordenadas, sin_valor])
+
+    textos = [normalizar_texto(v) for v in serie.to_numpy()[candidatos].tolist()]
+    orden_textos = sorted(range(len(textos)), key=textos.__getitem__, reverse=(orden == 'desc'))
+    return candidatos[np.array(orden_textos, dtype=np.int64)] if orden_textos else candidatos
+
+
+def ejecutar(snapshot: Snapshot, consulta: Consulta) -> ResultadoConsulta:
+    """Resuelve la consulta sobre el snapshot con el plan más selectivo"""
+    consulta.validar()
+    almacen = registros(snapshot)
+    with fase('indice'):
+        total, posiciones, plan, puntajes = _resolver(snapshot, consulta, len(almacen))
+    return ResultadoConsulta(total, almacen.seleccion(posiciones.tolist(), consulta.campos), plan,
+                             None if puntajes is None else [round(float(p), 4) for p in puntajes])
+
+
+def _resolver(snapshot: Snapshot, consulta: Consulta,
+              filas: int) -> Tuple[int, np.ndarray, List[PasoPlan], Optional[np.ndarray]]:
+    """Total de filas que cumplen los filtros, posiciones a devolver (ordenadas y limitadas), plan usado
+    y, si se buscó por relevancia, el puntaje de cada posición devuelta"""
+    filtros = _filtros(snapshot, consulta)
+    relevancia = next((f for f in filtros if isinstance(f, _FiltroRelevancia)), None)
+    columna_orden = _resolver_orden(snapshot, consulta.ordenar_por) if consulta.ordenar_por else None
+
+    precio = indice_precios(snapshot)
+    if (columna_orden is not None and precio is not None and columna_orden == precio.columna
+            and [f.nombre for f in filtros] in ([], ['precio'])
+            and (filtros or (consulta.limite is not None and consulta.limite <= precio.contar()))):
+        # Orden por precio sin más filtros que el de precio: el índice ya da el resultado ordenado.
+        # Sin filtros solo aplica si el top-k no llega a las filas sin precio, que van al final.
+        total = precio.contar(consulta.precio_min, consulta.precio_max) if filtros else filas
+        posiciones = precio.buscar(consulta.precio_min, consulta.precio_max, consulta.orden, consulta.limite)
+        return total, posiciones, [PasoPlan('precio', total, 'indice_ordenado')], None
+
+    estimados = sorted(((f.estimar(), i, f) for i, f in enumerate(filtros)), key=lambda e: e[:2])
+    plan = []
+    if estimados:
+        estimado, _, primero = estimados[0]
+        candidatos = primero.posiciones()
+        plan.append(PasoPlan(primero.nombre, estimado, 'indice'))
+        for estimado, _, filtro in estimados[1:]:
+            if len(candidatos) == 0:
+                break
+            candidatos, estrategia = filtro.aplicar(candidatos)
+            plan.append(PasoPlan(filtro.nombre, estimado, estrategia))
+    else:
+        candidatos = np.arange(filas, dtype=np.int64)
+        plan.append(PasoPlan('todos', filas, 'recorrido'))
+
+    total = len(candidatos)
+    limite = consulta.limite
+    if relevancia is not None and limite is None:
+        limite = LIMITE_RELEVANCIA
+    if columna_orden is not None:
+        candidatos = _ordenar(snapshot, candidatos, columna_orden, consulta.orden, limite)
+    elif relevancia is not None:
+        # Sin otro orden pedido, de la más a la menos relevante; solo se ordena el top-k
+        candidatos = mejores(relevancia.puntajes, candidatos, limite)
+    if limite is not None:
+        candidatos = candidatos[:limite]
+    return total, candidatos, plan, None if relevancia is None else relevancia.puntajes[candidatos]
@@ -0,0 +1,192 @@
+"""Exportación masiva de un snapshot en CSV, NDJSON, Arrow IPC o Parquet.
+
+Las filas salen por lotes directamente de las columnas del snapshot: cada
+lote es una rebanada de las columnas (o una selección, si hay filtros) y se
+escribe en el formato pedido antes de pasar al siguiente, así que la
+memoria no crece con el tamaño del inventario. No se crea un diccionario
+por fila: el NDJSON completo reutiliza el JSON ya calculado de cada fila y
+Arrow y Parquet toman las columnas numéricas sin copiarlas.
+
+Arrow y Parquet son opcionales: solo están disponibles si el paquete
+`pyarrow` está instalado.
+"""
+import io
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from service.almacen_registros import json_filas, validar_campos
+from service.indices import particion_categorias, registros
+from service.snapshot_service import Snapshot
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    ipc = None
+    pq = None
+
+TIPOS_CONTENIDO = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'parquet': 'application/vnd.apache.parquet',
+}
+EXTENSIONES = {'csv': 'csv', 'ndjson': 'ndjson', 'arrow': 'arrows', 'parquet': 'parquet'}
+_FORMATOS_ARROW = ('arrow', 'parquet')
+
+
+def posiciones_por_categorias(snapshot: Snapshot, categorias: Sequence[str]) -> np.ndarray:
+    """Posiciones de las filas de cualquiera de las categorías, en el orden del Excel"""
+    particion = particion_categorias(snapshot)
+    arreglos = [particion.arreglo(c) for c in categorias]
+    if not arreglos:
+        return np.empty(0, dtype=np.int64)
+    return np.unique(np.concatenate(arreglos))
+
+
+def exportar(snapshot: Snapshot, formato: str, campos: Optional[Sequence[str]] = None,
+             posiciones: Optional[np.ndarray] = None, tamano_lote: int = 10000) -> Iterator[bytes]:
+    """Genera el snapshot (o las `posiciones` dadas, en ese orden) lote a lote en el formato pedido.
+
+    Los parámetros se validan antes de empezar, para que un error llegue como
+    tal y no a mitad de la descarga.
+    """
+    if formato not in TIPOS_CONTENIDO:
+        raise ValueError(f"Formato no soportado: '{formato}'. Use uno de: {', '.join(TIPOS_CONTENIDO)}")
+    if formato in _FORMATOS_ARROW and pa is None:
+        raise ValueError(f"El formato '{formato}' requiere el paquete pyarrow, que no está instalado.")
+    if tamano_lote <= 0:
+        raise ValueError("El tamaño del lote debe ser un número entero positivo.")
+
+    df = snapshot.df
+    campos = validar_campos(campos, df.columns)
+    if campos is not None:
+        campos = list(campos)
+
+    total = len(df) if posiciones is None else len(posiciones)
+    tramos = [(inicio, min(inicio + tamano_lote, total)) for inicio in range(0, total, tamano_lote)]
+
+    def lote(inicio: int, fin: int) -> pd.DataFrame:
+        filas = df.iloc[inicio:fin] if posiciones is None else df.take(posiciones[inicio:fin])
+        return filas if campos is None else filas[campos]
+
+    if formato == 'ndjson':
+        return _ndjson(snapshot, campos, posiciones, tramos, lote)
+    if formato == 'csv':
+        return _csv(df if campos is None else df[campos], tramos, lote)
+    return _arrow(df if campos is None else df[campos], formato, tramos, lote)
+
+
+def _ndjson(snapshot: Snapshot, campos, posiciones, tramos, lote) -> Iterator[bytes]:
+    if campos is None:
+        # Las filas completas ya están codificadas en el snapshot
+        almacen = registros(snapshot)
+        for inicio, fin in tramos:
+            indices = range(inicio, fin) if posiciones is None else posiciones[inicio:fin].tolist()
+            yield b''.join(almacen.json_fila(p) + b'\n' for p in indices)
+        return
+    for inicio, fin in tramos:
+        yield b''.join(fila + b'\n' for fila in json_filas(lote(inicio, fin)))
+
+
+def _csv(columnas: pd.DataFrame, tramos, lote) -> Iterator[bytes]:
+    if not tramos:
+        yield columnas.head(0).to_csv(index=False).encode('utf-8')
+        return
+    for numero, (inicio, fin) in enumerate(tramos):
+        yield lote(inicio, fin).to_csv(index=False, header=numero == 0).encode('utf-8')
+
+
+class _Salida(io.RawIOBase):
+    """Archivo en memoria que entrega lo escrito y lo olvida; pyarrow escribe aquí cada lote"""
+
+    def __init__(self):
+        super().__init__()
+        self._partes: List[bytes] = []
+        self._posicion = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, datos) -> int:
+        datos = bytes(datos)
+        self._partes.append(datos)
+        self._posicion += len(datos)
+        return len(datos)
+
+    def tell(self) -> int:
+        return self._posicion
+
+    def vaciar(self) -> bytes:
+        contenido = b''.join(self._partes)
+        self._partes.clear()
+        return contenido
+
+
+_TIPOS_INFERIDOS = {
+    'string': 'string',
+    'empty': 'string',
+    'integer': 'int64',
+    'floating': 'float64',
+    'mixed-integer-float': 'float64',
+    'boolean': 'bool',
+}
+
+
+def _esquema(columnas: pd.DataFrame):
+    """Esquema Arrow de las columnas y las que hay que convertir a texto (objetos de tipos mezclados).
+
+    Se fija antes del primer lote: un lote con solo nulos no puede cambiar el
+    tipo de la columna a mitad del archivo.
+    """
+    tipos = []
+    a_texto = []
+    for columna in columnas.columns:
+        serie = columnas[columna]
+        if isinstance(serie.dtype, np.dtype) and serie.dtype.kind in 'iufbM':
+            tipo = pa.from_numpy_dtype(serie.dtype)
+        else:
+            inferido = _TIPOS_INFERIDOS.get(pd.api.types.infer_dtype(serie, skipna=True))
+            if inferido is None:
+                a_texto.append(columna)
+                inferido = 'string'
+            tipo = pa.type_for_alias(inferido)
+        tipos.append(pa.field(str(columna), tipo))
+    return pa.schema(tipos), a_texto
+
+
+def _arrow(columnas: pd.DataFrame, formato: str, tramos, lote) -> Iterator[bytes]:
+    esquema, a_texto = _esquema(columnas)
+
+    def registro_arrow(filas: pd.DataFrame):
+        if a_texto:
+            filas = filas.assign(**{
+                c: filas[c].map(lambda v: None if pd.isna(v) else str(v)) for c in a_texto
+            })
+        return pa.RecordBatch.from_pandas(filas, schema=esquema, preserve_index=False)
+
+    def generar():
+        salida = _Salida()
+        escritor = ipc.new_stream(salida, esquema) if formato == 'arrow' else pq.ParquetWriter(salida, esquema)
+        try:
+            for inicio, fin in tramos:
+                if formato == 'arrow':
+                    escritor.write_batch(registro_arrow(lote(inicio, fin)))
+                else:
+                    # Cada lote es un grupo de filas del Parquet
+                    escritor.write_batch(registro_arrow(lote(inicio, fin)), row_group_size=fin - inicio)
+                yield salida.vaciar()
+        finally:
+            escritor.close()
+        yield salida.vaciar()
+
+    return generar()
+
+
+def cabeceras_descarga(nombre: str, formato: str) -> Dict[str, str]:
+    """Cabeceras para que el navegador guarde la exportación como `<nombre>.<extensión>`"""
+    return {"Content-Disposition": f'attachment; filename="{nombre}.{EXTENSIONES[formato]}"'}
@@ -1,7 +1,33 @@
 import re
-from typing import Dict, List, Any
-import pandas as pd
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from service.almacen_registros import SeleccionRegistros
+from service.cache_consultas import cache_consultas
+from service.consultas import Consulta
+from service.indices import particion_categorias
+from service.intenciones import ClasificadorPreguntas
+from service.metricas import duracion_intenciones, fase
 from service.inventario_service import InventarioService
+from service.normalizacion import normalizar_pregunta
+from service.snapshot_service import registro
+
+# Productos que se muestran al buscar por nombre: los más relevantes
+LIMITE_BUSQUEDA = 20
+
+# Palabras que no forman parte del nombre de un producto al buscar por nombre
+PALABRAS_EXCLUIR = {'buscar', 'busca', 'dame', 'muestra', 'muestrame', 'ver', 'productos', 'producto',
+                    'de', 'del', 'la', 'el', 'los', 'las', 'un', 'una', 'con', 'para', 'por', 'que',
+                    'hay', 'tienes', 'quiero', 'necesito'}
+
+
+def _como_listas(valor: Any) -> Any:
+    """La respuesta con las selecciones de registros convertidas en listas de diccionarios:
+    así se puede serializar con `json` y la caché no retiene los registros de un snapshot viejo"""
+    if isinstance(valor, SeleccionRegistros):
+        return list(valor)
+    if isinstance(valor, dict):
+        return {clave: _como_listas(v) for clave, v in valor.items()}
+    return valor
 
 
 class IAService:
@@ -20,27 +46,51 @@ class IAService:
             'filtrar': ['entre', 'rango', 'mayor', 'menor', 'desde', 'hasta']
         }
 
-    def procesar_consulta(self, pregunta: str) -> Dict[str, Any]:
-        """Procesa una pregunta en lenguaje natural y retorna una respuesta estructurada"""
+    def procesar_consulta(self, pregunta: str, campos: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Procesa una pregunta en lenguaje natural y retorna una respuesta estructurada.
+
+        Las respuestas se guardan por versión del inventario y pregunta normalizada,
+        y se calculan a partir de esa forma normalizada para que dos preguntas con la
+        misma clave reciban siempre la misma respuesta. Con `campos`, los productos
+        de la respuesta traen solo esas columnas.
+        """
+        
+        pregunta_normalizada = normalizar_pregunta(pregunta)
+        with fase('ia'), registro.vista_consistente():
+            campos = self.inventario_service.validar_campos(campos)
+            version = self.inventario_service.snapshot.version
+            # Cada proyección de la misma pregunta es una respuesta distinta en la caché
+            clave = pregunta_normalizada if campos is None else (pregunta_normalizada, campos)
+            return cache_consultas.obtener(version, clave, lambda: self._responder(pregunta_normalizada, campos))
+
+    def _responder(self, pregunta: str, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """Calcula la respuesta y registra cuánto tardó según la intención detectada"""
         
-        pregunta_lower = pregunta.lower()
+        inicio = time.perf_counter()
+        resultado = _como_listas(self._ejecutar_intencion(pregunta, campos))
+        duracion_intenciones.observar(time.perf_counter() - inicio, intencion=resultado.get("intencion_detectada", "desconocida"))
+        return resultado
+
+    def _ejecutar_intencion(self, pregunta: str, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """Detecta la intención de la pregunta (ya normalizada) y ejecuta la consulta correspondiente.
+        `campos` es la proyección de los productos que se devuelven"""
         
         # Detectar intención
-        intencion = self._detectar_intencion(pregunta_lower)
+        intencion = self._detectar_intencion(pregunta)
         
         # Ejecutar según la intención detectada
         if intencion == 'contar':
-            return self._contar_productos(pregunta_lower)
+            return self._contar_productos(pregunta, campos)
         elif intencion == 'categorias':
-            return self._listar_categorias(pregunta_lower)
+            return self._listar_categorias(pregunta)
         elif intencion == 'precio':
-            return self._analizar_precios(pregunta_lower)
+            return self._analizar_precios(pregunta, campos)
         elif intencion == 'estadisticas':
-            return self._calcular_estadisticas(pregunta_lower)
+            return self._calcular_estadisticas(pregunta)
         elif intencion == 'filtrar':
-            return self._filtrar_productos(pregunta_lower)
+            return self._filtrar_productos(pregunta, campos)
         elif intencion == 'buscar':
-            return self._buscar_productos(pregunta_lower)
+            return self._buscar_productos(pregunta, campos)
         else:
             return {
                 "respuesta": "No entendí tu consulta. Intenta preguntar sobre productos, categorías, precios o cantidades.",
@@ -48,35 +98,26 @@ class IAService:
                 "datos": []
             }
 
+    def _clasificador(self) -> ClasificadorPreguntas:
+        """Autómata de intenciones y categorías, compilado una sola vez por snapshot del inventario"""
+        snapshot = self.inventario_service.snapshot
+
+        def compilar(df):
+            categorias = particion_categorias(snapshot).categorias() if df is not None and 'categoría' in df.columns else []
+            return ClasificadorPreguntas(self.intenciones, categorias)
+
+        return snapshot.derivado('clasificador_ia', compilar)
+
     def _detectar_intencion(self, pregunta: str) -> str:
         """Detecta la intención de la pregunta basándose en palabras clave"""
         
-        puntuaciones = {}
-        
-        for intencion, palabras_clave in self.intenciones.items():
-            puntuacion = sum(1 for palabra in palabras_clave if palabra in pregunta)
-            puntuaciones[intencion] = puntuacion
-        
-        # Retornar la intención con mayor puntuación
-        if max(puntuaciones.values()) > 0:
-            return max(puntuaciones, key=puntuaciones.get)
-        
-        return 'buscar'  # Intención por defecto
+        intencion = self._clasificador().analizar(pregunta).intencion
+        return intencion or 'buscar'  # Intención por defecto
 
     def _extraer_categoria(self, pregunta: str) -> str:
         """Extrae el nombre de una categoría de la pregunta"""
         
-        # Obtener todas las categorías disponibles
-        df = self.inventario_service.df
-        if df is not None and 'categoría' in df.columns:
-            categorias = df['categoría'].dropna().unique()
-            
-            # Buscar si alguna categoría está mencionada en la pregunta
-            for cat in categorias:
-                if cat.lower() in pregunta:
-                    return cat
-        
-        return None
+        return self._clasificador().analizar(pregunta).categoria
 
     def _extraer_numeros(self, pregunta: str) -> List[float]:
         """Extrae números de la pregunta"""
@@ -84,14 +125,15 @@ class IAService:
         numeros = re.findall(r'\d+(?:\.\d+)?', pregunta)
         return [float(num) for num in numeros]
 
-    def _contar_productos(self, pregunta: str) -> Dict[str, Any]:
+    def _contar_productos(self, pregunta: str, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
         """Cuenta productos según criterios"""
         
         categoria = self._extraer_categoria(pregunta)
         
         if categoria:
-            productos = self.inventario_service.buscar_por_categoria(categoria)
-            cantidad = len(productos)
+            resultado = self.inventario_service.buscar(Consulta(categoria=categoria, campos=campos))
+            productos = resultado.productos
+            cantidad = resultado.total
             return {
                 "respuesta": f"Hay {cantidad} producto(s) en la categoría '{categoria}'",
                 "intencion_detectada": "contar",
@@ -102,8 +144,7 @@ class IAService:
                 }
             }
         else:
-            productos = self.inventario_service.listar_todo()
-            cantidad = len(productos)
+            cantidad = self.inventario_service.contar_productos()
             return {
                 "respuesta": f"Hay {cantidad} productos en total en el inventario",
                 "intencion_detectada": "contar",
@@ -115,21 +156,21 @@ class IAService:
     def _listar_categorias(self, pregunta: str) -> Dict[str, Any]:
         """Lista las categorías disponibles"""
         
-        df = self.inventario_service.df
-        if df is not None and 'categoría' in df.columns:
-            categorias = df['categoría'].dropna().unique().tolist()
-            categorias_limpias = [cat for cat in categorias if cat != '']
-            
-            if categorias_limpias:
-                categorias_texto = ", ".join(categorias_limpias)
-                return {
-                    "respuesta": f"Las categorías disponibles son: {categorias_texto}",
-                    "intencion_detectada": "categorias",
-                    "datos": {
-                        "categorias": categorias_limpias,
-                        "total": len(categorias_limpias)
-                    }
+        try:
+            categorias_limpias = self.inventario_service.listar_categorias()
+        except (RuntimeError, KeyError):
+            categorias_limpias = []
+        
+        if categorias_limpias:
+            categorias_texto = ", ".join(categorias_limpias)
+            return {
+                "respuesta": f"Las categorías disponibles son: {categorias_texto}",
+                "intencion_detectada": "categorias",
+                "datos": {
+                    "categorias": categorias_limpias,
+                    "total": len(categorias_limpias)
                 }
+            }
         
         return {
             "respuesta": "No se encontraron categorías en el inventario",
@@ -137,7 +178,7 @@ class IAService:
             "datos": {"categorias": []}
         }
 
-    def _analizar_precios(self, pregunta: str) -> Dict[str, Any]:
+    def _analizar_precios(self, pregunta: str, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
         """Analiza precios (más caro, más barato, etc.)"""
         
         df = self.inventario_service.df
@@ -148,12 +189,8 @@ class IAService:
                 "datos": []
             }
         
-        # Buscar columna de precio (puede tener diferentes nombres)
-        columna_precio = None
-        for col in df.columns:
-            if 'precio' in col.lower() or 'valor' in col.lower() or 'costo' in col.lower():
-                columna_precio = col
-                break
+        agregados = self.inventario_service.obtener_agregados()
+        columna_precio = agregados.columna_precio
         
         if columna_precio is None:
             return {
@@ -162,41 +199,64 @@ class IAService:
                 "datos": []
             }
         
-        # Determinar si busca el más caro o más barato
-        if 'caro' in pregunta or 'mayor' in pregunta or 'máximo' in pregunta or 'maximo' in pregunta:
-            producto_max = df.loc[df[columna_precio].idxmax()].to_dict()
-            precio = producto_max.get(columna_precio, 0)
-            nombre = producto_max.get('descripción', 'Producto')
-            
+        # Determinar si busca el más caro o más barato (la pregunta ya viene sin tildes)
+        if 'caro' in pregunta or 'mayor' in pregunta or 'maximo' in pregunta:
+            return self._extremos_de_precio(pregunta, columna_precio, 'desc', 'caro', campos)
+        
+        elif 'barato' in pregunta or 'menor' in pregunta or 'economico' in pregunta or 'minimo' in pregunta:
+            return self._extremos_de_precio(pregunta, columna_precio, 'asc', 'barato', campos)
+        
+        # Por defecto, mostrar rango de precios
+        precios = agregados.precio
+        if not precios.cantidad:
             return {
-                "respuesta": f"El producto más caro es '{nombre}' con un precio de ${precio:,.0f}",
+                "respuesta": "No se encontró información de precios en el inventario",
                 "intencion_detectada": "precio",
-                "datos": producto_max
+                "datos": []
             }
         
-        elif 'barato' in pregunta or 'menor' in pregunta or 'económico' in pregunta or 'economico' in pregunta or 'mínimo' in pregunta or 'minimo' in pregunta:
-            df_filtrado = df[df[columna_precio] > 0]  # Excluir precios 0
-            if not df_filtrado.empty:
-                producto_min = df_filtrado.loc[df_filtrado[columna_precio].idxmin()].to_dict()
-                precio = producto_min.get(columna_precio, 0)
-                nombre = producto_min.get('descripción', 'Producto')
-                
-                return {
-                    "respuesta": f"El producto más barato es '{nombre}' con un precio de ${precio:,.0f}",
-                    "intencion_detectada": "precio",
-                    "datos": producto_min
-                }
+        return {
+            "respuesta": f"Los precios van desde ${precios.minimo:,.0f} hasta ${precios.maximo:,.0f}",
+            "intencion_detectada": "precio",
+            "datos": {
+                "precio_minimo": precios.minimo,
+                "precio_maximo": precios.maximo
+            }
+        }
+
+    def _extremos_de_precio(self, pregunta: str, columna_precio: str, orden: str, adjetivo: str,
+                            campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
+        """Top N de productos más caros o más baratos desde el índice de precios ("los 5 más caros").
+        La respuesta se redacta con las filas completas; `campos` solo recorta los productos devueltos"""
         
-        # Por defecto, mostrar rango de precios
-        precio_min = df[df[columna_precio] > 0][columna_precio].min()
-        precio_max = df[columna_precio].max()
+        numeros = self._extraer_numeros(pregunta)
+        cantidad = int(numeros[0]) if numeros and 1 <= numeros[0] <= 100 else 1
+        productos = self.inventario_service.buscar(Consulta(ordenar_por='precio', orden=orden, limite=cantidad)).productos
+        
+        if not productos:
+            return {
+                "respuesta": "No se encontró información de precios en el inventario",
+                "intencion_detectada": "precio",
+                "datos": []
+            }
+        
+        if cantidad == 1:
+            producto = productos[0]
+            precio = producto.get(columna_precio, 0)
+            nombre = producto.get('descripción', 'Producto')
+            return {
+                "respuesta": f"El producto más {adjetivo} es '{nombre}' con un precio de ${precio:,.0f}",
+                "intencion_detectada": "precio",
+                "datos": producto if campos is None else productos.proyectar(campos)[0]
+            }
         
+        nombres = ", ".join(f"'{p.get('descripción', 'Producto')}' (${p.get(columna_precio, 0):,.0f})" for p in productos)
         return {
-            "respuesta": f"Los precios van desde ${precio_min:,.0f} hasta ${precio_max:,.0f}",
+            "respuesta": f"Los {len(productos)} productos más {adjetivo}s son: {nombres}",
             "intencion_detectada": "precio",
             "datos": {
-                "precio_minimo": float(precio_min),
-                "precio_maximo": float(precio_max)
+                "cantidad": len(productos),
+                "productos": productos.proyectar(campos)
             }
         }
 
@@ -211,29 +271,24 @@ class IAService:
                 "datos": {}
             }
         
-        # Buscar columna de precio
-        columna_precio = None
-        for col in df.columns:
-            if 'precio' in col.lower() or 'valor' in col.lower():
-                columna_precio = col
-                break
+        agregados = self.inventario_service.obtener_agregados()
+        precios = agregados.precio
+        columna_precio = agregados.columna_precio if precios is not None and precios.cantidad else None
         
         estadisticas = {
-            "total_productos": len(df)
+            "total_productos": agregados.total_productos
         }
         
         if columna_precio:
-            precios = df[df[columna_precio] > 0][columna_precio]
             estadisticas.update({
-                "precio_promedio": float(precios.mean()),
-                "precio_mediana": float(precios.median()),
-                "precio_minimo": float(precios.min()),
-                "precio_maximo": float(precios.max())
+                "precio_promedio": precios.promedio,
+                "precio_mediana": precios.mediana,
+                "precio_minimo": precios.minimo,
+                "precio_maximo": precios.maximo
             })
         
-        if 'categoría' in df.columns:
-            categorias = df['categoría'].value_counts().to_dict()
-            estadisticas["productos_por_categoria"] = categorias
+        if agregados.productos_por_categoria:
+            estadisticas["productos_por_categoria"] = agregados.productos_por_categoria
         
         respuesta = f"Estadísticas del inventario:\n"
         respuesta += f"• Total de productos: {estadisticas['total_productos']}\n"
@@ -248,7 +303,7 @@ class IAService:
             "datos": estadisticas
         }
 
-    def _filtrar_productos(self, pregunta: str) -> Dict[str, Any]:
+    def _filtrar_productos(self, pregunta: str, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
         """Filtra productos por rango de precios"""
         
         numeros = self._extraer_numeros(pregunta)
@@ -268,12 +323,7 @@ class IAService:
                 "datos": []
             }
         
-        # Buscar columna de precio
-        columna_precio = None
-        for col in df.columns:
-            if 'precio' in col.lower() or 'valor' in col.lower():
-                columna_precio = col
-                break
+        columna_precio = self.inventario_service.obtener_agregados().columna_precio
         
         if columna_precio is None:
             return {
@@ -283,27 +333,41 @@ class IAService:
             }
         
         precio_min, precio_max = min(numeros[:2]), max(numeros[:2])
-        df_filtrado = df[(df[columna_precio] >= precio_min) & (df[columna_precio] <= precio_max)]
-        productos = df_filtrado.to_dict(orient='records')
+        
+        # Si la pregunta menciona una categoría, el rango se aplica solo a esa categoría
+        categoria = self._extraer_categoria(pregunta)
+        productos = self.inventario_service.buscar(Consulta(
+            categoria=categoria,
+            precio_min=precio_min,
+            precio_max=precio_max,
+            ordenar_por='precio',
+            campos=campos,
+        )).productos
+        
+        respuesta = f"Encontré {len(productos)} producto(s) entre ${precio_min:,.0f} y ${precio_max:,.0f}"
+        datos = {
+            "cantidad": len(productos),
+            "rango": {"minimo": precio_min, "maximo": precio_max},
+            "productos": productos
+        }
+        if categoria:
+            respuesta += f" en la categoría '{categoria}'"
+            datos["categoria"] = categoria
         
         return {
-            "respuesta": f"Encontré {len(productos)} producto(s) entre ${precio_min:,.0f} y ${precio_max:,.0f}",
+            "respuesta": respuesta,
             "intencion_detectada": "filtrar",
-            "datos": {
-                "cantidad": len(productos),
-                "rango": {"minimo": precio_min, "maximo": precio_max},
-                "productos": productos
-            }
+            "datos": datos
         }
 
-    def _buscar_productos(self, pregunta: str) -> Dict[str, Any]:
+    def _buscar_productos(self, pregunta: str, campos: Optional[Tuple[str, ...]] = None) -> Dict[str, Any]:
         """Busca productos por nombre o categoría"""
         
         # Primero intentar buscar por categoría
         categoria = self._extraer_categoria(pregunta)
         
         if categoria:
-            productos = self.inventario_service.buscar_por_categoria(categoria)
+            productos = self.inventario_service.buscar(Consulta(categoria=categoria, campos=campos)).productos
             return {
                 "respuesta": f"Encontré {len(productos)} producto(s) en la categoría '{categoria}'",
                 "intencion_detectada": "buscar",
@@ -314,33 +378,43 @@ class IAService:
                 }
             }
         
-        # Si no hay categoría, intentar extraer palabras clave para buscar por nombre
-        palabras_excluir = ['buscar', 'dame', 'muestra', 'ver', 'productos', 'de', 'la', 'el', 'los', 'las', 'un', 'una']
-        palabras = [p for p in pregunta.split() if p not in palabras_excluir and len(p) > 2]
+        # Si no hay categoría, buscar por nombre con todas las palabras significativas,
+        # ordenando por relevancia y tolerando errores de tipeo
+        # Tampoco cuentan los números ni las palabras de las intenciones ("entre", "hasta"...)
+        excluir = PALABRAS_EXCLUIR | {normalizar_pregunta(p) for claves in self.intenciones.values() for p in claves}
+        palabras = [p for p in pregunta.split()
+                    if p not in excluir and len(p) > 2 and not self._extraer_numeros(p)]
         
         if palabras:
-            # Buscar por la primera palabra significativa
-            palabra_busqueda = palabras[0]
-            productos = self.inventario_service.buscar_por_nombre(palabra_busqueda)
+            termino_busqueda = ' '.join(palabras)
+            resultado = self.inventario_service.buscar(Consulta(
+                texto=termino_busqueda, modo='relevancia', limite=LIMITE_BUSQUEDA, campos=campos
+            ))
+            productos = resultado.productos
             
             if productos:
+                respuesta = f"Encontré {resultado.total} producto(s) relacionado(s) con '{termino_busqueda}'"
+                if resultado.total > len(productos):
+                    respuesta += f" (mostrando los {len(productos)} más relevantes)"
                 return {
-                    "respuesta": f"Encontré {len(productos)} producto(s) relacionado(s) con '{palabra_busqueda}'",
+                    "respuesta": respuesta,
                     "intencion_detectada": "buscar",
                     "datos": {
                         "cantidad": len(productos),
-                        "termino_busqueda": palabra_busqueda,
-                        "productos": productos
+                        "total": resultado.total,
+                        "termino_busqueda": termino_busqueda,
+                        "productos": productos,
+                        "puntajes": resultado.puntajes
                     }
                 }
         
         # Si no se encontró nada específico, listar todo
-        productos = self.inventario_service.listar_todo()
+        resultado = self.inventario_service.buscar(Consulta(limite=10, campos=campos))  # Limitar a 10 para no sobrecargar
         return {
-            "respuesta": f"Mostrando todos los productos del inventario ({len(productos)} en total)",
+            "respuesta": f"Mostrando todos los productos del inventario ({resultado.total} en total)",
             "intencion_detectada": "buscar",
             "datos": {
-                "cantidad": len(productos),
-                "productos": productos[:10]  # Limitar a 10 para no sobrecargar
+                "cantidad": resultado.total,
+                "productos": resultado.productos
             }
         }
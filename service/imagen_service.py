@@ -1,66 +1,151 @@
 import pandas as pd
 import os
+from typing import List, Optional
+import numpy as np
+from service.almacen_registros import validar_campos
+from service.exportacion import exportar
+from service.indices import IndiceCodigo, indice_codigo, registros, registros_por_codigo
+from service.inventario_service import InventarioService
+from service.metricas import fase
+from service.paginacion import paginar, stream
+from service.snapshot_service import DIRECTORIO_DATOS, Snapshot, registro
+
+CLAVE_IMAGENES = 'imagenes'
+
+
+def _cargar_imagenes(archivo: str) -> pd.DataFrame:
+    return _normalizar_imagenes(pd.read_excel(archivo))
+
+
+def _normalizar_imagenes(df: pd.DataFrame) -> pd.DataFrame:
+    """Valida y normaliza la hoja de imágenes tal como viene del Excel"""
+    # Validar que el archivo no esté vacío
+    if df.empty:
+        raise ValueError("El archivo Excel de imágenes está vacío. No hay datos para cargar.")
+
+    # Normalizar nombres de columnas
+    df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
+
+    # Validar columna crítica
+    if 'código' not in df.columns:
+        raise ValueError("Falta la columna requerida 'código' en el archivo Excel de imágenes")
+
+    return df
+
+
+def _indices_compartidos(df: pd.DataFrame):
+    """Índices que se publican en el segmento columnar para que cada worker no los recalcule"""
+    return IndiceCodigo(df).arreglos()
+
+
+registro.registrar(
+    CLAVE_IMAGENES,
+    os.path.join(DIRECTORIO_DATOS, 'imagen.xlsx'),
+    _cargar_imagenes,
+    'imágenes',
+    indices=_indices_compartidos,
+)
+
+
+def _preparar_indices(snapshot: Snapshot):
+    """Construye los índices del snapshot antes de publicarlo, fuera del camino de las peticiones"""
+    registros(snapshot)
+    indice_codigo(snapshot)
+
+
+registro.al_cargar(CLAVE_IMAGENES, _preparar_indices)
+
 
 class ImagenService:
+    @property
+    def snapshot(self) -> Snapshot:
+        # El snapshot se comparte entre todas las instancias del proceso; se carga al arrancar la aplicación
+        return registro.obtener(CLAVE_IMAGENES)
 
-    def __init__(self):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        archivo = os.path.join(base_dir, '..', 'files', 'data', 'imagen.xlsx')
-
-        try:
-            df = pd.read_excel(archivo)
-            
-            # Validar que el archivo no esté vacío
-            if df.empty:
-                raise ValueError("El archivo Excel de imágenes está vacío. No hay datos para cargar.")
-            
-            # Normalizar nombres de columnas
-            df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-            
-            # Validar columna crítica
-            if 'código' not in df.columns:
-                raise ValueError("Falta la columna requerida 'código' en el archivo Excel de imágenes")
-            
-            self.df = df
-            self.error = None
-            
-        except FileNotFoundError:
-            error_msg = f"No se encontró el archivo en la ruta: {archivo}"
-            print(f"Error: {error_msg}")
-            self.df = None
-            self.error = error_msg
-            
-        except ValueError as e:
-            error_msg = f"Error de validación: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.df = None
-            self.error = error_msg
-            
-        except Exception as e:
-            error_msg = f"Error inesperado al cargar imágenes: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.df = None
-            self.error = error_msg
-
-    def listar_todo(self):
-        if self.df is None:
-            raise RuntimeError(f"No se pueden listar las imágenes. {self.error or 'Datos no disponibles'}")
-        return self.df.to_dict(orient="records")
+    @property
+    def df(self):
+        return self.snapshot.df
 
-    def buscar_por_id(self, valor_id: int):
-        if self.df is None:
-            raise RuntimeError(f"No se pueden buscar imágenes. {self.error or 'Datos no disponibles'}")
+    @property
+    def error(self):
+        return self.snapshot.error
+
+    def listar_todo(self, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden listar las imágenes. {snapshot.error or 'Datos no disponibles'}")
+        return registros(snapshot).todos().proyectar(self.validar_campos(campos))
+
+    def listar_pagina(self, cursor: Optional[str] = None, limite: int = 100, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden listar las imágenes. {snapshot.error or 'Datos no disponibles'}")
+        return paginar(snapshot, cursor, limite, campos=self.validar_campos(campos))
+
+    def listar_stream(self, formato: str = 'ndjson', tamano_lote: int = 1000, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden listar las imágenes. {snapshot.error or 'Datos no disponibles'}")
+        return stream(snapshot, formato, tamano_lote, self.validar_campos(campos))
+
+    def exportar(self, formato: str, campos: Optional[List[str]] = None, categorias: Optional[List[str]] = None,
+                 tamano_lote: int = 10000):
+        """Exporta las imágenes en streaming. `categorias` filtra por la categoría del producto en el inventario"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden exportar las imágenes. {snapshot.error or 'Datos no disponibles'}")
+        posiciones = None
+        if categorias:
+            codigos = InventarioService().codigos_por_categorias(categorias)
+            posiciones = np.flatnonzero(np.isin(snapshot.df['código'].to_numpy(), codigos))
+        return exportar(snapshot, formato, campos, posiciones, tamano_lote)
+
+    def buscar_por_id(self, valor_id: int, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden buscar imágenes. {snapshot.error or 'Datos no disponibles'}")
         
-        if 'código' not in self.df.columns:
+        if 'código' not in snapshot.df.columns:
             raise KeyError("La columna 'código' no existe en el archivo Excel.")
         
         if not isinstance(valor_id, int) or valor_id <= 0:
             raise ValueError("El código debe ser un número entero positivo.")
+        campos = self.validar_campos(campos)
         
-        resultado = self.df[self.df['código'] == valor_id]
-        return resultado.to_dict(orient="records")
-    
+        return registros_por_codigo(snapshot, valor_id).proyectar(campos)
+
+    def buscar_por_ids(self, valores_id: List[int], campos: Optional[List[str]] = None):
+        """Busca varios códigos en una sola pasada por el índice, conservando el orden de la petición"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden buscar imágenes. {snapshot.error or 'Datos no disponibles'}")
+        
+        if 'código' not in snapshot.df.columns:
+            raise KeyError("La columna 'código' no existe en el archivo Excel.")
+        
+        if any(not isinstance(valor_id, int) or valor_id <= 0 for valor_id in valores_id):
+            raise ValueError("El código debe ser un número entero positivo.")
+        campos = self.validar_campos(campos)
+        
+        indice = indice_codigo(snapshot)
+        encontrados = []
+        faltantes = []
+        with fase('indice'):
+            for valor_id in valores_id:
+                posiciones = indice.buscar(valor_id)
+                if posiciones:
+                    encontrados.extend(posiciones)
+                else:
+                    faltantes.append(valor_id)
+        return {"imagenes": registros(snapshot).seleccion(encontrados, campos), "faltantes": faltantes}
+
     def columnas_disponibles(self):
         if self.df is None:
             raise RuntimeError(f"No se puede obtener columnas. {self.error or 'Datos no disponibles'}")
         return self.df.columns.tolist()
+
+    def validar_campos(self, campos: Optional[List[str]]):
+        """Campos pedidos como tupla (None si no se pidió proyección); error si alguno no es una columna disponible"""
+        if campos is None:
+            return None
+        return validar_campos(campos, self.columnas_disponibles())
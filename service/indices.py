@@ -0,0 +1,339 @@
+"""Índices construidos una sola vez por snapshot.
+
+Se obtienen siempre a través de `Snapshot.derivado`, de modo que cada
+versión del inventario tiene los suyos y nunca se recalculan por petición.
+Los que son solo arreglos de NumPy (orden por código, posiciones por
+categoría, órdenes por rango) se pueden publicar en el segmento columnar
+con su método `arreglos()` y se adjuntan desde `Snapshot.arreglos` sin
+recalcularlos ni copiarlos.
+"""
+import copy
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from service.almacen_registros import AlmacenRegistros, SeleccionRegistros
+from service.metricas import fase
+from service.normalizacion import normalizar_texto
+from service.snapshot_service import Snapshot
+
+
+def registros(snapshot: Snapshot) -> AlmacenRegistros:
+    """Filas del snapshot en forma compacta, con su JSON precalculado, en el orden del Excel"""
+    return snapshot.derivado('registros', AlmacenRegistros)
+
+
+class IndiceCodigo:
+    """Índice código -> posiciones de fila. Un código puede tener varias filas.
+
+    Guarda las filas ordenadas de forma estable por código y los códigos en
+    ese orden; cada búsqueda es binaria y las posiciones de un código salen
+    en el orden del Excel. Los dos arreglos pueden venir del segmento columnar.
+    """
+
+    def __init__(self, df: pd.DataFrame, arreglos: Optional[Dict[str, np.ndarray]] = None):
+        arreglos = arreglos or {}
+        codigos = df['código'].to_numpy()
+        self.posiciones = arreglos.get('código/orden')
+        if self.posiciones is None:
+            self.posiciones = np.argsort(codigos, kind='stable').astype(np.int64)
+        self.codigos = arreglos.get('código/ordenados')
+        if self.codigos is None:
+            self.codigos = codigos[self.posiciones]
+
+    def arreglos(self) -> Dict[str, np.ndarray]:
+        return {'código/orden': self.posiciones, 'código/ordenados': self.codigos}
+
+    def _limites(self, codigo) -> Tuple[int, int]:
+        try:
+            return (int(np.searchsorted(self.codigos, codigo, side='left')),
+                    int(np.searchsorted(self.codigos, codigo, side='right')))
+        except (TypeError, OverflowError):
+            # Un valor que no se puede comparar con los códigos no está en el índice
+            return 0, 0
+
+    def buscar(self, codigo: int) -> Tuple[int, ...]:
+        inicio, fin = self._limites(codigo)
+        return tuple(self.posiciones[inicio:fin].tolist())
+
+    def __contains__(self, codigo: int) -> bool:
+        inicio, fin = self._limites(codigo)
+        return fin > inicio
+
+    def items(self) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        """Cada código con sus posiciones"""
+        if not len(self.codigos):
+            return
+        limites = np.flatnonzero(self.codigos[1:] != self.codigos[:-1]) + 1
+        inicios = [0] + limites.tolist()
+        fines = limites.tolist() + [len(self.codigos)]
+        codigos = self.codigos[inicios].tolist()
+        posiciones = self.posiciones.tolist()
+        for codigo, inicio, fin in zip(codigos, inicios, fines):
+            yield codigo, tuple(posiciones[inicio:fin])
+
+
+def indice_codigo(snapshot: Snapshot) -> IndiceCodigo:
+    """El mismo objeto que `orden_codigo`: el orden por código es el índice"""
+    return snapshot.derivado('indice_codigo', lambda df: orden_codigo(snapshot))
+
+
+def registros_por_codigo(snapshot: Snapshot, codigo: int) -> SeleccionRegistros:
+    """Registros con el código dado, sin recorrer el DataFrame"""
+    with fase('indice'):
+        posiciones = indice_codigo(snapshot).buscar(codigo)
+    return registros(snapshot).seleccion(posiciones)
+
+
+_SIN_POSICIONES = np.empty(0, dtype=np.int64)
+_SIN_POSICIONES.flags.writeable = False
+
+
+def _trigramas(texto: str):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceTrigramas:
+    """Índice invertido de trigramas sobre una columna de texto normalizada.
+
+    Los candidatos salen de intersecar las listas de posiciones de los
+    trigramas del término y se verifican con una búsqueda literal, así que
+    el término nunca se interpreta como expresión regular.
+    """
+
+    def __init__(self, df: pd.DataFrame, columna: str = 'descripción'):
+        self.textos = [normalizar_texto(v) for v in df[columna].tolist()]
+
+        posiciones: Dict[str, List[int]] = {}
+        for posicion, texto in enumerate(self.textos):
+            for trigrama in _trigramas(texto):
+                posiciones.setdefault(trigrama, []).append(posicion)
+        self._posiciones = {t: np.array(p, dtype=np.int32) for t, p in posiciones.items()}
+
+    def estimar(self, termino: str) -> int:
+        """Cota superior barata de los resultados: la lista de posiciones más corta entre los trigramas del término"""
+        trigramas = _trigramas(normalizar_texto(termino))
+        if not trigramas:
+            return len(self.textos)
+        return min(len(self._posiciones.get(t, ())) for t in trigramas)
+
+    def filtrar(self, termino: str, posiciones: np.ndarray) -> np.ndarray:
+        """Las posiciones dadas cuyo texto contiene el término, sin pasar por las listas de trigramas"""
+        termino = normalizar_texto(termino)
+        return np.array([p for p in posiciones.tolist() if termino in self.textos[p]], dtype=np.int64)
+
+    def buscar(self, termino: str) -> List[int]:
+        """Posiciones (en orden de fila) cuyo texto contiene el término"""
+        termino = normalizar_texto(termino)
+        if not termino:
+            return []
+
+        trigramas = _trigramas(termino)
+        if not trigramas:
+            # Términos de menos de 3 caracteres: no hay trigramas, se recorre el texto normalizado
+            return [p for p, texto in enumerate(self.textos) if termino in texto]
+
+        vacia = np.empty(0, dtype=np.int32)
+        listas = sorted((self._posiciones.get(t, vacia) for t in trigramas), key=len)
+        candidatos = listas[0]
+        for lista in listas[1:]:
+            if len(candidatos) == 0 or len(lista) > 8 * len(candidatos):
+                # Verificar los pocos candidatos restantes es más barato que seguir intersecando
+                break
+            candidatos = np.intersect1d(candidatos, lista, assume_unique=True)
+
+        return [p for p in candidatos.tolist() if termino in self.textos[p]]
+
+
+def indice_descripcion(snapshot: Snapshot) -> IndiceTrigramas:
+    return snapshot.derivado('indice_descripcion', IndiceTrigramas)
+
+
+class ParticionCategorias:
+    """Partición de las filas por categoría normalizada (minúsculas, sin tildes ni espacios extremos).
+
+    Las posiciones de todas las categorías van en un solo arreglo, una
+    categoría detrás de otra en orden de aparición, con los límites de cada
+    una; así se pueden publicar en el segmento columnar. Los nombres van
+    como JSON en UTF-8.
+    """
+
+    def __init__(self, df: pd.DataFrame, arreglos: Optional[Dict[str, np.ndarray]] = None):
+        arreglos = arreglos or {}
+        if all(f'categoría/{parte}' in arreglos for parte in ('posiciones', 'limites', 'nombres')):
+            orden = arreglos['categoría/posiciones']
+            limites = arreglos['categoría/limites'].tolist()
+            nombres = json.loads(arreglos['categoría/nombres'].tobytes().decode('utf-8'))
+        else:
+            listas: Dict[str, List[int]] = {}
+            originales: Dict[str, str] = {}
+            for posicion, categoria in enumerate(df['categoría'].tolist()):
+                clave = normalizar_texto(categoria)
+                if not clave:
+                    continue
+                # Se conserva el nombre tal como aparece la primera vez en el Excel
+                originales.setdefault(clave, categoria.strip())
+                listas.setdefault(clave, []).append(posicion)
+            nombres = list(originales.items())
+            orden = np.array([p for clave, _ in nombres for p in listas[clave]], dtype=np.int64)
+            limites = np.cumsum([0] + [len(listas[clave]) for clave, _ in nombres]).tolist()
+
+        self._nombres: Dict[str, str] = {clave: nombre for clave, nombre in nombres}
+        self._orden = orden
+        self._limites = limites
+        self._arreglos: Dict[str, np.ndarray] = {
+            clave: orden[limites[i]:limites[i + 1]] for i, (clave, _) in enumerate(nombres)
+        }
+
+    def arreglos(self) -> Dict[str, np.ndarray]:
+        nombres = json.dumps(list(self._nombres.items()), ensure_ascii=False).encode('utf-8')
+        return {
+            'categoría/posiciones': self._orden,
+            'categoría/limites': np.array(self._limites, dtype=np.int64),
+            'categoría/nombres': np.frombuffer(nombres, dtype=np.uint8),
+        }
+
+    def posiciones(self, categoria: str) -> np.ndarray:
+        """Posiciones de las filas de la categoría, en el orden del Excel"""
+        return self.arreglo(categoria)
+
+    def arreglo(self, categoria: str) -> np.ndarray:
+        return self._arreglos.get(normalizar_texto(categoria), _SIN_POSICIONES)
+
+    def contar(self, categoria: str) -> int:
+        return len(self.arreglo(categoria))
+
+    def nombre(self, categoria: str):
+        """Nombre original de la categoría, o None si no existe"""
+        return self._nombres.get(normalizar_texto(categoria))
+
+    def categorias(self) -> List[str]:
+        """Nombres de las categorías en orden de aparición"""
+        return list(self._nombres.values())
+
+    def conteos(self) -> Dict[str, int]:
+        return {nombre: len(self._arreglos[clave]) for clave, nombre in self._nombres.items()}
+
+
+def particion_categorias(snapshot: Snapshot) -> ParticionCategorias:
+    return snapshot.derivado('particion_categorias', lambda df: ParticionCategorias(df, snapshot.arreglos))
+
+
+class OrdenCodigo(IndiceCodigo):
+    """Orden estable de las filas por código, usado para paginar con cursor y para buscar por código"""
+
+    def inicio_desde_cursor(self, codigo, consumidas: int) -> int:
+        """Posición en el orden donde continúa la página siguiente a (código, filas ya entregadas de ese código)"""
+        izquierda = int(np.searchsorted(self.codigos, codigo, side='left'))
+        derecha = int(np.searchsorted(self.codigos, codigo, side='right'))
+        return min(izquierda + consumidas, derecha)
+
+    def cursor_en(self, indice: int) -> str:
+        """Cursor que apunta justo después del elemento `indice` del orden"""
+        codigo = self.codigos[indice]
+        consumidas = indice - int(np.searchsorted(self.codigos, codigo, side='left')) + 1
+        return f"{codigo}:{consumidas}"
+
+
+def orden_codigo(snapshot: Snapshot) -> OrdenCodigo:
+    return snapshot.derivado('orden_codigo', lambda df: OrdenCodigo(df, snapshot.arreglos))
+
+
+class IndiceRango:
+    """Posiciones de fila ordenadas por el valor numérico de una columna.
+
+    Los rangos se resuelven con búsqueda binaria, en O(log n + k). Los valores
+    no numéricos (y, con `solo_positivos`, los ceros y negativos) no se indexan.
+    """
+
+    def __init__(self, df: pd.DataFrame, columna: str, solo_positivos: bool = False,
+                 arreglos: Optional[Dict[str, np.ndarray]] = None):
+        self.columna = columna
+        self.solo_positivos = solo_positivos
+        publicados = [(arreglos or {}).get(nombre) for nombre in self._nombres_arreglos()]
+        if all(a is not None for a in publicados):
+            self.valores, self.posiciones, self.valores_ordenados = publicados
+            return
+        self.valores = pd.to_numeric(df[columna], errors='coerce').to_numpy(dtype=float)
+        validas = self._validas(self.valores)
+        posiciones_validas = np.flatnonzero(validas)
+        self.posiciones = posiciones_validas[np.argsort(self.valores[posiciones_validas], kind='stable')]
+        self.valores_ordenados = self.valores[self.posiciones]
+
+    def _nombres_arreglos(self) -> Tuple[str, str, str]:
+        tipo = 'positivos' if self.solo_positivos else 'rango'
+        return (f'{self.columna}/valores', f'{self.columna}/{tipo}_posiciones', f'{self.columna}/{tipo}_valores')
+
+    def arreglos(self) -> Dict[str, np.ndarray]:
+        return dict(zip(self._nombres_arreglos(), (self.valores, self.posiciones, self.valores_ordenados)))
+
+    def _validas(self, valores: np.ndarray) -> np.ndarray:
+        validas = np.isfinite(valores)
+        if self.solo_positivos:
+            validas &= valores > 0
+        return validas
+
+    def _ubicar(self, valores_ordenados: np.ndarray, posiciones: np.ndarray, valor: float, posicion: int) -> int:
+        """Lugar de (valor, posición) en el orden: por valor y, entre valores iguales, por posición"""
+        inicio = int(np.searchsorted(valores_ordenados, valor, side='left'))
+        fin = int(np.searchsorted(valores_ordenados, valor, side='right'))
+        return inicio + int(np.searchsorted(posiciones[inicio:fin], posicion))
+
+    def con_cambios(self, df: pd.DataFrame, posiciones: Iterable[int]) -> 'IndiceRango':
+        """Índice de un DataFrame que solo difiere de este en las filas dadas.
+
+        Saca esas filas del orden y las vuelve a insertar en su lugar, en
+        O(k log n) más una copia de los arreglos, sin volver a ordenar todo.
+        El resultado es el mismo que construir el índice desde cero.
+        """
+        cambiadas = np.unique(np.fromiter(posiciones, dtype=np.int64))
+        valores = self.valores.copy()
+        valores[cambiadas] = pd.to_numeric(df[self.columna].iloc[cambiadas], errors='coerce').to_numpy(dtype=float)
+
+        anteriores = cambiadas[self._validas(self.valores[cambiadas])]
+        quitar = [self._ubicar(self.valores_ordenados, self.posiciones, self.valores[p], p) for p in anteriores.tolist()]
+        ordenadas = np.delete(self.posiciones, quitar)
+        valores_ordenados = np.delete(self.valores_ordenados, quitar)
+
+        nuevas = cambiadas[self._validas(valores[cambiadas])]
+        nuevas = nuevas[np.lexsort((nuevas, valores[nuevas]))]
+        lugares = [self._ubicar(valores_ordenados, ordenadas, valores[p], p) for p in nuevas.tolist()]
+
+        nuevo = copy.copy(self)
+        nuevo.valores = valores
+        nuevo.posiciones = np.insert(ordenadas, lugares, nuevas)
+        nuevo.valores_ordenados = np.insert(valores_ordenados, lugares, valores[nuevas])
+        return nuevo
+
+    def _limites(self, minimo: Optional[float], maximo: Optional[float]) -> Tuple[int, int]:
+        inicio = 0 if minimo is None else int(np.searchsorted(self.valores_ordenados, minimo, side='left'))
+        fin = len(self.valores_ordenados) if maximo is None else int(np.searchsorted(self.valores_ordenados, maximo, side='right'))
+        return inicio, max(fin, inicio)
+
+    def buscar(self, minimo: Optional[float] = None, maximo: Optional[float] = None,
+               orden: str = 'asc', limite: Optional[int] = None) -> np.ndarray:
+        """Posiciones con valor en [minimo, maximo], ordenadas por valor"""
+        inicio, fin = self._limites(minimo, maximo)
+        if orden == 'desc':
+            if limite:
+                inicio = max(fin - limite, inicio)
+            return self.posiciones[inicio:fin][::-1]
+        if limite:
+            fin = min(inicio + limite, fin)
+        return self.posiciones[inicio:fin]
+
+    def contar(self, minimo: Optional[float] = None, maximo: Optional[float] = None) -> int:
+        inicio, fin = self._limites(minimo, maximo)
+        return fin - inicio
+
+    def filtrar(self, posiciones: np.ndarray, minimo: Optional[float] = None, maximo: Optional[float] = None) -> np.ndarray:
+        """Las posiciones dadas cuyo valor está en el rango, comprobando cada una en lugar de recorrer el índice"""
+        valores = self.valores[posiciones]
+        mascara = self._validas(valores)
+        if minimo is not None:
+            mascara &= valores >= minimo
+        if maximo is not None:
+            mascara &= valores <= maximo
+        return posiciones[mascara]
@@ -0,0 +1,116 @@
+"""Clasificación de preguntas en una sola pasada.
+
+Las palabras clave de cada intención y los nombres de las categorías se
+compilan juntos en un autómata Aho-Corasick, una vez por snapshot. Tanto
+los patrones como la pregunta se normalizan sin tildes, así que
+"estadistica" y "estadística" son la misma entrada.
+"""
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from service.normalizacion import normalizar_texto
+
+
+class AutomataAhoCorasick:
+    """Encuentra todas las apariciones de un conjunto de patrones en un solo recorrido del texto"""
+
+    def __init__(self, patrones: Iterable[str]):
+        self._transiciones: List[Dict[str, int]] = [{}]
+        self._fallo: List[int] = [0]
+        self._salidas: List[List[str]] = [[]]
+
+        for patron in patrones:
+            if not patron:
+                continue
+            nodo = 0
+            for caracter in patron:
+                siguiente = self._transiciones[nodo].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self._transiciones)
+                    self._transiciones.append({})
+                    self._fallo.append(0)
+                    self._salidas.append([])
+                    self._transiciones[nodo][caracter] = siguiente
+                nodo = siguiente
+            self._salidas[nodo].append(patron)
+
+        # Enlaces de fallo en anchura: cada nodo hereda las salidas de su sufijo más largo
+        cola = deque(self._transiciones[0].values())
+        while cola:
+            nodo = cola.popleft()
+            for caracter, siguiente in self._transiciones[nodo].items():
+                cola.append(siguiente)
+                fallo = self._fallo[nodo]
+                while fallo and caracter not in self._transiciones[fallo]:
+                    fallo = self._fallo[fallo]
+                self._fallo[siguiente] = self._transiciones[fallo].get(caracter, 0)
+                self._salidas[siguiente] = self._salidas[siguiente] + self._salidas[self._fallo[siguiente]]
+
+    def buscar(self, texto: str) -> Iterator[Tuple[int, str]]:
+        """Genera (posición de inicio, patrón) por cada aparición, incluidas las solapadas"""
+        nodo = 0
+        for i, caracter in enumerate(texto):
+            while nodo and caracter not in self._transiciones[nodo]:
+                nodo = self._fallo[nodo]
+            nodo = self._transiciones[nodo].get(caracter, 0)
+            for patron in self._salidas[nodo]:
+                yield i - len(patron) + 1, patron
+
+
+@dataclass(frozen=True)
+class AnalisisPregunta:
+    puntuaciones: Dict[str, int]
+    categoria: Optional[str]
+
+    @property
+    def intencion(self) -> Optional[str]:
+        """Intención con mayor puntuación (en empate, la primera declarada), o None si ninguna coincide"""
+        if not self.puntuaciones or max(self.puntuaciones.values()) == 0:
+            return None
+        return max(self.puntuaciones, key=self.puntuaciones.get)
+
+
+class ClasificadorPreguntas:
+    """Palabras clave de intención y nombres de categoría compilados en un único autómata"""
+
+    def __init__(self, intenciones: Dict[str, List[str]], categorias: Iterable[str]):
+        self._intenciones: Dict[str, Set[str]] = {}
+        self._categorias: Dict[str, str] = {}
+
+        for intencion, palabras in intenciones.items():
+            self._intenciones.setdefault(intencion, set())
+            for palabra in palabras:
+                patron = normalizar_texto(palabra)
+                if patron:
+                    self._intenciones[intencion].add(patron)
+
+        for categoria in categorias:
+            patron = normalizar_texto(categoria)
+            if patron:
+                self._categorias.setdefault(patron, categoria)
+
+        patrones = set(self._categorias)
+        for palabras in self._intenciones.values():
+            patrones.update(palabras)
+        self._automata = AutomataAhoCorasick(sorted(patrones))
+
+    def analizar(self, pregunta: str) -> AnalisisPregunta:
+        """Puntúa cada intención por palabras clave distintas encontradas y detecta la categoría mencionada"""
+        encontrados: Dict[str, int] = {}
+        for inicio, patron in self._automata.buscar(normalizar_texto(pregunta)):
+            encontrados.setdefault(patron, inicio)
+
+        puntuaciones = {
+            intencion: sum(1 for palabra in palabras if palabra in encontrados)
+            for intencion, palabras in self._intenciones.items()
+        }
+
+        # Si se mencionan varias categorías gana la más larga (la más específica) y luego la primera
+        mencionadas = [p for p in encontrados if p in self._categorias]
+        categoria = None
+        if mencionadas:
+            patron = min(mencionadas, key=lambda p: (-len(p), encontrados[p]))
+            categoria = self._categorias[patron]
+
+        return AnalisisPregunta(puntuaciones, categoria)
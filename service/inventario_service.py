@@ -1,98 +1,334 @@
 import pandas as pd
 import os
+from dataclasses import replace
+from typing import Dict, List, Optional
+import numpy as np
+from service.actualizaciones import Actualizacion, EscritorInventario
+from service.almacen_registros import validar_campos
+from service.cambios import HistorialCambios, ResultadoCambios
+from service.agregados import AgregadosInventario, IndicePrecios, agregados, indice_precios, resolver_columna_precio
+from service.exportacion import exportar, posiciones_por_categorias
+from service.consultas import COLUMNA_STOCK, Consulta, ResultadoConsulta, ejecutar, indice_stock
+from service.indices import (IndiceCodigo, IndiceRango, ParticionCategorias, indice_codigo, indice_descripcion,
+                             particion_categorias, registros, registros_por_codigo)
+from service.metricas import fase
+from service.paginacion import paginar, stream
+from service.relevancia import indice_relevancia
+from service.snapshot_service import DIRECTORIO_DATOS, Snapshot, registro
+
+CLAVE_INVENTARIO = 'inventario'
+ARCHIVO_INVENTARIO = os.path.join(DIRECTORIO_DATOS, 'inventario_vitalix_plus.xlsx')
+
+# Cambios en la bitácora tras los que se compacta (0 desactiva la compactación)
+COMPACTAR_CADA = int(os.getenv("INVENTARIO_COMPACTAR_CADA", "10000"))
+# Si es 1, la compactación también reescribe el Excel con los valores vigentes
+COMPACTAR_EXCEL = os.getenv("INVENTARIO_COMPACTAR_EXCEL", "0") == "1"
+# Versiones y cambios de fila que se conservan para /inventario/cambios
+HISTORIAL_VERSIONES = int(os.getenv("INVENTARIO_HISTORIAL_VERSIONES", "256"))
+HISTORIAL_CAMBIOS = int(os.getenv("INVENTARIO_HISTORIAL_CAMBIOS", "100000"))
+
+
+def _cargar_inventario(archivo: str) -> pd.DataFrame:
+    return _normalizar_inventario(pd.read_excel(archivo))
+
+
+def _normalizar_columnas(columnas: pd.Index) -> pd.Index:
+    return columnas.str.strip().str.lower().str.replace(" ", "_")
+
+
+def _normalizar_inventario(df: pd.DataFrame) -> pd.DataFrame:
+    """Valida y normaliza la hoja del inventario tal como viene del Excel"""
+    # Validar que el archivo no esté vacío
+    if df.empty:
+        raise ValueError("El archivo Excel está vacío. No hay datos para cargar.")
+
+    # Normalizar nombres de columnas
+    df.columns = _normalizar_columnas(df.columns)
+
+    # Validar columnas críticas
+    columnas_requeridas = ['código', 'descripción']
+    columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
+
+    if columnas_faltantes:
+        raise ValueError(f"Faltan columnas requeridas en el Excel: {', '.join(columnas_faltantes)}")
+
+    # Si no existe la columna 'categoría', la agrega vacía
+    if 'categoría' not in df.columns:
+        df['categoría'] = ''
+
+    return df
+
+
+def _guardar_inventario(archivo: str, df: pd.DataFrame):
+    """Reescribe el Excel con los datos vigentes, conservando los encabezados originales"""
+    originales = pd.read_excel(archivo, nrows=0).columns
+    encabezados = dict(zip(_normalizar_columnas(originales), originales))
+    temporal = os.path.join(os.path.dirname(archivo), f".{os.path.basename(archivo)}.tmp.xlsx")
+    df.rename(columns=lambda c: encabezados.get(c, c)).to_excel(temporal, index=False)
+    os.replace(temporal, archivo)
+
+
+def _indices_compartidos(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Índices que se publican en el segmento columnar para que cada worker no los recalcule"""
+    arreglos = IndiceCodigo(df).arreglos()
+    arreglos.update(ParticionCategorias(df).arreglos())
+    columna_precio = resolver_columna_precio(df.columns)
+    if columna_precio:
+        arreglos.update(IndicePrecios(df, columna_precio).arreglos())
+    if COLUMNA_STOCK in df.columns:
+        arreglos.update(IndiceRango(df, COLUMNA_STOCK).arreglos())
+    return arreglos
+
+
+registro.registrar(
+    CLAVE_INVENTARIO,
+    ARCHIVO_INVENTARIO,
+    _cargar_inventario,
+    'el inventario',
+    indices=_indices_compartidos,
+)
+
+# Las actualizaciones de stock y precios van a la bitácora y se reaplican en cada carga del Excel.
+# El vigilante publica las que escriben los demás workers.
+escritor_inventario = EscritorInventario(
+    registro, CLAVE_INVENTARIO, ARCHIVO_INVENTARIO,
+    exportar=_guardar_inventario, umbral_compactacion=COMPACTAR_CADA, regenerar_excel=COMPACTAR_EXCEL,
+)
+registro.al_leer(CLAVE_INVENTARIO, escritor_inventario.reaplicar)
+registro.al_publicar(CLAVE_INVENTARIO, escritor_inventario.publicado)
+registro.al_sondear(CLAVE_INVENTARIO, escritor_inventario.seguir)
+
+
+def _preparar_indices(snapshot: Snapshot):
+    """Construye los índices del snapshot antes de publicarlo, fuera del camino de las peticiones"""
+    registros(snapshot)
+    indice_codigo(snapshot)
+    indice_descripcion(snapshot)
+    indice_relevancia(snapshot)
+    particion_categorias(snapshot)
+    indice_precios(snapshot)
+    indice_stock(snapshot)
+    agregados(snapshot)
+
+
+registro.al_cargar(CLAVE_INVENTARIO, _preparar_indices)
+
+# Cada versión publicada (carga, recarga o actualización) se compara con la anterior. Se registra después
+# del escritor, que deja en cada snapshot su posición en la bitácora; antes de responder se publica lo que
+# escribieron los demás workers.
+historial_inventario = HistorialCambios(HISTORIAL_VERSIONES, HISTORIAL_CAMBIOS, sincronizar=escritor_inventario.seguir)
+registro.al_publicar(CLAVE_INVENTARIO, historial_inventario.registrar)
+
 
 class InventarioService:
-    def buscar_por_categoria(self, categoria: str):
-        if self.df is None:
-            raise RuntimeError(f"No se puede buscar productos. {self.error or 'Datos no disponibles'}")
-        
-        if 'categoría' not in self.df.columns:
-            raise KeyError("La columna 'categoría' no existe en el archivo Excel.")
-        
+    def buscar_por_categoria(self, categoria: str, campos: Optional[List[str]] = None):
         if not categoria or len(categoria.strip()) < 2:
             raise ValueError("El nombre de la categoría debe tener al menos 2 caracteres.")
         
-        resultado = self.df[self.df['categoría'].str.lower() == categoria.lower()]
-        return resultado.to_dict(orient="records")
-
-    def __init__(self):
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        archivo = os.path.join(base_dir, '..', 'files', 'data', 'inventario_vitalix_plus.xlsx')
-
-        try:
-            df = pd.read_excel(archivo)
-            
-            # Validar que el archivo no esté vacío
-            if df.empty:
-                raise ValueError("El archivo Excel está vacío. No hay datos para cargar.")
-            
-            # Normalizar nombres de columnas
-            df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-            
-            # Validar columnas críticas
-            columnas_requeridas = ['código', 'descripción']
-            columnas_faltantes = [col for col in columnas_requeridas if col not in df.columns]
-            
-            if columnas_faltantes:
-                raise ValueError(f"Faltan columnas requeridas en el Excel: {', '.join(columnas_faltantes)}")
-            
-            # Si no existe la columna 'categoría', la agrega vacía
-            if 'categoría' not in df.columns:
-                df['categoría'] = ''
-            
-            self.df = df
-            self.error = None
-            
-        except FileNotFoundError:
-            error_msg = f"No se encontró el archivo en la ruta: {archivo}"
-            print(f"Error: {error_msg}")
-            self.df = None
-            self.error = error_msg
-            
-        except ValueError as e:
-            error_msg = f"Error de validación: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.df = None
-            self.error = error_msg
-            
-        except Exception as e:
-            error_msg = f"Error inesperado al cargar el inventario: {str(e)}"
-            print(f"Error: {error_msg}")
-            self.df = None
-            self.error = error_msg
-
-    def listar_todo(self):
-        if self.df is None:
-            raise RuntimeError(f"No se puede listar el inventario. {self.error or 'Datos no disponibles'}")
-        return self.df.to_dict(orient="records")
+        snapshot = self._snapshot_con_categorias()
+        campos = self.validar_campos(campos)
+        
+        with fase('indice'):
+            posiciones = particion_categorias(snapshot).posiciones(categoria)
+        return registros(snapshot).seleccion(posiciones, campos)
 
-    def buscar_por_id(self, valor_id: int):
-        if self.df is None:
-            raise RuntimeError(f"No se puede buscar productos. {self.error or 'Datos no disponibles'}")
+    def contar_por_categoria(self, categoria: str) -> int:
+        snapshot = self._snapshot_con_categorias()
+        return particion_categorias(snapshot).contar(categoria)
+
+    def listar_categorias(self):
+        snapshot = self._snapshot_con_categorias()
+        return particion_categorias(snapshot).categorias()
+
+    def _snapshot_con_categorias(self) -> Snapshot:
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede buscar productos. {snapshot.error or 'Datos no disponibles'}")
         
-        if 'código' not in self.df.columns:
+        if 'categoría' not in snapshot.df.columns:
+            raise KeyError("La columna 'categoría' no existe en el archivo Excel.")
+        return snapshot
+
+    @property
+    def snapshot(self) -> Snapshot:
+        # El snapshot se comparte entre todas las instancias del proceso; se carga al arrancar la aplicación
+        return registro.obtener(CLAVE_INVENTARIO)
+
+    @property
+    def df(self):
+        return self.snapshot.df
+
+    @property
+    def error(self):
+        return self.snapshot.error
+
+    def listar_todo(self, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede listar el inventario. {snapshot.error or 'Datos no disponibles'}")
+        return registros(snapshot).todos().proyectar(self.validar_campos(campos))
+
+    def contar_productos(self) -> int:
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede contar el inventario. {snapshot.error or 'Datos no disponibles'}")
+        return len(snapshot.df)
+
+    def listar_pagina(self, cursor: Optional[str] = None, limite: int = 100, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede listar el inventario. {snapshot.error or 'Datos no disponibles'}")
+        return paginar(snapshot, cursor, limite, campos=self.validar_campos(campos))
+
+    def listar_stream(self, formato: str = 'ndjson', tamano_lote: int = 1000, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede listar el inventario. {snapshot.error or 'Datos no disponibles'}")
+        return stream(snapshot, formato, tamano_lote, self.validar_campos(campos))
+
+    def exportar(self, formato: str, campos: Optional[List[str]] = None, categorias: Optional[List[str]] = None,
+                 tamano_lote: int = 10000):
+        """Exporta el inventario en streaming (CSV, NDJSON, Arrow o Parquet), opcionalmente solo algunas columnas y categorías"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede exportar el inventario. {snapshot.error or 'Datos no disponibles'}")
+        posiciones = None
+        if categorias:
+            snapshot = self._snapshot_con_categorias()
+            posiciones = posiciones_por_categorias(snapshot, categorias)
+        return exportar(snapshot, formato, campos, posiciones, tamano_lote)
+
+    def codigos_por_categorias(self, categorias: List[str]):
+        """Códigos de los productos de cualquiera de las categorías"""
+        snapshot = self._snapshot_con_categorias()
+        return snapshot.df['código'].to_numpy()[posiciones_por_categorias(snapshot, categorias)]
+
+    def obtener_agregados(self) -> AgregadosInventario:
+        """Estadísticas de precios precalculadas para el snapshot vigente"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden calcular estadísticas. {snapshot.error or 'Datos no disponibles'}")
+        return agregados(snapshot)
+
+    def buscar_por_id(self, valor_id: int, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede buscar productos. {snapshot.error or 'Datos no disponibles'}")
+        
+        if 'código' not in snapshot.df.columns:
             raise KeyError("La columna 'código' no existe en el archivo Excel.")
         
         if not isinstance(valor_id, int) or valor_id <= 0:
             raise ValueError("El código del producto debe ser un número entero positivo.")
+        campos = self.validar_campos(campos)
         
-        resultado = self.df[self.df['código'] == valor_id]
-        return resultado.to_dict(orient="records")
+        return registros_por_codigo(snapshot, valor_id).proyectar(campos)
 
-    def buscar_por_nombre(self, nombre: str):
-        if self.df is None:
-            raise RuntimeError(f"No se puede buscar productos. {self.error or 'Datos no disponibles'}")
+    def buscar_por_nombre(self, nombre: str, campos: Optional[List[str]] = None):
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede buscar productos. {snapshot.error or 'Datos no disponibles'}")
         
-        if 'descripción' not in self.df.columns:
+        if 'descripción' not in snapshot.df.columns:
             raise KeyError("La columna 'descripción' no existe en el archivo Excel.")
         
         if not nombre or len(nombre.strip()) < 2:
             raise ValueError("El término de búsqueda debe tener al menos 2 caracteres.")
+        campos = self.validar_campos(campos)
+        
+        with fase('indice'):
+            posiciones = indice_descripcion(snapshot).buscar(nombre)
+        return registros(snapshot).seleccion(posiciones, campos)
+
+    def buscar_por_ids(self, valores_id: List[int], campos: Optional[List[str]] = None):
+        """Busca varios códigos en una sola pasada por el índice, conservando el orden de la petición"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede buscar productos. {snapshot.error or 'Datos no disponibles'}")
         
-        resultado = self.df[self.df['descripción'].str.contains(nombre, case=False, na=False)]
-        return resultado.to_dict(orient="records")
-    
+        if 'código' not in snapshot.df.columns:
+            raise KeyError("La columna 'código' no existe en el archivo Excel.")
+        
+        if any(not isinstance(valor_id, int) or valor_id <= 0 for valor_id in valores_id):
+            raise ValueError("El código del producto debe ser un número entero positivo.")
+        campos = self.validar_campos(campos)
+        
+        indice = indice_codigo(snapshot)
+        encontrados = []
+        faltantes = []
+        with fase('indice'):
+            for valor_id in valores_id:
+                posiciones = indice.buscar(valor_id)
+                if posiciones:
+                    encontrados.extend(posiciones)
+                else:
+                    faltantes.append(valor_id)
+        return {"productos": registros(snapshot).seleccion(encontrados, campos), "faltantes": faltantes}
+
+    def actualizar(self, valor_id: int, valores: Dict[str, float], ajustes: Dict[str, float],
+                   campos: Optional[List[str]] = None):
+        """Fija o ajusta stock y precios de un código; retorna sus filas ya actualizadas"""
+        # Los campos se validan antes de escribir: un error después dejaría el cambio aplicado sin respuesta
+        campos = self.validar_campos(campos)
+        resultado = escritor_inventario.aplicar([Actualizacion(valor_id, valores, ajustes)])
+        return registros(resultado.snapshot).seleccion(resultado.posiciones, campos)
+
+    def actualizar_varios(self, actualizaciones: List[Actualizacion], campos: Optional[List[str]] = None):
+        """Aplica varias actualizaciones de forma atómica. Los códigos que no existen se reportan en 'faltantes'"""
+        if not actualizaciones:
+            raise ValueError("Debe enviar al menos una actualización.")
+        campos = self.validar_campos(campos)
+        resultado = escritor_inventario.aplicar(actualizaciones)
+        return {"productos": registros(resultado.snapshot).seleccion(resultado.posiciones, campos),
+                "faltantes": resultado.faltantes}
+
+    def cambios_desde(self, version: Optional[str], campos: Optional[List[str]] = None) -> ResultadoCambios:
+        """Filas agregadas, modificadas y eliminadas desde la versión dada, o la indicación de descargar todo"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se pueden consultar los cambios. {snapshot.error or 'Datos no disponibles'}")
+        campos = self.validar_campos(campos)
+        return replace(historial_inventario.desde(version), campos=campos)
+
+    def buscar_por_precio(self, minimo: Optional[float] = None, maximo: Optional[float] = None,
+                          orden: str = 'asc', limite: Optional[int] = None, campos: Optional[List[str]] = None):
+        """Productos con precio en el rango, ordenados por precio. Los precios en cero no se incluyen."""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede buscar productos. {snapshot.error or 'Datos no disponibles'}")
+        
+        if orden not in ('asc', 'desc'):
+            raise ValueError("El orden debe ser 'asc' o 'desc'.")
+        
+        if minimo is not None and maximo is not None and minimo > maximo:
+            raise ValueError("El precio mínimo no puede ser mayor que el máximo.")
+        
+        if limite is not None and limite <= 0:
+            raise ValueError("El límite debe ser un número entero positivo.")
+        campos = self.validar_campos(campos)
+        
+        indice = indice_precios(snapshot)
+        if indice is None:
+            raise KeyError("No existe una columna de precio en el archivo Excel.")
+        
+        with fase('indice'):
+            posiciones = indice.buscar(minimo, maximo, orden, limite).tolist()
+        return registros(snapshot).seleccion(posiciones, campos)
+
+    def buscar(self, consulta: Consulta) -> ResultadoConsulta:
+        """Consulta combinada (categoría, texto, rangos de precio y stock, orden, campos y límite)"""
+        snapshot = self.snapshot
+        if snapshot.df is None:
+            raise RuntimeError(f"No se puede buscar productos. {snapshot.error or 'Datos no disponibles'}")
+        return ejecutar(snapshot, consulta)
+
     def columnas_disponibles(self):
         if self.df is None:
             raise RuntimeError(f"No se puede obtener columnas. {self.error or 'Datos no disponibles'}")
-        return self.df.columns.tolist()
\ No newline at end of file
+        return self.df.columns.tolist()
+
+    def validar_campos(self, campos: Optional[List[str]]):
+        """Campos pedidos como tupla (None si no se pidió proyección); error si alguno no es una columna disponible"""
+        if campos is None:
+            return None
+        return validar_campos(campos, self.columnas_disponibles())
\ No newline at end of file
@@ -0,0 +1,217 @@
+"""Métricas del servicio en formato de exposición de Prometheus.
+
+Contadores, medidores e histogramas mínimos, seguros entre hilos y sin
+dependencias externas. Además, `fase` mide tramos dentro de una petición
+(búsqueda en índices, materialización, codificación JSON...) y los acumula
+en la petición en curso para la cabecera `Server-Timing`.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _etiquetas(nombres: Sequence[str], valores: Sequence[str], extra: str = '') -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return '{' + ','.join(partes) + '}' if partes else ''
+
+
+def _numero(valor: float) -> str:
+    if math.isinf(valor):
+        return '+Inf' if valor > 0 else '-Inf'
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ''
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._lock = threading.Lock()
+
+    def _clave(self, etiquetas: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(etiquetas[n]) for n in self.etiquetas)
+
+    def lineas(self) -> Iterator[str]:
+        yield f"# HELP {self.nombre} {self.ayuda}"
+        yield f"# TYPE {self.nombre} {self.tipo}"
+        yield from self._muestras()
+
+    def _muestras(self) -> Iterator[str]:
+        raise NotImplementedError
+
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def incrementar(self, cantidad: float = 1, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def _muestras(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class Medidor(_Metrica):
+    tipo = 'gauge'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def sumar(self, cantidad: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + cantidad
+
+    def fijar(self, valor: float, **etiquetas):
+        with self._lock:
+            self._valores[self._clave(etiquetas)] = valor
+
+    def _muestras(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            yield f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {_numero(valor)}"
+
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                 limites: Sequence[float] = LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(sorted(limites))
+        # Por cada combinación de etiquetas: conteo por cubeta (no acumulado), suma y total
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observar(self, valor: float, **etiquetas):
+        clave = self._clave(etiquetas)
+        cubeta = len(self.limites)
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                cubeta = i
+                break
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * (len(self.limites) + 1), 0.0, 0]
+            serie[0][cubeta] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def _muestras(self):
+        with self._lock:
+            series = [(clave, list(serie[0]), serie[1], serie[2]) for clave, serie in self._series.items()]
+        for clave, cubetas, suma, total in series:
+            acumulado = 0
+            for limite, cantidad in zip(self.limites + (math.inf,), cubetas):
+                acumulado += cantidad
+                le = f'le="{_numero(limite)}"'
+                yield f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}"
+            yield f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}"
+            yield f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}"
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def _agregar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            if metrica.nombre in self._metricas:
+                raise ValueError(f"La métrica '{metrica.nombre}' ya está registrada")
+            self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def contador(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Contador:
+        return self._agregar(Contador(nombre, ayuda, etiquetas))
+
+    def medidor(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = ()) -> Medidor:
+        return self._agregar(Medidor(nombre, ayuda, etiquetas))
+
+    def histograma(self, nombre: str, ayuda: str, etiquetas: Sequence[str] = (),
+                   limites: Sequence[float] = LIMITES_SEGUNDOS) -> Histograma:
+        return self._agregar(Histograma(nombre, ayuda, etiquetas, limites))
+
+    def exposicion(self) -> str:
+        """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)"""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return '\n'.join(linea for metrica in metricas for linea in metrica.lineas()) + '\n'
+
+
+metricas = RegistroMetricas()
+
+peticiones_total = metricas.contador(
+    'vitalix_http_peticiones_total', 'Peticiones HTTP atendidas', ('metodo', 'ruta', 'estado'))
+duracion_peticiones = metricas.histograma(
+    'vitalix_http_duracion_segundos', 'Latencia de las peticiones HTTP, hasta enviar el último byte', ('metodo', 'ruta'))
+peticiones_en_curso = metricas.medidor(
+    'vitalix_http_en_curso', 'Peticiones HTTP en curso', ('metodo', 'ruta'))
+tamano_respuestas = metricas.histograma(
+    'vitalix_http_respuesta_bytes', 'Tamaño del cuerpo de las respuestas HTTP', ('metodo', 'ruta'), LIMITES_BYTES)
+duracion_fases = metricas.histograma(
+    'vitalix_fase_duracion_segundos', 'Duración de cada fase del procesamiento de una petición', ('fase',))
+duracion_intenciones = metricas.histograma(
+    'vitalix_ia_intencion_duracion_segundos', 'Tiempo de cálculo de las respuestas de la IA por intención', ('intencion',))
+duracion_cargas = metricas.histograma(
+    'vitalix_snapshot_carga_segundos', 'Duración de la carga de cada fuente, por etapa', ('fuente', 'etapa'))
+version_snapshots = metricas.medidor(
+    'vitalix_snapshot_version', 'Versión vigente del snapshot de cada fuente', ('fuente',))
+errores_carga = metricas.contador(
+    'vitalix_snapshot_errores_total', 'Cargas de una fuente que terminaron en error', ('fuente',))
+
+
+_fases_peticion: ContextVar[Optional[Dict[str, float]]] = ContextVar('fases_peticion', default=None)
+
+
+def iniciar_fases() -> Dict[str, float]:
+    """Empieza a acumular las fases de la petición en curso; retorna el diccionario que se irá llenando"""
+    fases: Dict[str, float] = {}
+    _fases_peticion.set(fases)
+    return fases
+
+
+@contextmanager
+def fase(nombre: str):
+    """Mide un tramo del procesamiento, lo suma a la petición en curso y lo registra en el histograma"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracion = time.perf_counter() - inicio
+        duracion_fases.observar(duracion, fase=nombre)
+        fases = _fases_peticion.get()
+        if fases is not None:
+            fases[nombre] = fases.get(nombre, 0.0) + duracion
+
+
+def server_timing(fases: Dict[str, float], total: Optional[float] = None) -> str:
+    """Valor de la cabecera Server-Timing, con las duraciones en milisegundos"""
+    partes = [f"{nombre};dur={duracion * 1000:.3f}" for nombre, duracion in fases.items()]
+    if total is not None:
+        partes.append(f"total;dur={total * 1000:.3f}")
+    return ', '.join(partes)
@@ -0,0 +1,22 @@
+import re
+import unicodedata
+
+_ESPACIOS = re.compile(r'\s+')
+
+
+def normalizar_texto(texto) -> str:
+    """Pasa el texto a minúsculas, elimina tildes y colapsa los espacios"""
+    if not isinstance(texto, str):
+        return ''
+    texto = unicodedata.normalize('NFKD', texto.casefold())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return _ESPACIOS.sub(' ', texto).strip()
+
+
+# Signos de puntuación, salvo los que separan dígitos ("10.000", "2,5")
+_PUNTUACION = re.compile(r'(?<!\d)[^\w\s]|[^\w\s](?!\d)')
+
+
+def normalizar_pregunta(pregunta: str) -> str:
+    """Forma canónica de una pregunta: sin mayúsculas, tildes, signos de puntuación ni espacios repetidos"""
+    return normalizar_texto(_PUNTUACION.sub(' ', normalizar_texto(pregunta)))
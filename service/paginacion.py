@@ -0,0 +1,88 @@
+"""Paginación por cursor y exportación en streaming sobre un snapshot.
+
+Ambas recorren las filas en orden estable por código. El cursor tiene la
+forma `<código>:<filas de ese código ya entregadas>`, de modo que sigue
+siendo válido aunque el inventario se recargue entre páginas.
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from service.almacen_registros import validar_campos
+from service.indices import orden_codigo, registros
+from service.metricas import fase
+from service.snapshot_service import Snapshot
+
+FORMATOS_STREAM = ('ndjson', 'json')
+
+
+def _leer_cursor(cursor: str):
+    try:
+        codigo, consumidas = cursor.split(':')
+        return int(codigo), int(consumidas)
+    except ValueError:
+        raise ValueError(f"El cursor '{cursor}' no es válido.")
+
+
+def paginar(snapshot: Snapshot, cursor: Optional[str], limite: int,
+            vista: Optional[Callable[[List[int]], Any]] = None,
+            campos: Optional[Iterable[str]] = None) -> Dict:
+    """Retorna una página de registros y el cursor de la siguiente (None si es la última).
+
+    `vista` arma la página a partir de las posiciones de sus filas, para paginar
+    otra vista alineada fila a fila con el snapshot (por ejemplo, los productos
+    con sus imágenes); por defecto son sus registros, con solo los `campos`
+    indicados si se piden.
+    """
+    if limite <= 0:
+        raise ValueError("El límite debe ser un número entero positivo.")
+
+    with fase('indice'):
+        orden = orden_codigo(snapshot)
+        inicio = orden.inicio_desde_cursor(*_leer_cursor(cursor)) if cursor else 0
+        posiciones = orden.posiciones[inicio:inicio + limite]
+
+    if vista is None:
+        datos = registros(snapshot).seleccion(posiciones.tolist(), campos)
+    else:
+        with fase('materializacion'):
+            datos = vista(posiciones.tolist())
+    fin = inicio + len(posiciones)
+    return {
+        "datos": datos,
+        "siguiente_cursor": orden.cursor_en(fin - 1) if fin < len(orden.posiciones) else None,
+        "total": len(orden.posiciones),
+    }
+
+
+def stream(snapshot: Snapshot, formato: str, tamano_lote: int,
+           campos: Optional[Iterable[str]] = None) -> Iterator[bytes]:
+    """Genera el snapshot completo lote a lote como NDJSON o como un arreglo JSON.
+
+    Cada fila sale del JSON precalculado del snapshot (los NaN se envían como null);
+    con `campos`, cada lote codifica solo esas columnas.
+    """
+    if formato not in FORMATOS_STREAM:
+        raise ValueError(f"Formato no soportado: '{formato}'. Use uno de: {', '.join(FORMATOS_STREAM)}")
+    if tamano_lote <= 0:
+        raise ValueError("El tamaño del lote debe ser un número entero positivo.")
+
+    almacen = registros(snapshot)
+    campos = validar_campos(campos, almacen.columnas)
+    posiciones = orden_codigo(snapshot).posiciones.tolist()
+
+    def generar():
+        primero = True
+        if formato == 'json':
+            yield b'['
+        for inicio in range(0, len(posiciones), tamano_lote):
+            lote = almacen.seleccion(posiciones[inicio:inicio + tamano_lote], campos)
+            if formato == 'ndjson':
+                yield b''.join(fila + b'\n' for fila in lote.json_filas())
+            else:
+                partes = list(lote.json_filas())
+                if partes:
+                    yield (b'' if primero else b',') + b','.join(partes)
+                    primero = False
+        if formato == 'json':
+            yield b']'
+
+    return generar()
@@ -0,0 +1,105 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from service.almacen_registros import AlmacenRegistros, SeleccionRegistros
+from service.imagen_service import CLAVE_IMAGENES, ImagenService
+from service.indices import indice_codigo, registros
+from service.inventario_service import InventarioService
+from service.paginacion import paginar
+from service.snapshot_service import Snapshot, registro
+
+
+class ImagenesPorCodigo:
+    """Imágenes de cada código (sin la columna código), con el arreglo JSON de cada código ya armado.
+
+    Depende solo del snapshot de imágenes, así que se calcula una vez por
+    versión de las imágenes y no cambia con las actualizaciones del inventario.
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        self._almacen = registros(snapshot)
+        self._indice = indice_codigo(snapshot)
+        self.campos = tuple(c for c in self._almacen.columnas if c != 'código')
+        if self.campos:
+            filas = self._almacen.json_proyectado(range(len(self._almacen)), self.campos)
+        else:
+            filas = [b'{}'] * len(self._almacen)
+        self._json: Dict[Any, bytes] = {
+            codigo: b'[' + b','.join(filas[p] for p in posiciones) + b']'
+            for codigo, posiciones in self._indice.items()
+        }
+
+    def imagenes(self, codigo) -> List[Dict[str, Any]]:
+        return [self._almacen.fila(p, self.campos) for p in self._indice.buscar(codigo)]
+
+    def json(self, codigo) -> bytes:
+        return self._json.get(codigo, b'[]')
+
+
+def imagenes_por_codigo(snapshot: Snapshot) -> ImagenesPorCodigo:
+    return snapshot.derivado('imagenes_por_codigo', lambda df: ImagenesPorCodigo(snapshot))
+
+
+registro.al_cargar(CLAVE_IMAGENES, imagenes_por_codigo)
+
+
+class SeleccionProductos(SeleccionRegistros):
+    """Filas del inventario con las imágenes de su código en 'imagenes'.
+
+    El JSON de cada producto se arma al codificar, pegando el de la fila del
+    inventario con el de sus imágenes; no se crea ningún diccionario.
+    """
+
+    __slots__ = ('_imagenes',)
+
+    def __init__(self, almacen: AlmacenRegistros, posiciones: Iterable[int], imagenes: ImagenesPorCodigo):
+        super().__init__(almacen, posiciones)
+        self._imagenes = imagenes
+
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return SeleccionProductos(self._almacen, self._posiciones[indice], self._imagenes)
+        return self._producto(self._posiciones[indice])
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for posicion in self._posiciones:
+            yield self._producto(posicion)
+
+    def _producto(self, posicion: int) -> Dict[str, Any]:
+        producto = self._almacen.fila(posicion)
+        return {**producto, 'imagenes': self._imagenes.imagenes(producto['código'])}
+
+    def json_filas(self) -> Iterator[bytes]:
+        codigos = self._almacen.arreglo('código')
+        for posicion in self._posiciones:
+            fila = self._almacen.json_fila(posicion)
+            yield fila[:-1] + b',"imagenes":' + self._imagenes.json(codigos[posicion]) + b'}'
+
+
+class ProductoService:
+    """Vista de productos con sus imágenes, armada al codificar sobre los registros de cada snapshot"""
+
+    def __init__(self):
+        self.inventario_service = InventarioService()
+        self.imagen_service = ImagenService()
+
+    def _snapshots(self):
+        with registro.vista_consistente():
+            inventario = self.inventario_service.snapshot
+            imagenes = self.imagen_service.snapshot
+        if inventario.df is None:
+            raise RuntimeError(f"No se pueden consultar los productos. {inventario.error or 'Datos no disponibles'}")
+        if imagenes.df is None:
+            raise RuntimeError(f"No se pueden consultar los productos. {imagenes.error or 'Datos no disponibles'}")
+        return inventario, imagenes_por_codigo(imagenes)
+
+    def buscar_por_id(self, valor_id: int):
+        if not isinstance(valor_id, int) or valor_id <= 0:
+            raise ValueError("El código del producto debe ser un número entero positivo.")
+
+        inventario, imagenes = self._snapshots()
+        return SeleccionProductos(registros(inventario), indice_codigo(inventario).buscar(valor_id), imagenes)
+
+    def listar_pagina(self, cursor: Optional[str] = None, limite: int = 100):
+        inventario, imagenes = self._snapshots()
+        almacen = registros(inventario)
+        return paginar(inventario, cursor, limite, lambda posiciones: SeleccionProductos(almacen, posiciones, imagenes))
@@ -0,0 +1,213 @@
+"""Búsqueda por relevancia sobre las descripciones, tolerante a errores de tipeo.
+
+Al cargar el snapshot las descripciones (ya normalizadas: minúsculas y sin
+tildes) se parten en palabras y se guardan listas invertidas con el peso
+BM25 de cada palabra en cada fila, ya calculado. Cada palabra de la
+búsqueda se compara con el vocabulario de tres formas:
+- Exacta.
+- Como prefijo de otras palabras ("acetamin" -> "acetaminofen").
+- Si no existe tal cual, con hasta una o dos letras cambiadas, de más, de
+  menos o intercambiadas ("vitamna" -> "vitamina"). Los candidatos salen de
+  los trigramas del vocabulario y se confirman con la distancia de edición.
+
+Cada variante pesa menos que la palabra exacta. El puntaje de una fila es
+la suma de los pesos de las palabras de la búsqueda que contiene,
+multiplicada por la fracción de palabras encontradas, así que las filas
+que tienen todas las palabras quedan primero.
+"""
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from service.indices import indice_descripcion
+from service.normalizacion import normalizar_texto
+from service.snapshot_service import Snapshot
+
+# Parámetros de BM25
+K1 = 1.2
+B = 0.75
+# Peso de cada variante frente a la palabra exacta
+PESO_PREFIJO = 0.8
+PESO_EDICION = {1: 0.7, 2: 0.5}
+# Variantes (prefijos o con errores) que se consideran por palabra de la búsqueda
+MAX_VARIANTES = 50
+
+_PALABRAS = re.compile(r'\w+')
+
+
+def palabras(texto: str) -> List[str]:
+    """Palabras de un texto ya normalizado"""
+    return _PALABRAS.findall(texto)
+
+
+def _ediciones_permitidas(palabra: str) -> int:
+    if len(palabra) < 4:
+        return 0
+    return 1 if len(palabra) < 8 else 2
+
+
+def _trigramas_palabra(palabra: str) -> List[str]:
+    relleno = f"^{palabra}$"
+    return [relleno[i:i + 3] for i in range(len(relleno) - 2)]
+
+
+def distancia_edicion(a: str, b: str, maximo: int) -> int:
+    """Distancia de edición con transposiciones (Damerau restringida), o `maximo + 1` si la supera"""
+    if abs(len(a) - len(b)) > maximo:
+        return maximo + 1
+    anterior_previa: Optional[List[int]] = None
+    anterior = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        actual = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            costo = 0 if a[i - 1] == b[j - 1] else 1
+            actual[j] = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + costo)
+            if (anterior_previa is not None and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                actual[j] = min(actual[j], anterior_previa[j - 2] + 1)
+        if min(actual) > maximo:
+            return maximo + 1
+        anterior_previa, anterior = anterior, actual
+    return min(anterior[-1], maximo + 1)
+
+
+class IndiceRelevancia:
+    """Listas invertidas con pesos BM25 por palabra y un índice de trigramas del vocabulario"""
+
+    def __init__(self, textos: List[str]):
+        self.filas = len(textos)
+        vocabulario: Dict[str, int] = {}
+        terminos: List[int] = []
+        posiciones: List[int] = []
+        for posicion, texto in enumerate(textos):
+            for palabra in palabras(texto):
+                terminos.append(vocabulario.setdefault(palabra, len(vocabulario)))
+                posiciones.append(posicion)
+
+        # Palabras en orden alfabético para buscar prefijos con bisect
+        self.vocabulario = sorted(vocabulario)
+        renumeracion = np.empty(len(vocabulario), dtype=np.int64)
+        renumeracion[[vocabulario[p] for p in self.vocabulario]] = np.arange(len(vocabulario))
+        self._id = {palabra: i for i, palabra in enumerate(self.vocabulario)}
+
+        # Frecuencia de cada palabra en cada fila: pares (palabra, fila) únicos, ordenados
+        terminos = renumeracion[np.array(terminos, dtype=np.int64)]
+        claves, frecuencias = np.unique(terminos * max(self.filas, 1) + np.array(posiciones, dtype=np.int64),
+                                        return_counts=True)
+        termino_de = claves // max(self.filas, 1)
+        self._posiciones = (claves % max(self.filas, 1)).astype(np.int32)
+        self._inicios = np.searchsorted(termino_de, np.arange(len(self.vocabulario) + 1))
+        documentos = np.diff(self._inicios)
+
+        largos = np.bincount(self._posiciones, weights=frecuencias, minlength=self.filas)
+        promedio = largos.mean() if self.filas and largos.mean() > 0 else 1.0
+        idf = np.log1p((self.filas - documentos + 0.5) / (documentos + 0.5))
+        normalizacion = K1 * (1 - B + B * largos[self._posiciones] / promedio)
+        self._pesos = (idf[termino_de] * frecuencias * (K1 + 1) / (frecuencias + normalizacion)).astype(np.float32)
+        self._documentos = documentos
+
+        # Trigramas del vocabulario, para encontrar palabras parecidas a una mal escrita
+        por_trigrama: Dict[str, List[int]] = {}
+        for i, palabra in enumerate(self.vocabulario):
+            for trigrama in set(_trigramas_palabra(palabra)):
+                por_trigrama.setdefault(trigrama, []).append(i)
+        self._trigramas = {t: np.array(ids, dtype=np.int32) for t, ids in por_trigrama.items()}
+        self._largos_palabras = np.array([len(p) for p in self.vocabulario], dtype=np.int32)
+
+    def variantes(self, palabra: str) -> List[Tuple[int, float]]:
+        """Palabras del vocabulario que cuentan para la palabra buscada, con su peso relativo.
+
+        Una palabra que existe tal cual solo se extiende a su singular y a las
+        que empiezan por ella (plurales, por ejemplo), y esto último solo desde
+        cuatro letras, para que "con" no traiga "condon"; las demás se
+        completan como prefijo y se corrigen. Los números solo valen exactos:
+        "1000" no es un error de tipeo de "10000".
+        """
+        encontradas: Dict[int, float] = {}
+        exacta = self._id.get(palabra)
+        if exacta is not None:
+            encontradas[exacta] = 1.0
+        if palabra.isdigit():
+            return list(encontradas.items())
+        if exacta is not None and palabra.endswith('s'):
+            for singular in (palabra[:-1], palabra[:-2] if palabra.endswith('es') else None):
+                if singular in self._id:
+                    encontradas.setdefault(self._id[singular], PESO_PREFIJO)
+
+        if len(palabra) >= (3 if exacta is None else 4):
+            inicio = bisect_left(self.vocabulario, palabra)
+            fin = bisect_left(self.vocabulario, palabra + '\uffff')
+            ids = np.arange(inicio, fin)
+            if len(ids) > MAX_VARIANTES:
+                # Las terminaciones más frecuentes
+                ids = ids[np.argsort(-self._documentos[ids], kind='stable')[:MAX_VARIANTES]]
+            for i in ids.tolist():
+                encontradas.setdefault(i, PESO_PREFIJO)
+
+        maximo = _ediciones_permitidas(palabra)
+        if maximo and exacta is None:
+            for i, distancia in self._parecidas(palabra, maximo):
+                if encontradas.get(i, 0) < PESO_EDICION[distancia]:
+                    encontradas[i] = PESO_EDICION[distancia]
+        return list(encontradas.items())
+
+    def _parecidas(self, palabra: str, maximo: int) -> List[Tuple[int, int]]:
+        trigramas = _trigramas_palabra(palabra)
+        listas = [self._trigramas[t] for t in set(trigramas) if t in self._trigramas]
+        if not listas:
+            return []
+        # Cada edición cambia a lo sumo tres trigramas
+        conteos = np.bincount(np.concatenate(listas), minlength=len(self.vocabulario))
+        minimo = max(1, len(trigramas) - 3 * maximo)
+        candidatas = np.flatnonzero(
+            (conteos >= minimo) & (np.abs(self._largos_palabras - len(palabra)) <= maximo)
+        )
+        if len(candidatas) > 4 * MAX_VARIANTES:
+            candidatas = candidatas[np.argsort(-conteos[candidatas], kind='stable')[:4 * MAX_VARIANTES]]
+
+        parecidas = []
+        for i in candidatas.tolist():
+            distancia = distancia_edicion(palabra, self.vocabulario[i], maximo)
+            if 0 < distancia <= maximo:
+                parecidas.append((i, distancia))
+        parecidas.sort(key=lambda e: (e[1], -self._documentos[e[0]]))
+        return parecidas[:MAX_VARIANTES]
+
+    def puntajes(self, texto: str) -> np.ndarray:
+        """Puntaje de cada fila para el texto buscado (0 en las que no coincide ninguna palabra)"""
+        buscadas = list(dict.fromkeys(palabras(normalizar_texto(texto))))
+        total = np.zeros(self.filas, dtype=np.float32)
+        if not buscadas:
+            return total
+
+        encontradas = np.zeros(self.filas, dtype=np.int32)
+        for palabra in buscadas:
+            mejor = np.zeros(self.filas, dtype=np.float32)
+            for i, peso in self.variantes(palabra):
+                inicio, fin = self._inicios[i], self._inicios[i + 1]
+                posiciones = self._posiciones[inicio:fin]
+                mejor[posiciones] = np.maximum(mejor[posiciones], peso * self._pesos[inicio:fin])
+            total += mejor
+            encontradas += mejor > 0
+        if len(buscadas) > 1:
+            total *= encontradas / np.float32(len(buscadas))
+        return total
+
+
+def indice_relevancia(snapshot: Snapshot) -> IndiceRelevancia:
+    """Índice de relevancia de las descripciones, construido sobre los textos ya normalizados del índice de trigramas"""
+    return snapshot.derivado('indice_relevancia', lambda df: IndiceRelevancia(indice_descripcion(snapshot).textos))
+
+
+def mejores(puntajes: np.ndarray, candidatos: np.ndarray, limite: int) -> np.ndarray:
+    """Los `limite` candidatos de mayor puntaje, de mayor a menor; en empate, por orden de fila.
+
+    Se separan los k mejores en O(n) y solo esos se ordenan.
+    """
+    claves = -puntajes[candidatos]
+    if limite < len(candidatos):
+        corte = np.partition(claves, limite - 1)[limite - 1]
+        elegidos = np.flatnonzero(claves <= corte)
+        candidatos, claves = candidatos[elegidos], claves[elegidos]
+    return candidatos[np.lexsort((candidatos, claves))][:limite]
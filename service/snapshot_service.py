@@ -0,0 +1,430 @@
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from service.cache_columnar import ConstructorArreglos, arreglos_vigentes, cargar_con_cache, huella_codigo
+from service.metricas import duracion_cargas, errores_carga, version_snapshots
+
+# Carpeta de los Excel; se puede cambiar para servir otros datos (por ejemplo, los de los benchmarks)
+DIRECTORIO_DATOS = os.getenv(
+    "VITALIX_DATOS",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'files', 'data'),
+)
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Vista inmutable de un archivo Excel ya normalizado y validado.
+
+    Los servicios solo leen el DataFrame; nunca debe modificarse en sitio
+    porque se comparte por referencia entre todas las instancias.
+    """
+    clave: str
+    version: int
+    archivo: str
+    df: Optional[pd.DataFrame]
+    error: Optional[str] = None
+    # Índices ya calculados que vienen publicados en el segmento columnar
+    arreglos: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+    # SHA-256 del archivo del que se cargó; es el mismo en todos los workers
+    origen: Optional[str] = None
+
+    def __post_init__(self):
+        object.__setattr__(self, '_derivados', {})
+        object.__setattr__(self, '_lock_derivados', threading.RLock())
+
+    def derivado(self, nombre: str, constructor: Callable[[pd.DataFrame], Any]) -> Any:
+        """Retorna una estructura derivada del DataFrame (índices, registros...) calculada una sola vez por snapshot"""
+        try:
+            return self._derivados[nombre]
+        except KeyError:
+            pass
+
+        with self._lock_derivados:
+            if nombre not in self._derivados:
+                self._derivados[nombre] = constructor(self.df)
+            return self._derivados[nombre]
+
+    def derivados_calculados(self) -> Dict[str, Any]:
+        """Estructuras derivadas ya construidas, por nombre"""
+        with self._lock_derivados:
+            return dict(self._derivados)
+
+
+@dataclass(frozen=True)
+class Fuente:
+    archivo: str
+    cargador: Callable[[str], pd.DataFrame]
+    descripcion: str
+    # Arreglos de índice que se publican en el segmento columnar (ver service.cache_columnar)
+    indices: Optional[ConstructorArreglos] = None
+    # Huella del código del cargador y de los índices, para no adjuntar segmentos de otra versión del código
+    huella: Optional[str] = None
+
+
+def sello_archivo(archivo: str) -> Optional[Tuple[int, int]]:
+    """Fecha de modificación y tamaño del archivo, o None si no existe"""
+    try:
+        estado = os.stat(archivo)
+    except OSError:
+        return None
+    return estado.st_mtime_ns, estado.st_size
+
+
+class RegistroSnapshots:
+    """Registro de snapshots compartido por todo el proceso.
+
+    Cada archivo se carga una sola vez y se entrega por referencia a todos
+    los servicios que lo soliciten. Las recargas construyen el snapshot nuevo
+    aparte y lo publican con una sola asignación, así que quien ya tiene el
+    anterior sigue viendo datos coherentes.
+    """
+
+    def __init__(self):
+        self._fuentes: Dict[str, Fuente] = {}
+        self._snapshots: Dict[str, Snapshot] = {}
+        self._calentadores: Dict[str, List[Callable[[Snapshot], Any]]] = {}
+        self._ajustes: Dict[str, List[Callable[[pd.DataFrame], pd.DataFrame]]] = {}
+        self._observadores: Dict[str, List[Callable[[Optional[Snapshot], Snapshot], Any]]] = {}
+        self._sondeos: Dict[str, List[Callable[[], Any]]] = {}
+        self._sellos: Dict[str, Optional[Tuple[int, int]]] = {}
+        self._errores_recarga: Dict[str, str] = {}
+        # Estado de la última carga de cada fuente: pendiente, cargando, listo o error
+        self._progreso: Dict[str, Dict[str, Any]] = {}
+        self._calentamiento: Optional['CalentamientoInicial'] = None
+        self._contador = itertools.count(1)
+        self._lock = threading.Lock()
+        self._lock_recarga = threading.RLock()
+        self.version = 0
+
+    def registrar(self, clave: str, archivo: str, cargador: Callable[[str], pd.DataFrame], descripcion: str,
+                  indices: Optional[ConstructorArreglos] = None):
+        """Registra la fuente de un snapshot. El cargador lee, normaliza y valida el archivo;
+        `indices` calcula los arreglos de índice que se comparten con los demás workers en el segmento."""
+        with self._lock:
+            self._fuentes[clave] = Fuente(os.path.abspath(archivo), cargador, descripcion, indices,
+                                          huella_codigo(cargador, indices))
+            self._progreso.setdefault(clave, {'estado': 'pendiente'})
+
+    def al_cargar(self, clave: str, calentador: Callable[[Snapshot], Any]):
+        """Registra una función que prepara cada snapshot nuevo (índices, registros...) antes de publicarlo"""
+        with self._lock:
+            self._calentadores.setdefault(clave, []).append(calentador)
+
+    def al_leer(self, clave: str, ajuste: Callable[[pd.DataFrame], pd.DataFrame]):
+        """Registra una función que ajusta el DataFrame recién leído del archivo (por ejemplo, para
+        reaplicar cambios pendientes) antes de indexarlo. Retorna el DataFrame ajustado."""
+        with self._lock:
+            self._ajustes.setdefault(clave, []).append(ajuste)
+
+    def al_publicar(self, clave: str, observador: Callable[[Optional[Snapshot], Snapshot], Any]):
+        """Registra una función que recibe el snapshot vigente (None la primera vez) y el que lo va
+        a reemplazar, ya preparado, justo antes de publicarlo"""
+        with self._lock:
+            self._observadores.setdefault(clave, []).append(observador)
+
+    def al_sondear(self, clave: str, sondeo: Callable[[], Any]):
+        """Registra una función que el vigilante de archivos llama en cada revisión, una vez que la
+        fuente está cargada (por ejemplo, para publicar lo que otro proceso agregó a la bitácora)"""
+        with self._lock:
+            self._sondeos.setdefault(clave, []).append(sondeo)
+
+    def sondear(self):
+        """Llama a los sondeos de las fuentes que ya tienen un snapshot publicado"""
+        for clave in list(self._snapshots):
+            for sondeo in self._sondeos.get(clave, []):
+                try:
+                    sondeo()
+                except Exception as e:
+                    print(f"Error: no se pudo revisar '{clave}': {str(e)}")
+
+    def obtener(self, clave: str) -> Snapshot:
+        """Retorna el snapshot vigente, cargándolo la primera vez que se pide.
+
+        Dentro de `vista_consistente` se retorna siempre el mismo snapshot por clave.
+        Mientras el calentamiento inicial está en curso, pedir una fuente que todavía
+        no se publicó lanza RuntimeError en lugar de esperar a que termine de cargar.
+        """
+        fijados = _fijados.get()
+        if fijados is not None and clave in fijados:
+            return fijados[clave]
+
+        snapshot = self._snapshots.get(clave)
+        if snapshot is None:
+            fuente = self._fuentes.get(clave)
+            if fuente is not None and self.calentando and threading.current_thread() is not self._calentamiento:
+                raise RuntimeError(f"Todavía se está cargando {fuente.descripcion}. Intente de nuevo en unos segundos.")
+            with self._lock:
+                snapshot = self._snapshots.get(clave)
+                if snapshot is None:
+                    if clave not in self._fuentes:
+                        raise KeyError(f"No hay ninguna fuente registrada con la clave '{clave}'")
+                    fuente = self._fuentes[clave]
+                    self._sellos[clave] = sello_archivo(fuente.archivo)
+                    snapshot = self._cargar(clave, fuente)
+                    self._notificar(None, snapshot)
+                    self._snapshots[clave] = snapshot
+
+        if fijados is not None:
+            fijados[clave] = snapshot
+        return snapshot
+
+    @contextmanager
+    def vista_consistente(self):
+        """Fija los snapshots leídos dentro del bloque para que una recarga no mezcle versiones"""
+        if _fijados.get() is not None:
+            yield
+            return
+        token = _fijados.set({})
+        try:
+            yield
+        finally:
+            _fijados.reset(token)
+
+    def recargar(self, clave: str) -> bool:
+        """Vuelve a cargar la fuente y publica el snapshot nuevo.
+
+        Si el archivo nuevo no es válido se conserva el snapshot anterior y el
+        error queda en `errores_recarga`. Retorna True si se publicó una versión válida.
+        """
+        fuente = self._fuentes[clave]
+        with self._lock_recarga:
+            self._sellos[clave] = sello_archivo(fuente.archivo)
+            nuevo = self._cargar(clave, fuente)
+            actual = self._snapshots.get(clave)
+
+            if nuevo.df is None and actual is not None and actual.df is not None:
+                self._errores_recarga[clave] = nuevo.error
+                print(f"Aviso: se mantiene la versión {actual.version} de '{clave}' porque la recarga falló")
+                return False
+
+            self._errores_recarga.pop(clave, None)
+            self._notificar(actual, nuevo)
+            self._snapshots[clave] = nuevo
+            if nuevo.df is not None:
+                print(f"Recargado '{clave}' (versión {nuevo.version})")
+            return nuevo.df is not None
+
+    @contextmanager
+    def exclusivo(self):
+        """Impide recargas y publicaciones de otros hilos mientras dura el bloque"""
+        with self._lock_recarga:
+            yield
+
+    def publicar(self, clave: str, df: pd.DataFrame, derivados: Optional[Dict[str, Any]] = None) -> Snapshot:
+        """Publica una versión nueva de la fuente con otro DataFrame, sin volver a leer el archivo.
+
+        Las estructuras de `derivados` se reutilizan tal cual; las demás las
+        construyen los calentadores antes de publicar, como en una carga.
+        """
+        with self._lock_recarga:
+            actual = self._snapshots[clave]
+            arreglos = arreglos_vigentes(actual.arreglos, actual.df, df)
+            nuevo = Snapshot(clave, self._siguiente_version(), actual.archivo, df, arreglos=arreglos,
+                             origen=actual.origen)
+            nuevo._derivados.update(derivados or {})
+            self._calentar(nuevo)
+            self._notificar(actual, nuevo)
+            self._snapshots[clave] = nuevo
+            version_snapshots.fijar(nuevo.version, fuente=clave)
+            self._marcar(clave, filas=len(df))
+            return nuevo
+
+    def cambiados(self) -> List[str]:
+        """Claves ya cargadas cuyo archivo cambió desde la última carga"""
+        return [
+            clave for clave in list(self._snapshots)
+            if sello_archivo(self._fuentes[clave].archivo) != self._sellos.get(clave)
+        ]
+
+    def iniciar_vigilancia(self, intervalo: float) -> 'VigilanteArchivos':
+        """Arranca un hilo que recarga los archivos cuando cambian"""
+        vigilante = VigilanteArchivos(self, intervalo)
+        vigilante.start()
+        return vigilante
+
+    def iniciar_calentamiento(self) -> 'CalentamientoInicial':
+        """Arranca un hilo que carga y prepara todas las fuentes registradas sin bloquear a quien lo llama"""
+        calentamiento = CalentamientoInicial(self)
+        self._calentamiento = calentamiento
+        calentamiento.start()
+        return calentamiento
+
+    @property
+    def calentando(self) -> bool:
+        calentamiento = self._calentamiento
+        return calentamiento is not None and not calentamiento.terminado.is_set()
+
+    @property
+    def listo(self) -> bool:
+        """True cuando todas las fuentes tienen publicada una versión válida con sus índices ya preparados"""
+        snapshots = [self._snapshots.get(clave) for clave in list(self._fuentes)]
+        return all(snapshot is not None and snapshot.df is not None for snapshot in snapshots)
+
+    def progreso(self) -> Dict[str, Dict[str, Any]]:
+        """Estado de carga de cada fuente y la versión que se está sirviendo"""
+        resultado = {}
+        for clave in list(self._fuentes):
+            estado = dict(self._progreso.get(clave, {'estado': 'pendiente'}))
+            snapshot = self._snapshots.get(clave)
+            estado['version'] = snapshot.version if snapshot is not None and snapshot.df is not None else None
+            if clave in self._errores_recarga:
+                estado['error_recarga'] = self._errores_recarga[clave]
+            resultado[clave] = estado
+        return resultado
+
+    def _marcar(self, clave: str, **cambios):
+        # Se reemplaza el diccionario completo para que `progreso` nunca lea uno a medio actualizar
+        self._progreso[clave] = {**self._progreso.get(clave, {}), **cambios}
+
+    @property
+    def errores_recarga(self) -> Dict[str, str]:
+        return dict(self._errores_recarga)
+
+    def claves(self):
+        return list(self._fuentes)
+
+    def fuentes(self) -> Dict[str, Fuente]:
+        return dict(self._fuentes)
+
+    def _siguiente_version(self) -> int:
+        self.version = next(self._contador)
+        return self.version
+
+    def _cargar(self, clave: str, fuente: Fuente) -> Snapshot:
+        def parsear(archivo: str) -> pd.DataFrame:
+            inicio_parseo = time.perf_counter()
+            try:
+                return fuente.cargador(archivo)
+            finally:
+                duracion_cargas.observar(time.perf_counter() - inicio_parseo, fuente=clave, etapa='parseo')
+
+        inicio_carga = time.perf_counter()
+        self._marcar(clave, estado='cargando', etapa='lectura', error=None)
+        try:
+            inicio = time.perf_counter()
+            datos = cargar_con_cache(fuente.archivo, parsear, indices=fuente.indices, huella=fuente.huella)
+            df = datos.df
+            for ajuste in self._ajustes.get(clave, []):
+                df = ajuste(df)
+            # Los índices publicados de las columnas que cambió un ajuste ya no corresponden
+            arreglos = arreglos_vigentes(datos.arreglos, datos.df, df) if df is not datos.df else datos.arreglos
+            # Incluye el parseo si el segmento no estaba vigente; si no, es solo adjuntar el segmento
+            duracion_cargas.observar(time.perf_counter() - inicio, fuente=clave, etapa='lectura')
+            snapshot = Snapshot(clave, self._siguiente_version(), fuente.archivo, df, arreglos=arreglos,
+                                origen=datos.sha256)
+            inicio = time.perf_counter()
+            self._marcar(clave, etapa='calentamiento')
+            self._calentar(snapshot)
+            duracion_cargas.observar(time.perf_counter() - inicio, fuente=clave, etapa='calentamiento')
+            version_snapshots.fijar(snapshot.version, fuente=clave)
+            self._marcar(clave, estado='listo', etapa=None, filas=len(snapshot.df),
+                         segundos=round(time.perf_counter() - inicio_carga, 3))
+            return snapshot
+
+        except FileNotFoundError:
+            error_msg = f"No se encontró el archivo en la ruta: {fuente.archivo}"
+
+        except ValueError as e:
+            error_msg = f"Error de validación: {str(e)}"
+
+        except Exception as e:
+            error_msg = f"Error inesperado al cargar {fuente.descripcion}: {str(e)}"
+
+        print(f"Error: {error_msg}")
+        errores_carga.incrementar(fuente=clave)
+        self._marcar(clave, estado='error', etapa=None, error=error_msg,
+                     segundos=round(time.perf_counter() - inicio_carga, 3))
+        return Snapshot(clave, self._siguiente_version(), fuente.archivo, None, error_msg)
+
+    def _calentar(self, snapshot: Snapshot):
+        for calentador in self._calentadores.get(snapshot.clave, []):
+            try:
+                calentador(snapshot)
+            except Exception as e:
+                # Un índice que falla se reconstruye bajo demanda; no invalida el snapshot
+                print(f"Aviso: no se pudo preparar '{snapshot.clave}': {str(e)}")
+
+    def _notificar(self, anterior: Optional[Snapshot], nuevo: Snapshot):
+        for observador in self._observadores.get(nuevo.clave, []):
+            try:
+                observador(anterior, nuevo)
+            except Exception as e:
+                print(f"Aviso: no se pudo registrar la versión {nuevo.version} de '{nuevo.clave}': {str(e)}")
+
+
+class CalentamientoInicial(threading.Thread):
+    """Hilo que carga, indexa y publica todas las fuentes al arrancar la aplicación.
+
+    Así el servidor empieza a escuchar de inmediato; `RegistroSnapshots.listo`
+    indica cuándo puede recibir tráfico.
+    """
+
+    def __init__(self, registro: RegistroSnapshots):
+        super().__init__(name='calentamiento-snapshots', daemon=True)
+        self.registro = registro
+        self.terminado = threading.Event()
+
+    def run(self):
+        inicio = time.perf_counter()
+        try:
+            for clave in self.registro.claves():
+                try:
+                    self.registro.obtener(clave)
+                except Exception as e:
+                    print(f"Error: no se pudo cargar '{clave}': {str(e)}")
+        finally:
+            self.terminado.set()
+        print(f"Calentamiento terminado en {time.perf_counter() - inicio:.2f} s")
+
+
+class VigilanteArchivos(threading.Thread):
+    """Hilo que sondea los archivos cargados y los recarga fuera del camino de las peticiones.
+
+    Un cambio solo se aplica cuando el archivo se ve igual en dos sondeos
+    seguidos, para no leer un Excel que todavía se está copiando. Después de
+    revisar los archivos llama a los sondeos registrados con `al_sondear`.
+    """
+
+    def __init__(self, registro: RegistroSnapshots, intervalo: float):
+        super().__init__(name='vigilante-excel', daemon=True)
+        self.registro = registro
+        self.intervalo = intervalo
+        self._detenido = threading.Event()
+
+    def run(self):
+        pendientes: Dict[str, Optional[Tuple[int, int]]] = {}
+        while not self._detenido.wait(self.intervalo):
+            cambiados = self.registro.cambiados()
+            for clave in list(pendientes):
+                if clave not in cambiados:
+                    del pendientes[clave]
+
+            for clave in cambiados:
+                sello = sello_archivo(self.registro.fuentes()[clave].archivo)
+                if pendientes.get(clave, False) != sello:
+                    pendientes[clave] = sello
+                    continue
+                del pendientes[clave]
+                try:
+                    self.registro.recargar(clave)
+                except Exception as e:
+                    print(f"Error: no se pudo recargar '{clave}': {str(e)}")
+            self.registro.sondear()
+
+    def detener(self):
+        self._detenido.set()
+        self.join(timeout=self.intervalo + 1)
+
+
+_fijados: ContextVar[Optional[Dict[str, Snapshot]]] = ContextVar('snapshots_fijados', default=None)
+
+registro = RegistroSnapshots()
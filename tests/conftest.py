@@ -0,0 +1,31 @@
+"""Las pruebas sirven un inventario sintético pequeño en una carpeta temporal.
+
+La carpeta se fija antes de importar los servicios, que registran sus
+fuentes con la ruta de `VITALIX_DATOS` al importarse.
+"""
+import os
+import shutil
+import tempfile
+
+import pytest
+
+DIRECTORIO_PRUEBAS = tempfile.mkdtemp(prefix='vitalix-pruebas-')
+os.environ['VITALIX_DATOS'] = DIRECTORIO_PRUEBAS
+os.environ['INVENTARIO_COMPACTAR_CADA'] = '0'
+
+from benchmarks.sinteticos import preparar  # noqa: E402
+
+FILAS_PRUEBAS = 500
+RUTAS = preparar(DIRECTORIO_PRUEBAS, FILAS_PRUEBAS)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(DIRECTORIO_PRUEBAS, ignore_errors=True)
+
+
+@pytest.fixture
+def directorio_datos(tmp_path):
+    """Copia propia de los Excel y segmentos sintéticos, para pruebas que escriben en la carpeta"""
+    for nombre in os.listdir(DIRECTORIO_PRUEBAS):
+        shutil.copy2(os.path.join(DIRECTORIO_PRUEBAS, nombre), tmp_path / nombre)
+    return tmp_path
@@ -0,0 +1,108 @@
+from service.actualizaciones import Actualizacion, EscritorInventario, _fracciones_por_unidad, _totales
+from service.bitacora import leer_bitacora
+from service.cambios import HistorialCambios
+from service.inventario_service import _cargar_inventario, _guardar_inventario, _indices_compartidos
+from service.snapshot_service import RegistroSnapshots
+
+
+class _Worker:
+    """Registro y escritor propios, como los de cada proceso de `uvicorn --workers N`"""
+
+    def __init__(self, directorio, regenerar_excel: bool = False):
+        self.registro = RegistroSnapshots()
+        archivo = str(directorio / 'inventario_vitalix_plus.xlsx')
+        self.registro.registrar('inventario', archivo, _cargar_inventario, 'el inventario',
+                                indices=_indices_compartidos)
+        self.escritor = EscritorInventario(self.registro, 'inventario', archivo, exportar=_guardar_inventario,
+                                           umbral_compactacion=0, regenerar_excel=regenerar_excel)
+        self.registro.al_leer('inventario', self.escritor.reaplicar)
+        self.registro.al_publicar('inventario', self.escritor.publicado)
+        self.registro.al_sondear('inventario', self.escritor.seguir)
+        self.historial = HistorialCambios(sincronizar=self.escritor.seguir)
+        self.registro.al_publicar('inventario', self.historial.registrar)
+        self.ruta = self.escritor.ruta
+
+    def stock(self, codigo) -> int:
+        df = self.registro.obtener('inventario').df
+        return int(df.loc[df['código'] == codigo, 's._ent'].iloc[0])
+
+
+def _codigo(worker: _Worker) -> int:
+    df = worker.registro.obtener('inventario').df
+    return int(df['código'].iloc[0])
+
+
+def test_dos_workers_comparten_la_bitacora(directorio_datos):
+    a, b = _Worker(directorio_datos), _Worker(directorio_datos)
+    codigo = _codigo(a)
+    b.registro.obtener('inventario')
+    try:
+        a.escritor.aplicar([Actualizacion(codigo, valores={'s._ent': 7})])
+        # El ajuste de B se calcula sobre lo que escribió A, aunque B todavía no lo había leído
+        b.escritor.aplicar([Actualizacion(codigo, ajustes={'s._ent': 1})])
+        assert b.stock(codigo) == 8
+
+        assert a.stock(codigo) == 7
+        a.registro.sondear()
+        assert a.stock(codigo) == 8
+        assert [c.lsn for c in leer_bitacora(a.ruta)[0]] == [1, 2]
+
+        # Después de que A compacta, B sigue leyendo y escribiendo detrás
+        a.escritor.compactar()
+        b.escritor.aplicar([Actualizacion(codigo, ajustes={'s._ent': 1})])
+        a.registro.sondear()
+        assert a.stock(codigo) == b.stock(codigo) == 9
+        assert [c.lsn for c in leer_bitacora(a.ruta)[0]] == [2, 3]
+    finally:
+        a.escritor.detener()
+        b.escritor.detener()
+
+    # Un worker que arranca después ve todo lo escrito por los dos
+    assert _Worker(directorio_datos).stock(codigo) == 9
+
+
+def test_compactar_regenerando_el_excel_con_otro_worker_atrasado(directorio_datos):
+    a, b = _Worker(directorio_datos, regenerar_excel=True), _Worker(directorio_datos)
+    codigo = _codigo(a)
+    b.registro.obtener('inventario')
+    try:
+        a.escritor.aplicar([Actualizacion(codigo, valores={'s._ent': 7})])
+        # El cambio pasa al Excel y sale de la bitácora antes de que B lo lea
+        a.escritor.compactar()
+        assert leer_bitacora(a.ruta)[0] == []
+
+        b.escritor.aplicar([Actualizacion(codigo, ajustes={'s._ent': 1})])
+        assert b.stock(codigo) == 8
+        a.registro.sondear()
+        assert a.stock(codigo) == 8
+    finally:
+        a.escritor.detener()
+        b.escritor.detener()
+
+
+def test_actualizar_recalcula_las_columnas_calculadas(directorio_datos):
+    worker = _Worker(directorio_datos)
+    df = worker.registro.obtener('inventario').df
+    posicion = int(((df['s._fracc'] == 0) & (df['%_iva_c'] == 19) & (df['costo'] > 0)).to_numpy().argmax())
+    codigo = int(df['código'].iloc[posicion])
+    try:
+        worker.escritor.aplicar([Actualizacion(codigo, valores={'s._ent': 4, 'costo': 1000, 'precio_neto': 2000})])
+        fila = worker.registro.obtener('inventario').df.iloc[posicion]
+        assert fila['total_c._compra'] == 4000
+        assert fila['total_precio'] == 8000
+        assert fila['utilidad'] == 8000 - 4000 * 1.19
+    finally:
+        worker.escritor.detener()
+
+    # Los totales van en la bitácora y se reaplican al cargar
+    fila = _Worker(directorio_datos).registro.obtener('inventario').df.iloc[posicion]
+    assert (fila['total_c._compra'], fila['total_precio']) == (4000, 8000)
+
+
+def test_fracciones_por_unidad_deducidas_de_la_fila():
+    # 2 unidades y 24 de 48 fracciones: los totales cuentan 2.5 unidades
+    fracciones = _fracciones_por_unidad(2, 24, 1000, 2500)
+    assert fracciones == 48
+    assert _totales(3, 12, 1000, 2000, 0, fracciones) == {'total_c._compra': 3250, 'total_precio': 6500, 'utilidad': 3250}
+    # Una fila cuyos totales no cuentan las fracciones sigue sin contarlas
+    assert _fracciones_por_unidad(2, 24, 1000, 2000) is None
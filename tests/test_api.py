@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+from controller import salud_controller
+from main import app
+from service.cache_respuestas import EntradaRespuesta, serializar
+from service.inventario_service import _cargar_inventario
+from service.snapshot_service import RegistroSnapshots
+
+
+@pytest.fixture(scope='module')
+def cliente():
+    # Sin `with`: no arranca el calentamiento ni la vigilancia, los snapshots se cargan al primer uso
+    return TestClient(app)
+
+
+def test_etag_por_codificacion(cliente):
+    identidad = cliente.get('/inventario/', headers={'Accept-Encoding': 'identity'})
+    comprimida = cliente.get('/inventario/', headers={'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in identidad.headers
+    assert comprimida.headers['content-encoding'] == 'gzip'
+    assert comprimida.json() == identidad.json()
+
+    etag = identidad.headers['etag']
+    assert comprimida.headers['etag'] == etag[:-1] + '-gzip"'
+
+    # El ETag de una variante no vale para la otra
+    revalidada = cliente.get('/inventario/', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert revalidada.status_code == 200 and revalidada.headers['etag'] == comprimida.headers['etag']
+
+    revalidada = cliente.get('/inventario/', headers={'Accept-Encoding': 'gzip',
+                                                      'If-None-Match': comprimida.headers['etag']})
+    assert revalidada.status_code == 304 and revalidada.content == b''
+
+    revalidada = cliente.get('/inventario/', headers={'Accept-Encoding': 'identity', 'If-None-Match': f'"otro", {etag}'})
+    assert revalidada.status_code == 304 and revalidada.headers['etag'] == etag
+
+
+def test_variantes_de_la_entrada():
+    entrada = serializar({'a': 1})
+    entrada = EntradaRespuesta(cuerpo=entrada.cuerpo, gzip=entrada.gzip, br=b'br', etag=entrada.etag)
+    etiquetas = {entrada.variante(c)[1] for c in (None, 'gzip', 'br')}
+    assert etiquetas == {entrada.etag, entrada.etag[:-1] + '-gzip"', entrada.etag[:-1] + '-br"'}
+    assert entrada.variante('br')[0] == b'br'
+
+
+def test_buscar_con_campos(cliente):
+    respuesta = cliente.get('/inventario/buscar', params={'categoria': 'Otros', 'campos': 'código, precio_neto,', 'limite': 5})
+    assert respuesta.status_code == 200
+    productos = respuesta.json()['productos']
+    assert productos and all(set(p) == {'código', 'precio_neto'} for p in productos)
+
+    respuesta = cliente.get('/inventario/buscar', params={'categoria': 'Otros', 'campos': 'código,no_existe'})
+    assert respuesta.status_code == 400
+    assert 'no_existe' in respuesta.json()['detail']
+
+
+@pytest.mark.parametrize('ruta', ['/inventario/codigos', '/imagen/codigos'])
+def test_lote_de_codigos_con_limite(cliente, ruta):
+    assert cliente.post(ruta, json={'codigos': list(range(1, 1001))}).status_code == 200
+    respuesta = cliente.post(ruta, json={'codigos': list(range(1, 1002))})
+    assert respuesta.status_code == 422
+    assert 'más de 1000 códigos' in respuesta.text
+
+
+def test_listo_despues_del_calentamiento(cliente, directorio_datos, monkeypatch):
+    liberar = threading.Event()
+
+    def cargar_lento(archivo):
+        liberar.wait(10)
+        return _cargar_inventario(archivo)
+
+    nuevo = RegistroSnapshots()
+    nuevo.registrar('inventario', str(directorio_datos / 'inventario_vitalix_plus.xlsx'), cargar_lento, 'el inventario')
+    monkeypatch.setattr(salud_controller, 'registro', nuevo)
+
+    assert cliente.get('/health/ready').status_code == 503
+    calentamiento = nuevo.iniciar_calentamiento()
+    respuesta = cliente.get('/health/ready')
+    assert respuesta.status_code == 503
+    assert respuesta.json()['calentando'] is True
+    assert cliente.get('/health/live').status_code == 200
+
+    liberar.set()
+    assert calentamiento.terminado.wait(10)
+    respuesta = cliente.get('/health/ready')
+    assert respuesta.status_code == 200
+    assert respuesta.json()['fuentes']['inventario']['estado'] == 'listo'
@@ -0,0 +1,70 @@
+import numpy as np
+
+from service.agregados import IndicePrecios, indice_precios
+from service.cache_columnar import huella_codigo, leer_cache
+from service.consultas import indice_stock
+from service.indices import IndiceCodigo, ParticionCategorias, indice_codigo, particion_categorias
+from service.inventario_service import _cargar_inventario, _indices_compartidos
+from service.snapshot_service import RegistroSnapshots
+
+
+def _registro(directorio):
+    registro = RegistroSnapshots()
+    registro.registrar('inventario', str(directorio / 'inventario_vitalix_plus.xlsx'), _cargar_inventario,
+                       'el inventario', indices=_indices_compartidos)
+    return registro
+
+
+def _compartido(arreglo: np.ndarray) -> bool:
+    """True si el arreglo lee directamente de la memoria mapeada del segmento"""
+    return not arreglo.flags.writeable
+
+
+def test_indices_se_adjuntan_desde_el_segmento(directorio_datos):
+    datos = leer_cache(str(directorio_datos / 'inventario_vitalix_plus.xlsx'),
+                       huella_codigo(_cargar_inventario, _indices_compartidos))
+    assert datos is not None
+    assert {'código/orden', 'categoría/posiciones', 'precio_neto/positivos_posiciones',
+            's._ent/rango_posiciones'} <= set(datos.arreglos)
+
+    snapshot = _registro(directorio_datos).obtener('inventario')
+    df = snapshot.df
+    precios, stock, codigos = indice_precios(snapshot), indice_stock(snapshot), indice_codigo(snapshot)
+    assert _compartido(precios.posiciones) and _compartido(stock.posiciones) and _compartido(codigos.posiciones)
+
+    nuevo = IndicePrecios(df, precios.columna)
+    np.testing.assert_array_equal(precios.posiciones, nuevo.posiciones)
+    np.testing.assert_array_equal(precios.valores_ordenados, nuevo.valores_ordenados)
+
+    particion, recalculada = particion_categorias(snapshot), ParticionCategorias(df)
+    assert particion.conteos() == recalculada.conteos()
+    for categoria in recalculada.categorias():
+        np.testing.assert_array_equal(particion.posiciones(categoria), recalculada.posiciones(categoria))
+
+    codigo = int(df['código'].iloc[0])
+    assert codigos.buscar(codigo) == IndiceCodigo(df).buscar(codigo)
+    assert codigos.buscar(-1) == ()
+
+
+def test_columna_cambiada_descarta_sus_arreglos(directorio_datos):
+    registro = _registro(directorio_datos)
+    actual = registro.obtener('inventario')
+    df = actual.df.copy(deep=False)
+    precios = df['precio_neto'].to_numpy(copy=True)
+    precios[0] = precios.max() + 1
+    df['precio_neto'] = precios
+
+    nuevo = registro.publicar('inventario', df)
+    assert not any(n.startswith('precio_neto/') for n in nuevo.arreglos)
+    assert 'código/orden' in nuevo.arreglos and 's._ent/valores' in nuevo.arreglos
+    assert indice_precios(nuevo).buscar(orden='desc', limite=1).tolist() == [0]
+
+
+def test_segmento_de_otro_codigo_no_se_adjunta(directorio_datos):
+    archivo = str(directorio_datos / 'inventario_vitalix_plus.xlsx')
+    huella = huella_codigo(_cargar_inventario, _indices_compartidos)
+    assert leer_cache(archivo, huella) is not None
+    # Otra versión del cargador o de los índices no usa el segmento publicado con esta
+    assert leer_cache(archivo, 'otra') is None
+    assert leer_cache(archivo) is None
+    assert huella_codigo(_cargar_inventario) != huella_codigo(leer_cache)
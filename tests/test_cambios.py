@@ -0,0 +1,59 @@
+from service.actualizaciones import Actualizacion
+from tests.test_actualizaciones import _codigo, _Worker
+
+
+def _modificados(resultado):
+    return {m['código']: m['campos'] for m in resultado.como_dict()['modificados']}
+
+
+def test_version_de_otro_worker(directorio_datos):
+    a, b = _Worker(directorio_datos), _Worker(directorio_datos)
+    codigo = _codigo(a)
+    b.registro.obtener('inventario')
+    inicial = a.historial.desde(None).version
+    assert b.historial.desde(None).version == inicial
+    try:
+        a.escritor.aplicar([Actualizacion(codigo, valores={'s._ent': 7})])
+        version_a = a.historial.desde(None).version
+
+        # B todavía no leyó el cambio de A: lo publica antes de responder
+        resultado = b.historial.desde(inicial)
+        assert not resultado.resincronizar
+        assert resultado.version == version_a
+        assert _modificados(resultado)[codigo]['s._ent'] == 7
+        assert _modificados(b.historial.desde(version_a)) == {}
+    finally:
+        a.escritor.detener()
+        b.escritor.detener()
+
+
+def test_version_intermedia_que_el_worker_no_publico(directorio_datos):
+    a, b = _Worker(directorio_datos), _Worker(directorio_datos)
+    codigo = _codigo(a)
+    original = a.stock(codigo)
+    b.registro.obtener('inventario')
+    try:
+        a.escritor.aplicar([Actualizacion(codigo, ajustes={'s._ent': 1})])
+        intermedia = a.historial.desde(None).version
+        a.escritor.aplicar([Actualizacion(codigo, ajustes={'s._ent': -1})])
+
+        # B lee los dos cambios de una vez y el valor queda igual, pero el cliente tiene el de en medio
+        resultado = b.historial.desde(intermedia)
+        assert not resultado.resincronizar
+        assert _modificados(resultado)[codigo]['s._ent'] == original
+    finally:
+        a.escritor.detener()
+        b.escritor.detener()
+
+
+def test_version_de_otro_excel(directorio_datos):
+    worker = _Worker(directorio_datos)
+    worker.registro.obtener('inventario')
+    actual = worker.historial.desde(None).version
+    epoca, _, numero = actual.partition(':')
+
+    for token in ('0123456789abcdef:' + numero, 'deadbeef:3'):
+        resultado = worker.historial.desde(token)
+        assert resultado.resincronizar
+        assert 'otro Excel' in resultado.motivo
+    assert worker.historial.desde(f"{epoca}:{int(numero) + 5}").resincronizar
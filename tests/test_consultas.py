@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from service.consultas import Consulta, valores_numericos
+from service.imagen_service import ImagenService
+from service.inventario_service import InventarioService
+
+
+@pytest.fixture(scope='module')
+def servicio():
+    return InventarioService()
+
+
+@pytest.mark.parametrize('columna', ['costo', 's._ent', 'precio_neto'])
+def test_ordenar_por_columna_numerica(servicio, columna):
+    resultado = servicio.buscar(Consulta(ordenar_por=columna, orden='desc', limite=10, campos=('código', columna)))
+    valores = [p[columna] for p in resultado.productos]
+    assert valores == sorted(valores, reverse=True)
+
+    df = servicio.df
+    esperado = df[columna][df[columna] > 0] if columna == 'precio_neto' else df[columna]
+    assert valores[0] == esperado.max()
+
+
+def test_valores_numericos_se_calculan_una_vez(servicio):
+    snapshot = servicio.snapshot
+    costos = valores_numericos(snapshot, 'costo')
+    assert valores_numericos(snapshot, 'costo') is costos
+    np.testing.assert_array_equal(costos, snapshot.df['costo'].to_numpy(dtype=float))
+
+
+def test_buscar_por_ids_conserva_el_orden_y_reporta_faltantes(servicio):
+    codigos = servicio.df['código'].drop_duplicates().tolist()
+    pedidos = [codigos[40], 1, codigos[3], codigos[25], 2]
+    resultado = servicio.buscar_por_ids(pedidos, ['código'])
+    assert [p['código'] for p in resultado['productos']] == [codigos[40], codigos[3], codigos[25]]
+    assert resultado['faltantes'] == [1, 2]
+
+
+def test_buscar_por_ids_de_imagenes():
+    servicio = ImagenService()
+    codigos = servicio.df['código'].drop_duplicates().tolist()
+    resultado = servicio.buscar_por_ids([codigos[5], 3, codigos[0]], ['código'])
+    encontrados = [i['código'] for i in resultado['imagenes']]
+    # Las imágenes de un mismo código van juntas, en el orden de la petición
+    assert encontrados == sorted(encontrados, key=[codigos[5], codigos[0]].index)
+    assert set(encontrados) == {codigos[5], codigos[0]}
+    assert resultado['faltantes'] == [3]
+
+
+@pytest.mark.parametrize('categoria', ['', ' ', 'x '])
+def test_categoria_demasiado_corta(servicio, categoria):
+    with pytest.raises(ValueError, match='al menos 2 caracteres'):
+        servicio.buscar_por_categoria(categoria)
@@ -0,0 +1,54 @@
+import io
+
+import pandas as pd
+import pytest
+
+from service.exportacion import pa
+from service.inventario_service import InventarioService
+
+
+@pytest.fixture(scope='module')
+def servicio():
+    return InventarioService()
+
+
+def _descargar(servicio, formato, campos=None, tamano_lote=128) -> bytes:
+    return b''.join(servicio.exportar(formato, campos, tamano_lote=tamano_lote))
+
+
+def test_csv_respeta_el_orden_de_campos(servicio):
+    contenido = _descargar(servicio, 'csv', ['precio_neto', 'código', 'descripción'])
+    lineas = contenido.decode('utf-8').splitlines()
+    assert lineas[0] == 'precio_neto,código,descripción'
+    # Un solo encabezado aunque salga en varios lotes
+    assert lineas.count(lineas[0]) == 1
+
+    df = servicio.snapshot.df
+    leido = pd.read_csv(io.BytesIO(contenido))
+    assert len(leido) == len(df)
+    assert leido['código'].tolist() == df['código'].tolist()
+
+
+@pytest.mark.skipif(pa is None, reason="pyarrow no está instalado")
+def test_arrow_ida_y_vuelta(servicio):
+    import pyarrow.ipc as ipc
+
+    tabla = ipc.open_stream(_descargar(servicio, 'arrow')).read_all()
+    pd.testing.assert_frame_equal(tabla.to_pandas(), servicio.snapshot.df, check_dtype=False)
+
+
+@pytest.mark.skipif(pa is None, reason="pyarrow no está instalado")
+def test_parquet_ida_y_vuelta(servicio):
+    import pyarrow.parquet as pq
+
+    campos = ['código', 'precio_neto']
+    tabla = pq.read_table(io.BytesIO(_descargar(servicio, 'parquet', campos)))
+    assert tabla.column_names == campos
+    pd.testing.assert_frame_equal(tabla.to_pandas(), servicio.snapshot.df[campos], check_dtype=False)
+
+
+@pytest.mark.skipif(pa is not None, reason="pyarrow está instalado")
+@pytest.mark.parametrize('formato', ['arrow', 'parquet'])
+def test_formatos_arrow_sin_pyarrow(servicio, formato):
+    with pytest.raises(ValueError, match='pyarrow'):
+        servicio.exportar(formato)
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from service.ia_service import IAService
+
+
+@pytest.fixture(scope='module')
+def servicio():
+    return IAService()
+
+
+@pytest.mark.parametrize('pregunta, extremo', [
+    ('¿Cuál es el precio máximo?', 'caro'),
+    ('¿Cuál es el precio MÍNIMO?', 'barato'),
+    ('¿Cuál es el producto más económico?', 'barato'),
+])
+def test_extremos_de_precio_con_tildes(servicio, pregunta, extremo):
+    respuesta = servicio.procesar_consulta(pregunta)
+    assert respuesta['intencion_detectada'] == 'precio'
+    assert f'más {extremo}' in respuesta['respuesta']
+
+
+@pytest.mark.parametrize('pregunta', ['xyz', '¿Cuántos productos hay?', 'productos más caros', 'productos entre 1000 y 5000'])
+def test_respuesta_serializable(servicio, pregunta):
+    respuesta = servicio.procesar_consulta(pregunta)
+    json.dumps(respuesta)
+    productos = respuesta['datos'].get('productos')
+    if productos is not None:
+        assert isinstance(productos, list) and all(isinstance(p, dict) for p in productos)
+
+
+def test_busqueda_sin_numeros_ni_palabras_de_intencion(servicio):
+    respuesta = servicio.procesar_consulta('productos entre 1000 y 5000')
+    assert respuesta['intencion_detectada'] == 'buscar'
+    assert 'termino_busqueda' not in respuesta['datos']
+    assert len(respuesta['datos']['productos']) == 10
@@ -0,0 +1,42 @@
+from collections import Counter
+
+from service.actualizaciones import Actualizacion
+from service.indices import registros
+from service.paginacion import paginar
+from tests.test_actualizaciones import _Worker
+
+
+def _filas(productos):
+    return Counter((p['código'], p['s._ent']) for p in productos)
+
+
+def test_recorrer_paginas_con_una_actualizacion_en_medio(directorio_datos):
+    worker = _Worker(directorio_datos)
+    snapshot = worker.registro.obtener('inventario')
+    codigos = sorted(snapshot.df['código'].tolist())
+    # Uno que ya se entregó y otro que todavía no
+    ya_leido, pendiente = codigos[10], codigos[-10]
+
+    recorridas, cursor, paginas = [], None, 0
+    try:
+        while True:
+            pagina = paginar(worker.registro.obtener('inventario'), cursor, 37)
+            recorridas.extend(pagina['datos'])
+            paginas += 1
+            if paginas == 3:
+                worker.escritor.aplicar([Actualizacion(ya_leido, valores={'s._ent': 999}),
+                                         Actualizacion(pendiente, valores={'s._ent': 998})])
+            cursor = pagina['siguiente_cursor']
+            if cursor is None:
+                break
+    finally:
+        worker.escritor.detener()
+
+    # Ni filas repetidas ni saltadas: cada código aparece tantas veces como en el Excel
+    assert [p['código'] for p in recorridas] == codigos
+
+    # Lo mismo que lista /inventario/ al terminar, salvo las filas leídas antes del cambio
+    listado = list(registros(worker.registro.obtener('inventario')).todos())
+    diferencia = _filas(listado) - _filas(recorridas)
+    assert set(diferencia) == {(ya_leido, 999)}
+    assert (pendiente, 998) in _filas(recorridas)
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from service.almacen_registros import codificar_json
+from service.producto_service import ProductoService, imagenes_por_codigo
+
+
+@pytest.fixture(scope='module')
+def servicio():
+    return ProductoService()
+
+
+def test_pagina_codifica_lo_mismo_que_sus_diccionarios(servicio):
+    pagina = servicio.listar_pagina(limite=200)
+    productos = pagina['datos']
+    assert len(productos) == 200
+    assert json.loads(codificar_json(productos)) == json.loads(json.dumps(list(productos)))
+    assert any(p['imagenes'] for p in productos)
+    assert any(not p['imagenes'] for p in productos)
+
+
+def test_imagenes_de_un_producto(servicio):
+    imagenes = servicio.imagen_service.df
+    codigo = int(imagenes['código'].iloc[0])
+    esperadas = imagenes.loc[imagenes['código'] == codigo, ['id_imagen', 'url']].to_dict('records')
+
+    productos = servicio.buscar_por_id(codigo)
+    assert productos
+    for producto in json.loads(codificar_json(productos)):
+        assert producto['código'] == codigo
+        assert producto['imagenes'] == esperadas
+
+
+def test_imagenes_por_codigo_es_del_snapshot_de_imagenes(servicio):
+    snapshot = servicio.imagen_service.snapshot
+    assert imagenes_por_codigo(snapshot) is snapshot.derivados_calculados()['imagenes_por_codigo']
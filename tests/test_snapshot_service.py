@@ -0,0 +1,47 @@
+import time
+
+import pandas as pd
+import pytest
+
+from service.indices import registros
+from service.inventario_service import _cargar_inventario
+from service.snapshot_service import RegistroSnapshots
+
+
+def _esperar(condicion, segundos: float = 10):
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite, "el vigilante no revisó el archivo a tiempo"
+        time.sleep(0.02)
+
+
+def _truncado(archivo):
+    with open(archivo, 'rb') as f:
+        contenido = f.read()
+    with open(archivo, 'wb') as f:
+        f.write(contenido[:len(contenido) // 2])
+
+
+def _sin_codigo(archivo):
+    pd.DataFrame({'Descripción': ['SIN CODIGO']}).to_excel(archivo, index=False)
+
+
+@pytest.mark.parametrize('danar', [_truncado, _sin_codigo])
+def test_excel_invalido_conserva_el_snapshot_anterior(directorio_datos, danar):
+    archivo = str(directorio_datos / 'inventario_vitalix_plus.xlsx')
+    registro = RegistroSnapshots()
+    registro.registrar('inventario', archivo, _cargar_inventario, 'el inventario')
+    anterior = registro.obtener('inventario')
+    filas = list(registros(anterior).todos())
+
+    vigilante = registro.iniciar_vigilancia(0.02)
+    try:
+        danar(archivo)
+        _esperar(lambda: 'inventario' in registro.errores_recarga)
+    finally:
+        vigilante.detener()
+
+    vigente = registro.obtener('inventario')
+    assert vigente.version == anterior.version
+    assert list(registros(vigente).todos()) == filas
+    assert registro.progreso()['inventario']['version'] == anterior.version